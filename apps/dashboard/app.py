@@ -1,10 +1,9 @@
 ﻿from __future__ import annotations
 
 import datetime as dt
-import json
 import re
 import sqlite3
-import unicodedata
+import sys
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
@@ -21,20 +20,83 @@ except ModuleNotFoundError:
 st.set_page_config(page_title="奥沢駅 SUUMOダッシュボード", layout="wide")
 
 BASE_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+from history_store import read_history  # noqa: E402
+from listing_aggregates import walk_bucket_label, walk_buckets  # noqa: E402
+from listing_events import EVENT_TYPES, has_events, run_events  # noqa: E402
+from listing_extract import DETAIL_COLUMNS, SQM_PER_TSUBO, normalize_text  # noqa: E402
+from listing_store import (  # noqa: E402
+    HEAVY_COLUMNS,
+    BrowseFilter,
+    browse_versions,
+    count_versions,
+    mean_pivot,
+    object_type,
+    tsubo_price_by_address,
+    tsubo_price_by_walk,
+    typed_frame,
+    with_detail_columns,
+    with_station,
+)
+from run_metrics import RUN_SCOPE, load_run_metrics  # noqa: E402
+
 LATEST_CSV = BASE_DIR / "data" / "processed" / "listings_latest.csv"
 SQLITE_PATH = BASE_DIR / "data" / "processed" / "suumo.db"
+HISTORY_PARQUET_DIR = BASE_DIR / "data" / "history_parquet"
+OKUSAWA3_RE = re.compile(r"奥沢\s*([3三])\s*(丁目|[-−ー])?")
 JST = ZoneInfo("Asia/Tokyo")
+# A run-wide timing this many times the median of the previous runs is flagged.
+REGRESSION_RATIO = 1.5
+REGRESSION_BASELINE_RUNS = 7
+# Sale pages give one row per card and rent pages more; fewer rows than this share of cards means a parser broke.
+MIN_ROWS_PER_CARD = 0.9
+STAGE_METRICS = ["crawl_s", "dedupe_s", "write_latest_csv_s", "write_history_csv_s", "write_parquet_s", "save_sqlite_s"]
+EVENT_LABELS = dict(zip(EVENT_TYPES, ["新規", "掲載終了", "価格変更"]))
+# History browser sort options (label -> ``BROWSE_SORTS`` key) and page sizes.
+BROWSE_SORT_LABELS = {"掲載終了日": "valid_to", "掲載開始日": "valid_from", "価格": "price_yen", "面積": "area_sqm"}
+BROWSE_PAGE_SIZES = [50, 100, 200]
+
+
+def file_version(path: Path) -> tuple[int, int]:
+    """(mtime_ns, size) of ``path``, or (0, 0) when it does not exist."""
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return (0, 0)
+    return (stat.st_mtime_ns, stat.st_size)
+
 
+def history_version() -> tuple:
+    # Writing, compacting or removing a Parquet file touches its partition directory.
+    partitions = [file_version(p) for p in HISTORY_PARQUET_DIR.glob("month=*/sub_category=*")]
+    return (file_version(SQLITE_PATH), len(partitions), max(partitions, default=(0, 0)))
 
-@st.cache_data(ttl=300)
-def load_latest() -> pd.DataFrame:
+
+# Cached loaders take the data version as their first argument: a scrape
+# changes the version and the next rerun reloads, otherwise nothing is re-read.
+@st.cache_data(max_entries=1)
+def load_latest(version: tuple[int, int]) -> pd.DataFrame:
+    """``listings_latest.csv`` in the shared listing dtypes, without ``HEAVY_COLUMNS`` (see ``load_latest_text``)."""
     if not LATEST_CSV.exists():
         return pd.DataFrame()
-    return pd.read_csv(LATEST_CSV, encoding="utf-8-sig")
+    header = pd.read_csv(LATEST_CSV, encoding="utf-8-sig", nrows=0).columns
+    # CSVs written before the typed detail columns or station existed get them filled in here;
+    # the detail columns are derived from detail_text, so only those files read it.
+    derive = any(c not in header for c in DETAIL_COLUMNS)
+    usecols = [c for c in header if c not in HEAVY_COLUMNS or (derive and c == "detail_text")]
+    df = with_station(with_detail_columns(pd.read_csv(LATEST_CSV, encoding="utf-8-sig", usecols=usecols)))
+    return typed_frame(df.drop(columns=HEAVY_COLUMNS, errors="ignore"))
+
 
+@st.cache_data(max_entries=2)
+def load_latest_text(version: tuple[int, int], column: str) -> pd.Series:
+    """One of ``HEAVY_COLUMNS`` of ``listings_latest.csv``, index-aligned with ``load_latest``."""
+    return pd.read_csv(LATEST_CSV, encoding="utf-8-sig", usecols=[column])[column]
 
-@st.cache_data(ttl=300)
-def load_runs() -> pd.DataFrame:
+
+@st.cache_data(max_entries=1)
+def load_runs(version: tuple) -> pd.DataFrame:
     if not SQLITE_PATH.exists():
         return pd.DataFrame()
     con = sqlite3.connect(SQLITE_PATH)
@@ -44,106 +106,263 @@ def load_runs() -> pd.DataFrame:
         con.close()
 
 
-@st.cache_data(ttl=300)
-def load_history_listings() -> pd.DataFrame:
+def has_tsubo_history(con: sqlite3.Connection) -> bool:
+    cols = {row[1] for row in con.execute("PRAGMA table_info(listings)").fetchall()}
+    return "unit_price_per_tsubo" in cols
+
+
+def load_parquet_history(sub_categories: list[str]) -> pd.DataFrame:
+    columns = ["run_date", "sub_category", "address", "walk_minutes", "unit_price_per_tsubo"]
+    df = read_history(HISTORY_PARQUET_DIR, columns=columns, sub_categories=sub_categories, typed=True)
+    return df.dropna(subset=["unit_price_per_tsubo"])
+
+
+def sum_count(df: pd.DataFrame, keys: list[str]) -> pd.DataFrame:
+    out = (
+        df.groupby(keys, as_index=False, sort=False, observed=True)
+        .agg(price_sum=("unit_price_per_tsubo", "sum"), price_count=("unit_price_per_tsubo", "count"))
+        .sort_values("run_date", kind="stable")
+    )
+    # The sums are small and go where the SQL path's plain columns go.
+    return out.astype({k: object for k in keys if isinstance(out[k].dtype, pd.CategoricalDtype)})
+
+
+@st.cache_data(max_entries=4)
+def load_tsubo_by_address(version: tuple, sub_categories: tuple[str, ...]) -> pd.DataFrame:
+    if SQLITE_PATH.exists():
+        con = sqlite3.connect(SQLITE_PATH)
+        try:
+            if not has_tsubo_history(con):
+                return pd.DataFrame()
+            return tsubo_price_by_address(con, sub_categories)
+        finally:
+            con.close()
+    if any(HISTORY_PARQUET_DIR.glob("month=*")):
+        return sum_count(load_parquet_history(list(sub_categories)), ["run_date", "sub_category", "address"])
+    return pd.DataFrame()
+
+
+@st.cache_data(max_entries=4)
+def load_tsubo_by_walk(version: tuple, sub_category: str) -> pd.DataFrame:
+    # LIKE narrows to 奥沢 addresses in SQL; OKUSAWA3_RE picks 3-chome on the normalized text.
+    if SQLITE_PATH.exists():
+        con = sqlite3.connect(SQLITE_PATH)
+        try:
+            if not has_tsubo_history(con):
+                return pd.DataFrame()
+            return tsubo_price_by_walk(con, sub_category, "%奥沢%")
+        finally:
+            con.close()
+    if any(HISTORY_PARQUET_DIR.glob("month=*")):
+        df = load_parquet_history([sub_category])
+        df = df[df["address"].str.contains("奥沢", regex=False, na=False)].dropna(subset=["walk_minutes"])
+        df = df.assign(walk_bucket=walk_buckets(df["walk_minutes"]))
+        return sum_count(df, ["run_date", "address", "walk_bucket"])
+    return pd.DataFrame()
+
+
+@st.cache_data(max_entries=4)
+def load_events(version: tuple, run_date: str) -> pd.DataFrame | None:
+    """Events of ``run_date``; ``None`` for a database written before the current ``listing_events`` layout."""
     if not SQLITE_PATH.exists():
-        return pd.DataFrame()
+        return None
     con = sqlite3.connect(SQLITE_PATH)
     try:
-        cols = {row[1] for row in con.execute("PRAGMA table_info(listings)").fetchall()}
-        if "unit_price_per_tsubo" in cols:
-            return pd.read_sql_query(
-                """
-                SELECT run_date, sub_category, address, price_text, price_yen, area_sqm, area_tsubo,
-                       detail_text,
-                       unit_price_per_sqm, unit_price_per_tsubo
-                FROM listings
-                ORDER BY run_date
-                """,
-                con,
-            )
-        if "price_yen" in cols:
-            return pd.read_sql_query(
-                """
-                SELECT run_date, sub_category, address, price_text, price_yen,
-                       detail_text,
-                       NULL as area_sqm, NULL as area_tsubo,
-                       NULL as unit_price_per_sqm, NULL as unit_price_per_tsubo
-                FROM listings
-                ORDER BY run_date
-                """,
-                con,
-            )
-        return pd.read_sql_query(
-            """
-            SELECT run_date, sub_category, address, price_text, NULL as price_yen,
-                   detail_text,
-                   NULL as area_sqm, NULL as area_tsubo,
-                   NULL as unit_price_per_sqm, NULL as unit_price_per_tsubo
-            FROM listings
-            ORDER BY run_date
-            """,
-            con,
-        )
+        if not has_events(con):
+            return None
+        return run_events(con, run_date)
     finally:
         con.close()
 
 
-def detail_value(detail_text: str, key: str) -> str:
-    if not isinstance(detail_text, str) or not detail_text:
-        return ""
-    if not detail_text.startswith("{"):
-        return ""
+@st.cache_data(max_entries=1)
+def load_browse_options(version: tuple) -> tuple[list[str], str | None, str | None]:
+    """sub_categories and the first/last run_date the history browser offers."""
+    if not SQLITE_PATH.exists():
+        return [], None, None
+    con = sqlite3.connect(SQLITE_PATH)
     try:
-        obj = json.loads(detail_text)
-    except Exception:
-        return ""
-    return str(obj.get(key, ""))
+        if object_type(con, "listing_versions") is None:
+            return [], None, None
+        subs = [row[0] for row in con.execute("SELECT DISTINCT sub_category FROM listing_dim ORDER BY sub_category")]
+        first, last = con.execute("SELECT MIN(run_date), MAX(run_date) FROM runs").fetchone()
+        return subs, first, last
+    finally:
+        con.close()
 
 
-def normalize_text(text: str) -> str:
-    text = unicodedata.normalize("NFKC", text or "")
-    return re.sub(r"\s+", " ", text).strip()
+# The count only changes with the filter; paging and sorting re-run just the page query.
+@st.cache_data(max_entries=16)
+def load_browse_count(version: tuple, flt: BrowseFilter) -> int:
+    con = sqlite3.connect(SQLITE_PATH)
+    try:
+        return count_versions(con, flt)
+    finally:
+        con.close()
 
 
-def short_address_label(address: str) -> str:
-    a = normalize_text(address)
-    if a.startswith("東京都"):
-        return a[len("東京都") :]
-    return a
+@st.cache_data(max_entries=16)
+def load_browse_page(
+    version: tuple, flt: BrowseFilter, sort: str, descending: bool, page: int, page_size: int
+) -> pd.DataFrame:
+    con = sqlite3.connect(SQLITE_PATH)
+    try:
+        return browse_versions(con, flt, sort, descending, page, page_size)
+    finally:
+        con.close()
 
 
-def extract_area_sqm(text: str) -> float | None:
-    t = normalize_text(text).replace(",", "")
-    if not t:
-        return None
-    vals = [float(x) for x in re.findall(r"(\d+(?:\.\d+)?)\s*(?:m\s*2|m²|㎡)", t)]
-    if vals:
-        return float(sum(vals) / len(vals))
-    return None
+@st.cache_data(max_entries=1)
+def build_detail_table(version: tuple[int, int]) -> pd.DataFrame:
+    latest = load_latest(version)
+    detail_view = latest[latest["sub_category"].isin(["土地", "戸建て(新築)", "戸建て(中古)"])].copy()
+    if detail_view.empty:
+        return detail_view
+    for c in ["area_sqm", "area_tsubo", "unit_price_per_sqm", "unit_price_per_tsubo", "price_yen"]:
+        if c not in detail_view.columns:
+            detail_view[c] = None
 
+    detail_view["detail_url"] = load_latest_text(version, "detail_url")
+    detail_view["沿線・駅"] = detail_view["station_text"].astype(object).fillna("")
+    detail_view["徒歩(分)"] = pd.to_numeric(detail_view["walk_minutes"], errors="coerce")
+    detail_view["土地面積(m2)"] = pd.to_numeric(detail_view["land_area_sqm"], errors="coerce").round(2)
+    detail_view["建物面積(m2)"] = pd.to_numeric(detail_view["building_area_sqm"], errors="coerce").round(2)
+    detail_view["間取り"] = detail_view["layout_text"].astype(object).fillna("")
+    detail_view["建ぺい率(%)"] = pd.to_numeric(detail_view["coverage_ratio"], errors="coerce")
+    detail_view["容積率(%)"] = pd.to_numeric(detail_view["floor_area_ratio"], errors="coerce")
 
-def extract_area_tsubo(text: str) -> float | None:
-    t = normalize_text(text).replace(",", "")
-    if not t:
-        return None
-    vals = [float(x) for x in re.findall(r"(\d+(?:\.\d+)?)\s*坪", t)]
-    if vals:
-        return float(sum(vals) / len(vals))
-    sqm = extract_area_sqm(t)
-    if sqm is None:
-        return None
-    return sqm / 3.305785
+    area_sqm_raw = pd.to_numeric(detail_view["area_sqm"], errors="coerce")
+    area_tsubo_raw = pd.to_numeric(detail_view["area_tsubo"], errors="coerce")
+    area_sqm_fb = detail_view["土地面積(m2)"].fillna(detail_view["建物面積(m2)"])
+    area_tsubo_fb = area_sqm_fb / SQM_PER_TSUBO
 
+    detail_view["面積(m2)"] = area_sqm_raw.fillna(area_sqm_fb).round(2)
+    detail_view["面積(坪)"] = area_tsubo_raw.fillna(area_tsubo_fb).round(2)
 
-def extract_walk_minutes(text: str) -> float | None:
-    t = normalize_text(text)
-    if not t:
-        return None
-    vals = [int(x) for x in re.findall(r"徒歩\s*(\d+)\s*分", t)]
-    if not vals:
-        return None
-    return float(min(vals))
+    price_yen = pd.to_numeric(detail_view["price_yen"], errors="coerce")
+    unit_sqm_raw = pd.to_numeric(detail_view["unit_price_per_sqm"], errors="coerce")
+    unit_tsubo_raw = pd.to_numeric(detail_view["unit_price_per_tsubo"], errors="coerce")
+    unit_sqm_fb = price_yen / detail_view["面積(m2)"]
+    unit_tsubo_fb = price_yen / detail_view["面積(坪)"]
+
+    detail_view["平米単価(円/m2)"] = unit_sqm_raw.fillna(unit_sqm_fb).round(0)
+    detail_view["坪単価(円/坪)"] = unit_tsubo_raw.fillna(unit_tsubo_fb).round(0)
+
+    detail_table = detail_view[
+        [
+            "station",
+            "sub_category",
+            "title",
+            "price_text",
+            "address",
+            "沿線・駅",
+            "徒歩(分)",
+            "土地面積(m2)",
+            "建物面積(m2)",
+            "面積(m2)",
+            "面積(坪)",
+            "平米単価(円/m2)",
+            "坪単価(円/坪)",
+            "間取り",
+            "建ぺい率(%)",
+            "容積率(%)",
+            "detail_url",
+        ]
+    ].copy()
+    return detail_table
+
+
+@st.cache_data(max_entries=1)
+def build_tsubo_charts(version: tuple, target_categories: tuple[str, ...]) -> list[tuple[str, pd.DataFrame | None]]:
+    """(subheader, pivot) per chart; ``None`` marks a category without data."""
+    price_by_address = load_tsubo_by_address(version, target_categories)
+    if price_by_address.empty:
+        return []
+    runs = load_runs(version)
+    price_by_address = price_by_address.copy()
+    price_by_address["run_date"] = pd.to_datetime(price_by_address["run_date"])
+    if not runs.empty and "run_date" in runs.columns:
+        all_dates = pd.to_datetime(runs["run_date"].dropna().unique())
+    else:
+        all_dates = price_by_address["run_date"].dropna().unique()
+    all_dates = pd.DatetimeIndex(sorted(all_dates))
+
+    label_map = {
+        "土地": "土地",
+        "戸建て(中古)": "戸建て（中古）",
+        "戸建て(新築)": "戸建て（新築）",
+    }
+    charts: list[tuple[str, pd.DataFrame | None]] = []
+    for cat in target_categories:
+        cat_df = price_by_address[price_by_address["sub_category"] == cat].copy()
+        label = label_map.get(cat, cat)
+        if cat_df.empty:
+            charts.append((label, None))
+            continue
+        cat_df["address_label"] = cat_df["address"].map(short_address_label)
+        charts.append((label, mean_pivot(cat_df, "address_label", all_dates)))
+
+    # Okusawa 3-chome only: hue = walk-minute bucket
+    if not cat_df.empty:
+        okusawa3 = load_tsubo_by_walk(version, cat).copy()
+        if not okusawa3.empty:
+            okusawa3 = okusawa3[okusawa3["address"].fillna("").map(lambda x: bool(OKUSAWA3_RE.search(normalize_text(x))))]
+        if not okusawa3.empty:
+            okusawa3["run_date"] = pd.to_datetime(okusawa3["run_date"])
+            # The chart legend sorts labels as text; pad one-digit starts so it lists buckets by distance.
+            okusawa3["walk_label"] = okusawa3["walk_bucket"].map(lambda b: f"徒歩{' ' * (b < 10)}{walk_bucket_label(int(b))}")
+            charts.append((f"{label}（奥沢3丁目・徒歩分別）", mean_pivot(okusawa3, "walk_label", all_dates)))
+    return charts
+
+
+@st.cache_data(max_entries=1)
+def load_metrics(version: tuple) -> pd.DataFrame:
+    if not SQLITE_PATH.exists():
+        return pd.DataFrame()
+    con = sqlite3.connect(SQLITE_PATH)
+    try:
+        return load_run_metrics(con)
+    finally:
+        con.close()
+
+
+def metric_pivot(metrics: pd.DataFrame, scope: str) -> pd.DataFrame:
+    """run_date x metric table of one scope."""
+    rows = metrics[metrics["scope"] == scope]
+    return rows.pivot_table(index="run_date", columns="metric", values="value", aggfunc="last").sort_index()
+
+
+def metric_alerts(metrics: pd.DataFrame) -> list[str]:
+    """Warnings for the latest run: parser breakage, HTTP errors and slowdowns against earlier runs."""
+    alerts: list[str] = []
+    latest_date = metrics["run_date"].max()
+    latest = metrics[metrics["run_date"] == latest_date]
+    for scope, rows in latest[latest["scope"] != RUN_SCOPE].groupby("scope", sort=True):
+        values = dict(zip(rows["metric"], rows["value"]))
+        fetched, cards, parsed_rows = values.get("pages_fetched", 0), values.get("cards", 0), values.get("rows", 0)
+        if fetched and not cards:
+            alerts.append(f"{scope}: 取得した{int(fetched)}ページに物件カードがありません (セレクタ変更の可能性)")
+        elif cards and parsed_rows < cards * MIN_ROWS_PER_CARD:
+            alerts.append(f"{scope}: 物件カード{int(cards)}件に対し抽出行が{int(parsed_rows)}件です")
+    run = metric_pivot(metrics, RUN_SCOPE)
+    errors = run.get("fetch_errors", pd.Series(dtype="float64")).get(latest_date, 0)
+    if errors:
+        alerts.append(f"HTTPエラーが{int(errors)}件ありました")
+    baseline = run.loc[run.index < latest_date].tail(REGRESSION_BASELINE_RUNS).median()
+    for metric in ["total_s", "fetch_p90_ms", *STAGE_METRICS]:
+        if metric not in run.columns or pd.isna(baseline.get(metric)) or not baseline[metric]:
+            continue
+        value = run.at[latest_date, metric]
+        if pd.notna(value) and value > baseline[metric] * REGRESSION_RATIO:
+            alerts.append(f"{metric} が直近{REGRESSION_BASELINE_RUNS}回の中央値の{value / baseline[metric]:.1f}倍です")
+    return alerts
+
+
+def short_address_label(address: str) -> str:
+    a = normalize_text(address)
+    if a.startswith("東京都"):
+        return a[len("東京都") :]
+    return a
 
 
 def format_last_fetched(latest: pd.DataFrame) -> str:
@@ -169,8 +388,10 @@ def format_last_fetched(latest: pd.DataFrame) -> str:
 st.title("奥沢駅 SUUMOダッシュボード")
 st.caption("対象: 賃貸・戸建て(新築/中古)・土地")
 
-latest = load_latest()
-runs = load_runs()
+latest_version = file_version(LATEST_CSV)
+data_version = history_version()
+latest = load_latest(latest_version)
+runs = load_runs(data_version)
 
 if latest.empty:
     st.warning("データがありません。先に `python apps/scraper/suumo_scraper.py` を実行してください。")
@@ -184,10 +405,10 @@ c1, c2 = st.columns([1, 2])
 with c1:
     st.subheader("カテゴリ件数")
     summary = (
-        latest.groupby("sub_category", as_index=False)
+        latest.groupby(["station", "sub_category"], as_index=False, sort=False, observed=True)
         .size()
-        .sort_values("size", ascending=False)
-        .rename(columns={"size": "件数"})
+        .sort_values("size", ascending=False, kind="stable")
+        .rename(columns={"station": "駅", "size": "件数"})
     )
     st.dataframe(summary, use_container_width=True, hide_index=True)
 
@@ -198,68 +419,68 @@ with c2:
     else:
         st.dataframe(runs, use_container_width=True, hide_index=True)
 
+st.subheader("新着・掲載終了・価格変更")
+# The first run has no previous run to compare with.
+event_dates = [] if runs.empty else runs["run_date"].tolist()[:-1]
+if not event_dates:
+    st.info("比較できる前回の実行がありません。")
+else:
+    ecol0, ecol1 = st.columns([1, 3])
+    with ecol0:
+        event_date = st.selectbox("実行日", options=event_dates, key="event_date")
+    events = load_events(data_version, event_date)
+    if events is None:
+        st.info("イベントはまだありません。次回スクレイプ以降に表示されます。")
+    elif events.empty:
+        st.info("前回の実行から変化はありません。")
+    else:
+        counts = events["event"].value_counts()
+        with ecol1:
+            st.caption(f"前回の実行 ({events['prev_run_date'].iloc[0]}) との比較")
+            for col, (event, label) in zip(st.columns(len(EVENT_LABELS)), EVENT_LABELS.items()):
+                col.metric(label, int(counts.get(event, 0)))
+        ecol2, ecol3 = st.columns(2)
+        with ecol2:
+            selected_events = st.multiselect(
+                "表示するイベント",
+                options=EVENT_TYPES,
+                default=EVENT_TYPES,
+                format_func=EVENT_LABELS.get,
+                key="event_types",
+            )
+        event_subs = sorted(events["sub_category"].unique().tolist())
+        with ecol3:
+            selected_event_subs = st.multiselect(
+                "表示する sub_category", options=event_subs, default=event_subs, key="event_subs"
+            )
+        feed = events[events["event"].isin(selected_events) & events["sub_category"].isin(selected_event_subs)].copy()
+        if feed.empty:
+            st.info("選択条件に一致するデータがありません。")
+        else:
+            feed["event"] = feed["event"].map(EVENT_LABELS)
+            feed["価格差(円)"] = feed["price_yen"] - feed["prev_price_yen"]
+            feed = feed.rename(columns={"prev_price_text": "前回価格", "price_text": "価格"})
+            st.dataframe(
+                feed[["event", "sub_category", "title", "address", "station", "前回価格", "価格", "価格差(円)", "detail_url"]],
+                use_container_width=True,
+                hide_index=True,
+                column_config={"detail_url": st.column_config.LinkColumn("detail_url")},
+            )
+
 st.subheader("土地・戸建て 詳細")
-detail_view = latest[latest["sub_category"].isin(["土地", "戸建て(新築)", "戸建て(中古)"])].copy()
-if detail_view.empty:
+detail_table = build_detail_table(latest_version)
+if detail_table.empty:
     st.info("土地・戸建てのデータがありません。")
 else:
-    for c in ["area_sqm", "area_tsubo", "unit_price_per_sqm", "unit_price_per_tsubo", "price_yen"]:
-        if c not in detail_view.columns:
-            detail_view[c] = None
-
-    detail_view["沿線・駅"] = detail_view["detail_text"].map(lambda x: detail_value(x, "沿線・駅"))
-    detail_view["土地面積"] = detail_view["detail_text"].map(lambda x: detail_value(x, "土地面積"))
-    detail_view["建物面積"] = detail_view["detail_text"].map(lambda x: detail_value(x, "建物面積"))
-    detail_view["専有面積"] = detail_view["detail_text"].map(lambda x: detail_value(x, "専有面積"))
-    detail_view["間取り"] = detail_view["detail_text"].map(lambda x: detail_value(x, "間取り"))
-    detail_view["建ぺい率・容積率"] = detail_view["detail_text"].map(lambda x: detail_value(x, "建ぺい率・容積率"))
-
-    area_text_fallback = (
-        detail_view["土地面積"].fillna("")
-        + " "
-        + detail_view["建物面積"].fillna("")
-        + " "
-        + detail_view["専有面積"].fillna("")
-    )
-
-    area_sqm_raw = pd.to_numeric(detail_view["area_sqm"], errors="coerce")
-    area_tsubo_raw = pd.to_numeric(detail_view["area_tsubo"], errors="coerce")
-    area_sqm_fb = area_text_fallback.map(extract_area_sqm)
-    area_tsubo_fb = area_text_fallback.map(extract_area_tsubo)
-
-    detail_view["面積(m2)"] = area_sqm_raw.fillna(area_sqm_fb).round(2)
-    detail_view["面積(坪)"] = area_tsubo_raw.fillna(area_tsubo_fb).round(2)
-
-    price_yen = pd.to_numeric(detail_view["price_yen"], errors="coerce")
-    unit_sqm_raw = pd.to_numeric(detail_view["unit_price_per_sqm"], errors="coerce")
-    unit_tsubo_raw = pd.to_numeric(detail_view["unit_price_per_tsubo"], errors="coerce")
-    unit_sqm_fb = price_yen / detail_view["面積(m2)"]
-    unit_tsubo_fb = price_yen / detail_view["面積(坪)"]
-
-    detail_view["平米単価(円/m2)"] = unit_sqm_raw.fillna(unit_sqm_fb).round(0)
-    detail_view["坪単価(円/坪)"] = unit_tsubo_raw.fillna(unit_tsubo_fb).round(0)
-
-    detail_table = detail_view[
-        [
-            "sub_category",
-            "title",
-            "price_text",
-            "address",
-            "沿線・駅",
-            "土地面積",
-            "建物面積",
-            "面積(m2)",
-            "面積(坪)",
-            "平米単価(円/m2)",
-            "坪単価(円/坪)",
-            "間取り",
-            "建ぺい率・容積率",
-            "detail_url",
-        ]
-    ].copy()
-
     # Option filters from actual values in records.
-    fcol1, fcol2 = st.columns(2)
+    fcol0, fcol1, fcol2 = st.columns([1, 1, 2])
+    station_options = detail_table["station"].dropna().unique().tolist()
+    with fcol0:
+        selected_stations = st.multiselect(
+            "表示する駅",
+            options=station_options,
+            default=station_options,
+        )
     sub_options = sorted(detail_table["sub_category"].dropna().unique().tolist())
     with fcol1:
         selected_sub_categories = st.multiselect(
@@ -268,7 +489,7 @@ else:
             default=sub_options,
         )
 
-    filtered_table = detail_table.copy()
+    filtered_table = detail_table[detail_table["station"].isin(selected_stations)].copy()
     if selected_sub_categories:
         filtered_table = filtered_table[filtered_table["sub_category"].isin(selected_sub_categories)]
     else:
@@ -293,6 +514,7 @@ else:
     elif AGGRID_AVAILABLE:
         gb = GridOptionsBuilder.from_dataframe(filtered_table)
         gb.configure_default_column(filter=True, floatingFilter=True, sortable=True, resizable=True)
+        gb.configure_column("station", filter="agSetColumnFilter")
         gb.configure_column("sub_category", filter="agSetColumnFilter")
         gb.configure_column("address", filter="agSetColumnFilter")
         grid_options = gb.build()
@@ -309,64 +531,109 @@ else:
         st.warning("`st_aggrid` が未インストールです。`pip install streamlit-aggrid` 後に再起動してください。")
         st.dataframe(filtered_table, use_container_width=True, hide_index=True)
 
-hist = load_history_listings()
-if hist.empty:
-    st.info("時系列データがありません。")
+st.subheader("履歴ブラウザ")
+browse_subs, first_run, last_run = load_browse_options(data_version)
+if not browse_subs:
+    st.info("履歴DBがありません。")
 else:
-    target_categories = ["土地", "戸建て(中古)", "戸建て(新築)"]
-    hist = hist[hist["sub_category"].isin(target_categories)].copy()
-    hist = hist.dropna(subset=["unit_price_per_tsubo"])
-    if hist.empty:
+    st.caption("suumo.db の全履歴を、属性が変わらず掲載された期間 (掲載開始日〜掲載終了日) ごとに1行で表示します。")
+    bcol0, bcol1, bcol2 = st.columns([2, 2, 2])
+    with bcol0:
+        browse_selected = st.multiselect("sub_category", options=browse_subs, default=browse_subs, key="browse_subs")
+    with bcol1:
+        browse_address = st.text_input("住所 (部分一致)", key="browse_address")
+    with bcol2:
+        first_date, last_date = dt.date.fromisoformat(first_run), dt.date.fromisoformat(last_run)
+        browse_dates = st.date_input(
+            "期間", value=(first_date, last_date), min_value=first_date, max_value=last_date, key="browse_dates"
+        )
+    bcol3, bcol4, bcol5, bcol6 = st.columns(4)
+    price_min = bcol3.number_input("価格 下限 (万円)", min_value=0.0, value=None, step=100.0, key="browse_price_min")
+    price_max = bcol4.number_input("価格 上限 (万円)", min_value=0.0, value=None, step=100.0, key="browse_price_max")
+    area_min = bcol5.number_input("面積 下限 (m2)", min_value=0.0, value=None, step=10.0, key="browse_area_min")
+    area_max = bcol6.number_input("面積 上限 (m2)", min_value=0.0, value=None, step=10.0, key="browse_area_max")
+    bcol7, bcol8, bcol9 = st.columns([2, 1, 1])
+    with bcol7:
+        sort_label = st.selectbox("並び順", options=list(BROWSE_SORT_LABELS), key="browse_sort")
+    with bcol8:
+        descending = st.checkbox("降順", value=True, key="browse_desc")
+    with bcol9:
+        page_size = st.selectbox("表示件数", options=BROWSE_PAGE_SIZES, index=1, key="browse_page_size")
+
+    # date_input returns a single date while the end of the range is being picked.
+    dates = tuple(browse_dates) if isinstance(browse_dates, (tuple, list)) else (browse_dates,)
+    browse_filter = BrowseFilter(
+        sub_categories=tuple(browse_selected),
+        address=normalize_text(browse_address),
+        price_min=None if price_min is None else price_min * 10_000,
+        price_max=None if price_max is None else price_max * 10_000,
+        area_min=area_min,
+        area_max=area_max,
+        start=dates[0].isoformat() if dates else None,
+        end=dates[1].isoformat() if len(dates) > 1 else None,
+    )
+    sort = BROWSE_SORT_LABELS[sort_label]
+    total = load_browse_count(data_version, browse_filter) if browse_selected else 0
+    pages = max(1, -(-total // page_size))
+    # Any change other than the page number starts again from the first page.
+    browse_state = (browse_filter, sort, descending, page_size)
+    if st.session_state.get("browse_state") != browse_state or st.session_state.get("browse_page", 1) > pages:
+        st.session_state["browse_state"] = browse_state
+        st.session_state["browse_page"] = 1
+    if total == 0:
+        st.info("選択条件に一致するデータがありません。")
+    else:
+        page = st.number_input("ページ", min_value=1, max_value=pages, step=1, key="browse_page")
+        page_df = load_browse_page(data_version, browse_filter, sort, descending, int(page), page_size)
+        first_row = (int(page) - 1) * page_size + 1
+        st.caption(f"{total:,} 件中 {first_row:,}〜{first_row + len(page_df) - 1:,} 件目 ({int(page)} / {pages} ページ)")
+        st.dataframe(
+            page_df,
+            use_container_width=True,
+            hide_index=True,
+            column_config={"detail_url": st.column_config.LinkColumn("detail_url")},
+        )
+
+target_categories = ("土地", "戸建て(中古)", "戸建て(新築)")
+charts = build_tsubo_charts(data_version, target_categories)
+if not charts:
+    if runs.empty:
+        st.info("時系列データがありません。")
+    else:
         st.info("坪単価データがありません。次回スクレイプ以降に表示されます。")
+for title, pivot in charts:
+    st.subheader(title)
+    if pivot is None:
+        st.info("データがありません。")
     else:
-        hist["run_date"] = pd.to_datetime(hist["run_date"])
-        if not runs.empty and "run_date" in runs.columns:
-            all_dates = pd.to_datetime(runs["run_date"].dropna().unique())
-        else:
-            all_dates = hist["run_date"].dropna().unique()
-        all_dates = pd.DatetimeIndex(sorted(all_dates))
-
-        for cat in target_categories:
-            cat_df = hist[hist["sub_category"] == cat].copy()
-            label_map = {
-                "土地": "土地",
-                "戸建て(中古)": "戸建て（中古）",
-                "戸建て(新築)": "戸建て（新築）",
-            }
-            label = label_map.get(cat, cat)
-            if cat_df.empty:
-                st.subheader(label)
-                st.info("データがありません。")
-                continue
-
-            cat_df["address_label"] = cat_df["address"].map(short_address_label)
-            mean_df = (
-                cat_df.groupby(["run_date", "address_label"], as_index=False)["unit_price_per_tsubo"]
-                .mean()
-                .rename(columns={"unit_price_per_tsubo": "avg_tsubo_price_yen"})
-            )
-            pivot = mean_df.pivot(index="run_date", columns="address_label", values="avg_tsubo_price_yen")
-            pivot = pivot.reindex(index=all_dates).sort_index()
-
-            st.subheader(label)
-            st.line_chart(pivot)
-        # Okusawa 3-chome only: hue = walk minutes
-        okusawa3 = cat_df[
-            cat_df["address"]
-            .fillna("")
-            .map(lambda x: bool(re.search(r"奥沢\s*([3三])\s*(丁目|[-−ー])?", normalize_text(x))))
-        ].copy()
-        okusawa3["station_text"] = okusawa3["detail_text"].map(lambda x: detail_value(x, "沿線・駅"))
-        okusawa3["walk_minutes"] = okusawa3["station_text"].map(extract_walk_minutes)
-        okusawa3 = okusawa3.dropna(subset=["walk_minutes"])
-        if not okusawa3.empty:
-            wm_df = (
-                okusawa3.groupby(["run_date", "walk_minutes"], as_index=False)["unit_price_per_tsubo"]
-                .mean()
-                .rename(columns={"unit_price_per_tsubo": "avg_tsubo_price_yen"})
-            )
-            wm_df["walk_label"] = wm_df["walk_minutes"].map(lambda x: f"徒歩{int(x)}分")
-            wm_pivot = wm_df.pivot(index="run_date", columns="walk_label", values="avg_tsubo_price_yen")
-            wm_pivot = wm_pivot.reindex(index=all_dates).sort_index()
-            st.subheader(f"{label}（奥沢3丁目・徒歩分別）")
-            st.line_chart(wm_pivot)
+        st.line_chart(pivot)
+
+st.subheader("実行メトリクス")
+run_metrics = load_metrics(data_version)
+if run_metrics.empty:
+    st.info("実行メトリクスはまだありません。次回スクレイプ以降に表示されます。")
+else:
+    run_table = metric_pivot(run_metrics, RUN_SCOPE)
+    last_run = run_table.iloc[-1]
+    st.caption(f"最新の実行: {run_table.index[-1]}")
+    m1, m2, m3, m4, m5 = st.columns(5)
+    m1.metric("実行時間 (秒)", f"{last_run.get('total_s', 0):.1f}")
+    m2.metric("取得レイテンシ p90 (ms)", f"{last_run.get('fetch_p90_ms', 0):.0f}")
+    m3.metric("取得量 (MB)", f"{last_run.get('fetch_bytes', 0) / 1e6:.2f}")
+    m4.metric("HTTPエラー", int(last_run.get("fetch_errors", 0)))
+    m5.metric("解析 p50 (ms/ページ)", f"{last_run.get('parse_p50_ms', 0):.0f}")
+    for alert in metric_alerts(run_metrics):
+        st.warning(alert)
+
+    latest_jobs = run_metrics[(run_metrics["run_date"] == run_table.index[-1]) & (run_metrics["scope"] != RUN_SCOPE)]
+    job_table = latest_jobs.pivot_table(index="scope", columns="metric", values="value", aggfunc="last")
+    job_columns = ["pages_fetched", "pages_resumed", "cards", "rows", "parse_p50_ms", "parse_max_ms"]
+    st.dataframe(job_table.reindex(columns=job_columns), use_container_width=True)
+
+    mc1, mc2 = st.columns(2)
+    with mc1:
+        st.caption("処理段階ごとの時間 (秒)")
+        st.line_chart(run_table.reindex(columns=STAGE_METRICS).dropna(axis=1, how="all"))
+    with mc2:
+        st.caption("取得レイテンシ (ms)")
+        st.line_chart(run_table.reindex(columns=["fetch_p50_ms", "fetch_p90_ms", "fetch_p99_ms"]).dropna(axis=1, how="all"))
@@ -0,0 +1,269 @@
+﻿"""Columnar history store: Parquet files partitioned by month and sub_category.
+
+Layout under the store root (``data/history_parquet``)::
+
+    month=2026-07/sub_category=<url-quoted>/part-20260701.parquet   one run
+    month=2026-06/sub_category=<url-quoted>/compacted.parquet       merged runs
+
+Each daily run adds one ``part-*.parquet`` per sub_category; ``compact``
+folds a partition's parts into a single ``compacted.parquet`` (the scraper
+does this for the previous months on every run). Readers go
+through ``read_history``, which lets pyarrow skip whole partitions
+(month/sub_category filters) and unused columns.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+from pathlib import Path
+from typing import Iterable
+from urllib.parse import quote
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from listing_store import (
+    BACKFILLED_COLUMNS,
+    CATEGORY_COLUMNS,
+    REAL_COLUMNS,
+    read_history_csv,
+    typed_frame,
+    with_detail_columns,
+    with_station,
+)
+
+PARTITION_COLUMNS = ["month", "sub_category"]
+PARTITION_SCHEMA = pa.schema([("month", pa.string()), ("sub_category", pa.string())])
+COMPACTED_NAME = "compacted.parquet"
+
+
+def _file_schema(columns: list[str]) -> pa.Schema:
+    fields = []
+    for c in columns:
+        if c in PARTITION_COLUMNS:
+            continue
+        fields.append(pa.field(c, pa.float64() if c in REAL_COLUMNS else pa.string()))
+    return pa.schema(fields)
+
+
+def partition_dir(root: Path, month: str, sub_category: str) -> Path:
+    return root / f"month={month}" / f"sub_category={quote(sub_category, safe='')}"
+
+
+def _to_table(df: pd.DataFrame) -> pa.Table:
+    cols = [c for c in df.columns if c not in PARTITION_COLUMNS]
+    frame = df[cols].copy()
+    for c in cols:
+        if c in REAL_COLUMNS:
+            frame[c] = pd.to_numeric(frame[c], errors="coerce")
+        else:
+            values = frame[c].astype(object)
+            frame[c] = values.where(values.isna(), values.astype(str)).where(values.notna(), None)
+    return pa.Table.from_pandas(frame, schema=_file_schema(cols), preserve_index=False)
+
+
+def _write_atomic(table: pa.Table, path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(table, tmp, compression="zstd")
+    tmp.replace(path)
+
+
+def _drop_run(part_dir: Path, run_date: str) -> None:
+    (part_dir / f"part-{run_date.replace('-', '')}.parquet").unlink(missing_ok=True)
+    compacted = part_dir / COMPACTED_NAME
+    if compacted.exists():
+        table = pq.read_table(compacted)
+        mask = pc.not_equal(table["run_date"], run_date)
+        kept = table.filter(mask)
+        if kept.num_rows != table.num_rows:
+            if kept.num_rows:
+                _write_atomic(kept, compacted)
+            else:
+                compacted.unlink()
+
+
+def write_run(df: pd.DataFrame, root: Path, run_date: str) -> int:
+    """Store one run's listing frame, replacing any earlier copy of that run."""
+    return write_run_chunks([df], root, run_date)
+
+
+def write_run_chunks(chunks: Iterable[pd.DataFrame], root: Path, run_date: str) -> int:
+    """Like ``write_run`` for a run delivered in chunks; each partition file grows one row group per chunk.
+
+    Returns the number of partition files written.
+    """
+    month = run_date[:7]
+    month_dir = root / f"month={month}"
+    if month_dir.exists():
+        for part_dir in month_dir.iterdir():
+            if part_dir.is_dir():
+                _drop_run(part_dir, run_date)
+    writers: dict[str, tuple[pq.ParquetWriter, Path, Path]] = {}
+    try:
+        for chunk in chunks:
+            for sub_category, group in chunk.groupby("sub_category", sort=True):
+                table = _to_table(group)
+                if sub_category not in writers:
+                    path = partition_dir(root, month, str(sub_category)) / f"part-{run_date.replace('-', '')}.parquet"
+                    path.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = path.with_name(path.name + ".tmp")
+                    writers[sub_category] = (pq.ParquetWriter(tmp, table.schema, compression="zstd"), tmp, path)
+                writers[sub_category][0].write_table(table)
+    except BaseException:
+        for writer, tmp, _ in writers.values():
+            writer.close()
+            tmp.unlink(missing_ok=True)
+        raise
+    for writer, tmp, path in writers.values():
+        writer.close()
+        tmp.replace(path)
+    return len(writers)
+
+
+def compact(root: Path, months: list[str] | None = None, before: str | None = None) -> int:
+    """Merge each partition's files into one ``compacted.parquet``; returns partitions rewritten.
+
+    ``before`` (``YYYY-MM``) limits this to the months that are already closed.
+    """
+    rewritten = 0
+    for month_dir in sorted(root.glob("month=*")):
+        month = month_dir.name.split("=", 1)[1]
+        if months and month not in months:
+            continue
+        if before is not None and month >= before:
+            continue
+        for part_dir in sorted(p for p in month_dir.iterdir() if p.is_dir()):
+            parts = sorted(part_dir.glob("part-*.parquet"))
+            if not parts:
+                continue
+            files = ([part_dir / COMPACTED_NAME] if (part_dir / COMPACTED_NAME).exists() else []) + parts
+            table = pa.concat_tables([pq.read_table(f) for f in files], promote_options="default")
+            table = table.sort_by([("run_date", "ascending")])
+            _write_atomic(table, part_dir / COMPACTED_NAME)
+            for p in parts:
+                p.unlink()
+            rewritten += 1
+    return rewritten
+
+
+def convert_csv_history(history_dir: Path, root: Path) -> int:
+    """One-shot conversion of ``listings_YYYYMMDD.csv`` snapshots into a compacted store."""
+    frames: dict[tuple[str, str], list[pd.DataFrame]] = {}
+    runs = 0
+    for path in sorted(history_dir.glob("listings_*.csv")):
+        df = read_history_csv(path)
+        if df.empty:
+            continue
+        runs += 1
+        month = str(df["run_date"].iloc[0])[:7]
+        for sub_category, group in df.groupby("sub_category", sort=True):
+            frames.setdefault((month, str(sub_category)), []).append(group)
+    for (month, sub_category), groups in sorted(frames.items()):
+        table = pa.concat_tables([_to_table(g) for g in groups])
+        _write_atomic(table, partition_dir(root, month, sub_category) / COMPACTED_NAME)
+    return runs
+
+
+def backfill_columns(root: Path) -> int:
+    """Add missing ``BACKFILLED_COLUMNS`` to stored files; returns files rewritten."""
+    rewritten = 0
+    for path in sorted(root.glob("month=*/sub_category=*/*.parquet")):
+        names = pq.read_schema(path).names
+        if all(c in names for c in BACKFILLED_COLUMNS):
+            continue
+        df = pq.read_table(path).to_pandas()
+        _write_atomic(_to_table(with_station(with_detail_columns(df))), path)
+        rewritten += 1
+    return rewritten
+
+
+def _partition_files(
+    root: Path, first_month: str | None, last_month: str | None, sub_categories: list[str] | None
+) -> list[str]:
+    """Files of the partitions that can hold matching rows, so only their schemas are read."""
+    wanted = None if sub_categories is None else {f"sub_category={quote(str(s), safe='')}" for s in sub_categories}
+    if first_month is not None and first_month == last_month:
+        month_dirs = [root / f"month={first_month}"]
+    else:
+        month_dirs = [
+            d
+            for d in root.glob("month=*")
+            if (first_month is None or d.name[6:] >= first_month) and (last_month is None or d.name[6:] <= last_month)
+        ]
+    files = []
+    for month_dir in month_dirs:
+        for part_dir in month_dir.glob("sub_category=*"):
+            if wanted is None or part_dir.name in wanted:
+                files.extend(str(p) for p in part_dir.glob("*.parquet"))
+    return sorted(files)
+
+
+def read_history(
+    root: Path,
+    columns: list[str] | None = None,
+    sub_categories: list[str] | None = None,
+    start: dt.date | str | None = None,
+    end: dt.date | str | None = None,
+    typed: bool = False,
+) -> pd.DataFrame:
+    """Load history rows, pruning partitions by sub_category/month and files by column.
+
+    With ``typed`` the frame has the shared listing dtypes (``typed_frame``);
+    repeating text is dictionary-encoded while converting from Arrow, so it
+    never exists as one Python string per row.
+    """
+    files = _partition_files(
+        root,
+        None if start is None else str(start)[:7],
+        None if end is None else str(end)[:7],
+        sub_categories,
+    )
+    if not files:
+        return pd.DataFrame(columns=columns or [])
+    # Files written before a column was added simply lack it; unify so it reads as null.
+    schema = pa.unify_schemas([*(pq.read_schema(f) for f in files), PARTITION_SCHEMA])
+    dataset = ds.dataset(
+        files,
+        schema=schema,
+        format="parquet",
+        partitioning=ds.HivePartitioning(PARTITION_SCHEMA),
+        partition_base_dir=str(root),
+    )
+    flt = None
+
+    def both(a, b):
+        return b if a is None else a & b
+
+    if sub_categories is not None:
+        flt = both(flt, ds.field("sub_category").isin(list(sub_categories)))
+    if start is not None:
+        start = str(start)
+        flt = both(flt, (ds.field("month") >= start[:7]) & (ds.field("run_date") >= start))
+    if end is not None:
+        end = str(end)
+        flt = both(flt, (ds.field("month") <= end[:7]) & (ds.field("run_date") <= end))
+    table = dataset.to_table(columns=columns, filter=flt)
+    if typed:
+        if "run_date" in table.column_names:
+            i = table.column_names.index("run_date")
+            table = table.set_column(i, "run_date", pc.cast(table["run_date"], pa.date32()))
+        categories = [c for c in CATEGORY_COLUMNS if c in table.column_names]
+        df = typed_frame(table.to_pandas(categories=categories, date_as_object=False))
+    else:
+        df = table.to_pandas()
+    if columns is None:
+        df = df.drop(columns=["month"])
+    sort_cols = [c for c in ("run_date", "sub_category") if c in df.columns]
+    if sort_cols:
+        df = df.sort_values(sort_cols, kind="stable").reset_index(drop=True)
+    return df
+
+
+def run_dates(root: Path) -> list[str]:
+    """Run dates present in the store, oldest first."""
+    df = read_history(root, columns=["run_date"])
+    return sorted(str(d) for d in df["run_date"].unique()) if len(df) else []
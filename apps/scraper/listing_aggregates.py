@@ -0,0 +1,163 @@
+﻿"""Daily price aggregates that the dashboard charts read instead of raw rows.
+
+For every run_date, ``price_by_address`` holds the count, sum, mean and
+quartiles of each of ``AGGREGATE_MEASURES`` per sub_category and address.
+``refresh_aggregates`` recomputes the given run dates from the ``listings``
+view; ``save_sqlite`` calls it for the run it wrote, so a daily update only
+reads that run's rows. Sums and counts are stored next to the means so
+readers can merge addresses and still get exact means.
+
+Only the grain every chart reads is stored. The walk-minute series
+(``WALK_BUCKET_BOUNDS``) covers a single sub_category and area, so it is
+grouped from ``listings`` when read rather than kept for every address.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Iterable
+
+import pandas as pd
+
+AGGREGATE_MEASURES = ["unit_price_per_tsubo", "price_yen"]
+QUANTILES = {"q25": 0.25, "median": 0.5, "q75": 0.75}
+STAT_COLUMNS = ["n", "total", "mean", *QUANTILES]
+# Table -> grouping columns besides run_date; rows missing a grouping value are left out.
+AGGREGATE_GRAINS: dict[str, list[str]] = {
+    "price_by_address": ["sub_category", "address"],
+}
+_KEY_SQL = {"sub_category": "TEXT NOT NULL", "address": "TEXT NOT NULL"}
+# Aggregate tables earlier versions kept; dropped when the schema is ensured.
+RETIRED_AGGREGATES = ["price_by_walk"]
+# Inclusive upper ends (minutes) of the walk buckets; past the last one is open-ended.
+# A bucket is stored as its first minute: 0 (0-5), 6 (6-10), ..., 21 (21+).
+WALK_BUCKET_BOUNDS = [5, 10, 15, 20]
+WALK_BUCKET_STARTS = [0, *(b + 1 for b in WALK_BUCKET_BOUNDS)]
+
+
+def walk_bucket_sql(column: str = "walk_minutes") -> str:
+    """SQL expression for the walk bucket of ``column`` (NULL stays NULL)."""
+    cases = " ".join(f"WHEN {column} <= {b} THEN {s}" for b, s in zip(WALK_BUCKET_BOUNDS, WALK_BUCKET_STARTS))
+    return f"CASE WHEN {column} IS NULL THEN NULL {cases} ELSE {WALK_BUCKET_STARTS[-1]} END"
+
+
+def walk_buckets(minutes: pd.Series) -> pd.Series:
+    """``walk_bucket_sql`` for a Series: bucket starts as floats, NaN where minutes are missing."""
+    edges = [float("-inf"), *WALK_BUCKET_BOUNDS, float("inf")]
+    return pd.cut(pd.to_numeric(minutes, errors="coerce"), edges, labels=WALK_BUCKET_STARTS).astype(float)
+
+
+def walk_bucket_label(start: int) -> str:
+    i = WALK_BUCKET_STARTS.index(int(start))
+    return f"{start}-{WALK_BUCKET_BOUNDS[i]}分" if i < len(WALK_BUCKET_BOUNDS) else f"{start}分以上"
+
+
+def has_aggregates(con: sqlite3.Connection, table: str) -> bool:
+    """Whether ``table`` exists keyed as ``AGGREGATE_GRAINS`` says (an older layout does not count)."""
+    cols = {row[1] for row in con.execute(f"PRAGMA table_info({table})").fetchall()}
+    return set(AGGREGATE_GRAINS[table]) <= cols
+
+
+def ensure_aggregate_schema(con: sqlite3.Connection) -> bool:
+    """Create the aggregate tables, replacing any with an older layout; returns whether any was created."""
+    for table in RETIRED_AGGREGATES:
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+    created = False
+    for table, keys in AGGREGATE_GRAINS.items():
+        # Older tables were rowid tables with a separate index for the key; readers still accept them.
+        key_index = con.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = ?", (table,)
+        ).fetchone()
+        if has_aggregates(con, table) and key_index is None:
+            continue
+        created = True
+        con.execute(f"DROP TABLE IF EXISTS {table}")
+        key_cols = "".join(f"{k} {_KEY_SQL[k]},\n                " for k in keys)
+        con.execute(
+            f"""
+            CREATE TABLE {table} (
+                run_date TEXT NOT NULL,
+                {key_cols}measure TEXT NOT NULL,
+                n INTEGER NOT NULL,
+                total REAL NOT NULL,
+                mean REAL NOT NULL,
+                q25 REAL NOT NULL,
+                median REAL NOT NULL,
+                q75 REAL NOT NULL,
+                PRIMARY KEY (run_date, {", ".join(keys)}, measure)
+            ) WITHOUT ROWID
+            """
+        )
+    return created
+
+
+def _aggregate_sql(table: str, keys: list[str]) -> str:
+    """INSERT of ``STAT_COLUMNS`` per run_date, ``keys`` and measure over the rows in ``temp.aggregate_source``.
+
+    One window pass ranks each group's values; only the rows a statistic
+    needs (the last one and those at each quantile's lower rank) are then
+    grouped. Quantiles interpolate linearly to the next value like
+    ``Series.quantile``, and sums run over the values in ascending order,
+    so they do not depend on the order the view returns rows in.
+    """
+    key_cols = ", ".join(keys)
+    values = " UNION ALL ".join(
+        f"SELECT run_date, {key_cols}, '{m}' AS measure, {m} AS value FROM temp.aggregate_source WHERE {m} IS NOT NULL"
+        for m in AGGREGATE_MEASURES
+    )
+    not_null = " AND ".join(f"{k} IS NOT NULL" for k in keys)
+    lower = {name: f"CAST((n - 1) * {q} AS INTEGER)" for name, q in QUANTILES.items()}
+    quantiles = ",\n               ".join(
+        f"MAX(CASE WHEN pos = {lower[name]} "
+        f"THEN value + (COALESCE(next_value, value) - value) * ((n - 1) * {q} - {lower[name]}) END)"
+        for name, q in QUANTILES.items()
+    )
+    return f"""
+        INSERT INTO {table}(run_date, {key_cols}, measure, {", ".join(STAT_COLUMNS)})
+        WITH vals AS (SELECT * FROM ({values}) WHERE {not_null}),
+        ranked AS (
+            SELECT *,
+                   ROW_NUMBER() OVER w - 1 AS pos,
+                   COUNT(*) OVER (w ROWS BETWEEN UNBOUNDED PRECEDING AND UNBOUNDED FOLLOWING) AS n,
+                   SUM(value) OVER (w ROWS UNBOUNDED PRECEDING) AS running,
+                   LEAD(value) OVER w AS next_value
+            FROM vals
+            WINDOW w AS (PARTITION BY run_date, {key_cols}, measure ORDER BY value)
+        )
+        SELECT run_date, {key_cols}, measure, MAX(n),
+               MAX(CASE WHEN pos = n - 1 THEN running END),
+               MAX(CASE WHEN pos = n - 1 THEN running END) / MAX(n),
+               {quantiles}
+        FROM ranked
+        WHERE pos = n - 1 OR pos IN ({", ".join(lower.values())})
+        GROUP BY run_date, {key_cols}, measure
+        """
+
+
+def refresh_aggregates(con: sqlite3.Connection, run_dates: Iterable[str] | None = None) -> int:
+    """Recompute the aggregates of ``run_dates`` (every run when ``None``); returns rows written."""
+    if run_dates is None:
+        where, params = "", []
+    else:
+        params = list(run_dates)
+        if not params:
+            return 0
+        where = f"WHERE run_date IN ({','.join('?' for _ in params)})"
+    # The view is read once; every measure is computed from the copy.
+    con.execute("DROP TABLE IF EXISTS temp.aggregate_source")
+    con.execute(
+        f"""
+        CREATE TEMP TABLE aggregate_source AS
+        SELECT run_date, sub_category, COALESCE(address, '') AS address, {", ".join(AGGREGATE_MEASURES)}
+        FROM listings {where}
+        """,
+        params,
+    )
+    written = 0
+    try:
+        for table, keys in AGGREGATE_GRAINS.items():
+            con.execute(f"DELETE FROM {table} {where}", params)
+            written += con.execute(_aggregate_sql(table, keys)).rowcount
+    finally:
+        con.execute("DROP TABLE temp.aggregate_source")
+    return written
@@ -0,0 +1,189 @@
+﻿"""Attributes that only appear on a listing's detail page.
+
+List-page cards carry no build year, structure, road frontage or
+management fee. Fetching every detail page daily would multiply the
+crawl, so the detail page of a listing is read once and cached in
+``listing_enrichment`` (one row per sub_category and listing_id), and
+read again only when the listing's price changes:
+
+* ``enrichment_targets`` lists the listings of a run with no cached row
+  or a cached row taken at another ``price_text``, new listings first.
+* ``page_attributes`` collects every label/value pair of a detail page;
+  ``enrichment_values`` types the ones in ``ENRICHMENT_FIELDS``.
+* The ``listings_enriched`` view joins the cache to ``listings``.
+
+The scraper decides how many pages a run may fetch (``--detail-pages``).
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+from dataclasses import dataclass
+
+from bs4 import BeautifulSoup
+
+from listing_extract import normalize_text
+
+# Column -> detail-page labels it is read from, first match wins.
+ENRICHMENT_FIELDS: dict[str, tuple[str, ...]] = {
+    "built_text": ("築年月", "完成時期(築年月)", "完成時期", "築年数"),
+    "structure": ("構造・工法", "構造"),
+    "road_frontage": ("接道状況",),
+    "management_fee_text": ("管理費", "管理費・共益費", "管理費等", "共益費"),
+}
+ENRICHMENT_COLUMNS = [
+    "built_text",
+    "built_year",
+    "structure",
+    "road_frontage",
+    "management_fee_text",
+    "management_fee_yen",
+]
+
+# Sale detail pages append a "ヒント" tooltip to some labels.
+LABEL_SUFFIX_RE = re.compile(r"\s*ヒント$")
+YEAR_RE = re.compile(r"(\d{4})\s*年")
+AGE_RE = re.compile(r"築\s*(\d+)\s*年")
+MAN_YEN_RE = re.compile(r"(\d+(?:\.\d+)?)\s*万\s*(\d*)\s*円?")
+YEN_RE = re.compile(r"(\d+)\s*円")
+
+
+@dataclass
+class EnrichmentTarget:
+    sub_category: str
+    listing_id: str
+    detail_url: str
+    price_text: str | None
+
+
+def ensure_enrichment_schema(con: sqlite3.Connection) -> None:
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS listing_enrichment (
+            sub_category TEXT NOT NULL,
+            listing_id TEXT NOT NULL,
+            detail_url TEXT,
+            price_text TEXT,
+            fetched_at TEXT NOT NULL,
+            built_text TEXT,
+            built_year INTEGER,
+            structure TEXT,
+            road_frontage TEXT,
+            management_fee_text TEXT,
+            management_fee_yen REAL,
+            attributes TEXT,
+            PRIMARY KEY (sub_category, listing_id)
+        )
+        """
+    )
+    cols = ", ".join(f"e.{c} AS {c}" for c in ENRICHMENT_COLUMNS)
+    con.execute(
+        f"""
+        CREATE VIEW IF NOT EXISTS listings_enriched AS
+        SELECT l.*, {cols}, e.fetched_at AS enriched_at
+        FROM listings l
+        LEFT JOIN listing_enrichment e ON e.sub_category = l.sub_category AND e.listing_id = l.listing_id
+        """
+    )
+
+
+def enrichment_targets(con: sqlite3.Connection, run_date: str) -> list[EnrichmentTarget]:
+    """Listings of ``run_date`` whose detail page is not cached at their current price."""
+    rows = con.execute(
+        """
+        SELECT l.sub_category, l.listing_id, l.detail_url, l.price_text
+        FROM listings l
+        LEFT JOIN listing_enrichment e ON e.sub_category = l.sub_category AND e.listing_id = l.listing_id
+        WHERE l.run_date = ?
+          AND COALESCE(l.detail_url, '') != ''
+          AND (e.listing_id IS NULL OR e.price_text IS NOT l.price_text)
+        ORDER BY e.listing_id IS NOT NULL, l.sub_category, l.listing_id
+        """,
+        (run_date,),
+    ).fetchall()
+    return [EnrichmentTarget(*row) for row in rows]
+
+
+def _label(text: str) -> str:
+    return LABEL_SUFFIX_RE.sub("", normalize_text(text))
+
+
+def page_attributes(soup: BeautifulSoup) -> dict[str, str]:
+    """Every ``th``/``td`` and ``dt``/``dd`` pair of a detail page, by normalized label."""
+    attributes: dict[str, str] = {}
+    for label_tag, value_tag in (("th", "td"), ("dt", "dd")):
+        for label_el in soup.select(label_tag):
+            value_el = label_el.find_next_sibling(value_tag)
+            if value_el is None:
+                continue
+            label = _label(label_el.get_text(" ", strip=True))
+            if label:
+                attributes.setdefault(label, normalize_text(value_el.get_text(" ", strip=True)))
+    return attributes
+
+
+def extract_built_year(text: str, fetched_year: int) -> int | None:
+    """Build year from "2015年3月", "築10年" or "新築"."""
+    t = normalize_text(text)
+    m = YEAR_RE.search(t)
+    if m:
+        return int(m.group(1))
+    m = AGE_RE.search(t)
+    if m:
+        return fetched_year - int(m.group(1))
+    if "新築" in t:
+        return fetched_year
+    return None
+
+
+def extract_fee_yen(text: str) -> float | None:
+    """Monthly fee from "1万2000円", "1.2万円" or "12,000円"; ``None`` for "-" or "なし"."""
+    t = normalize_text(text).replace(",", "")
+    m = MAN_YEN_RE.search(t)
+    if m:
+        return float(m.group(1)) * 10_000 + float(m.group(2) or 0)
+    m = YEN_RE.search(t)
+    if m:
+        return float(m.group(1))
+    return None
+
+
+def enrichment_values(attributes: dict[str, str], fetched_year: int) -> dict[str, object]:
+    """``ENRICHMENT_COLUMNS`` of one detail page."""
+    values: dict[str, object] = {}
+    for column, labels in ENRICHMENT_FIELDS.items():
+        values[column] = next((attributes[label] for label in labels if label in attributes), None)
+    built = values["built_text"]
+    fee = values["management_fee_text"]
+    values["built_year"] = extract_built_year(built, fetched_year) if built else None
+    values["management_fee_yen"] = extract_fee_yen(fee) if fee else None
+    return {c: values[c] for c in ENRICHMENT_COLUMNS}
+
+
+def save_enrichment(
+    con: sqlite3.Connection, pages: list[tuple[EnrichmentTarget, dict[str, str]]], fetched_at: str
+) -> int:
+    """Cache the attributes read for each target; replaces earlier rows of the same listing."""
+    fetched_year = int(fetched_at[:4])
+    rows = []
+    for target, attributes in pages:
+        values = enrichment_values(attributes, fetched_year)
+        rows.append(
+            [
+                target.sub_category,
+                target.listing_id,
+                target.detail_url,
+                target.price_text,
+                fetched_at,
+                *(values[c] for c in ENRICHMENT_COLUMNS),
+                json.dumps(attributes, ensure_ascii=False),
+            ]
+        )
+    cols = ["sub_category", "listing_id", "detail_url", "price_text", "fetched_at", *ENRICHMENT_COLUMNS, "attributes"]
+    con.executemany(
+        f"INSERT OR REPLACE INTO listing_enrichment({', '.join(cols)}) VALUES({', '.join('?' * len(cols))})",
+        rows,
+    )
+    return len(rows)
@@ -0,0 +1,132 @@
+﻿"""Run-to-run listing events: what came on the market, what left it and what changed price.
+
+For every run_date after the first, ``listing_events`` holds one row per
+listing (``sub_category``, ``listing_id``) that is ``new`` (absent from the
+previous run), ``removed`` (in the previous run, absent from this one) or
+``price_changed`` (``price_text``/``price_yen`` differ from the previous
+run). A listing seen unchanged in both runs is a single version spanning
+them, so only versions starting at the run or ending at the previous run
+are compared: a start without an end is new, an end without a start is
+removed, and an end and a start with different content hashes are a
+change, reported when the price is part of it. ``save_sqlite`` refreshes
+the run it wrote and the run after it.
+
+A row stores only the ``listing_key``, the event and the two run dates,
+which reference the versions compared: the one starting at ``run_date``
+and the one ending at ``prev_run_date`` (``listing_versions`` keeps one
+version per key and date, so both are unique). ``run_events`` joins
+``listing_dim`` and those versions back in for the display columns.
+"""
+
+from __future__ import annotations
+
+import sqlite3
+from typing import Iterable
+
+import pandas as pd
+
+EVENT_TYPES = ["new", "removed", "price_changed"]
+# Display columns read from the version that exists (the previous one for removed listings).
+EVENT_DETAIL_COLUMNS = ["station", "title", "address", "detail_url"]
+EVENT_COLUMNS = [
+    "run_date",
+    "prev_run_date",
+    "event",
+    "sub_category",
+    "listing_id",
+    *EVENT_DETAIL_COLUMNS,
+    "price_text",
+    "price_yen",
+    "prev_price_text",
+    "prev_price_yen",
+]
+# What listing_events stores; everything else in EVENT_COLUMNS is joined in by run_events.
+STORED_EVENT_COLUMNS = ["run_date", "prev_run_date", "listing_key", "event"]
+
+_PAIRS_SQL = "SELECT run_date, LAG(run_date) OVER (ORDER BY run_date) AS prev_date FROM runs"
+
+
+def has_events(con: sqlite3.Connection) -> bool:
+    """Whether ``listing_events`` exists with ``STORED_EVENT_COLUMNS`` (an older layout does not count)."""
+    return [row[1] for row in con.execute("PRAGMA table_info(listing_events)").fetchall()] == STORED_EVENT_COLUMNS
+
+
+def ensure_event_schema(con: sqlite3.Connection) -> bool:
+    """Create ``listing_events``, replacing an older layout; returns whether it was created."""
+    if has_events(con):
+        return False
+    con.execute("DROP TABLE IF EXISTS listing_events")
+    con.execute(
+        """
+        CREATE TABLE listing_events (
+            run_date TEXT NOT NULL,
+            prev_run_date TEXT NOT NULL,
+            listing_key INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            PRIMARY KEY (run_date, listing_key)
+        ) WITHOUT ROWID
+        """
+    )
+    return True
+
+
+def _events_sql(date_filter: str) -> str:
+    return f"""
+        WITH pairs AS (SELECT * FROM ({_PAIRS_SQL}) WHERE prev_date IS NOT NULL{date_filter})
+        SELECT p.run_date, p.prev_date, cur.listing_key,
+               CASE WHEN old.listing_key IS NULL THEN 'new' ELSE 'price_changed' END
+        FROM pairs p
+        JOIN listing_versions cur ON cur.valid_from = p.run_date
+        LEFT JOIN listing_versions old ON old.listing_key = cur.listing_key AND old.valid_to = p.prev_date
+        WHERE old.listing_key IS NULL
+           OR (old.content_hash <> cur.content_hash
+               AND (old.price_text IS NOT cur.price_text OR old.price_yen IS NOT cur.price_yen))
+        UNION ALL
+        SELECT p.run_date, p.prev_date, old.listing_key, 'removed'
+        FROM pairs p
+        JOIN listing_versions old ON old.valid_to = p.prev_date
+        WHERE NOT EXISTS (
+            SELECT 1 FROM listing_versions cur WHERE cur.listing_key = old.listing_key AND cur.valid_from = p.run_date
+        )
+        """
+
+
+def refresh_events(con: sqlite3.Connection, run_dates: Iterable[str] | None = None) -> int:
+    """Recompute the events of ``run_dates`` (every run when ``None``); returns rows written."""
+    if run_dates is None:
+        where, date_filter, params = "", "", []
+    else:
+        params = list(run_dates)
+        if not params:
+            return 0
+        marks = ",".join("?" for _ in params)
+        where = f" WHERE run_date IN ({marks})"
+        date_filter = f" AND run_date IN ({marks})"
+    con.execute(f"DELETE FROM listing_events{where}", params)
+    cur = con.execute(
+        f"INSERT INTO listing_events({', '.join(STORED_EVENT_COLUMNS)}) {_events_sql(date_filter)}", params
+    )
+    return cur.rowcount
+
+
+def run_events(con: sqlite3.Connection, run_date: str) -> pd.DataFrame:
+    """The events of one run as ``EVENT_COLUMNS``, ordered by event type, sub_category and listing_id."""
+    order = " ".join(f"WHEN '{e}' THEN {i}" for i, e in enumerate(EVENT_TYPES))
+    # A removed listing has no current version, so its display columns come from the previous one.
+    detail = ", ".join(
+        f"CASE WHEN cur.listing_key IS NULL THEN old.{c} ELSE cur.{c} END AS {c}" for c in EVENT_DETAIL_COLUMNS
+    )
+    return pd.read_sql_query(
+        f"""
+        SELECT e.run_date, e.prev_run_date, e.event, d.sub_category, d.listing_id, {detail},
+               cur.price_text, cur.price_yen, old.price_text AS prev_price_text, old.price_yen AS prev_price_yen
+        FROM listing_events e
+        JOIN listing_dim d ON d.listing_key = e.listing_key
+        LEFT JOIN listing_versions cur ON cur.listing_key = e.listing_key AND cur.valid_from = e.run_date
+        LEFT JOIN listing_versions old ON old.listing_key = e.listing_key AND old.valid_to = e.prev_run_date
+        WHERE e.run_date = ?
+        ORDER BY CASE e.event {order} END, d.sub_category, d.listing_id
+        """,
+        con,
+        params=(run_date,),
+    )
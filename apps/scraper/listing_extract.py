@@ -0,0 +1,291 @@
+﻿"""Price, area and layout extraction for SUUMO listing text.
+
+The scalar functions handle one string at a time and are what the page
+parsers call per card. The ``*_batch`` variants take a whole column (any
+iterable or Series of raw strings) and return a Series aligned with it,
+using the same precompiled patterns through vectorized ``str`` methods.
+Their results equal the scalar functions element-wise, with NaN standing
+in for ``None``.
+
+``detail_fields`` turns the JSON ``detail_text`` of sale listings into the
+typed ``DETAIL_COLUMNS`` stored next to it, so readers never decode JSON.
+"""
+
+from __future__ import annotations
+
+import json
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Callable, Iterable
+
+import numpy as np
+import pandas as pd
+
+SQM_PER_TSUBO = 3.305785
+
+WHITESPACE_RE = re.compile(r"\s+")
+RANGE_SEP_RE = re.compile(r"[~〜～]")
+OKU_RE = re.compile(r"(\d+(?:\.\d+)?)\s*億")
+OKU_MAN_RE = re.compile(r"億\s*(\d+(?:\.\d+)?)\s*万")
+MAN_RE = re.compile(r"(\d+(?:\.\d+)?)\s*万")
+YEN_RE = re.compile(r"(\d+(?:\.\d+)?)\s*円")
+PRICE_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?\s*(?:億\d+(?:\.\d+)?万|億|万|円)")
+# Supports m2 / m 2 / m² / ㎡
+SQM_RE = re.compile(r"(\d+(?:\.\d+)?)\s*(?:m\s*2|m²|㎡)")
+SQM_TOKEN_RE = re.compile(r"\d+(?:\.\d+)?\s*(?:m\s*2|m²|㎡)")
+TSUBO_RE = re.compile(r"(\d+(?:\.\d+)?)\s*坪")
+PAREN_RE = re.compile(r"\([^)]*\)")
+WALK_RE = re.compile(r"徒歩\s*(\d+)\s*分")
+PERCENT_RE = re.compile(r"(\d+(?:\.\d+)?)\s*%")
+# "133.26m2、うち1階車庫13.68m2": the part after うち is a breakdown, not another area.
+AREA_BREAKDOWN_RE = re.compile(r"うち.*$")
+
+DETAIL_COLUMNS = [
+    "station_text",
+    "walk_minutes",
+    "land_area_sqm",
+    "building_area_sqm",
+    "coverage_ratio",
+    "floor_area_ratio",
+]
+
+
+@lru_cache(maxsize=65536)
+def _normalize(text: str) -> str:
+    return WHITESPACE_RE.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def normalize_text(text: str) -> str:
+    # Listing text repeats heavily (addresses, layouts, station lines), so the
+    # NFKC pass is memoized per distinct string.
+    return _normalize(text or "")
+
+
+def parse_jpy_amount(token: str) -> float | None:
+    t = normalize_text(token).replace(",", "")
+    if not t:
+        return None
+    m = OKU_RE.search(t)
+    if m:
+        oku = float(m.group(1))
+        man = 0.0
+        m2 = OKU_MAN_RE.search(t)
+        if m2:
+            man = float(m2.group(1))
+        return oku * 100_000_000 + man * 10_000
+    m = MAN_RE.search(t)
+    if m:
+        return float(m.group(1)) * 10_000
+    m = YEN_RE.search(t)
+    if m:
+        return float(m.group(1))
+    return None
+
+
+def extract_price_yen(price_text: str) -> float | None:
+    t = normalize_text(price_text).replace(",", "")
+    if not t:
+        return None
+    parts = RANGE_SEP_RE.split(t)
+    vals = [parse_jpy_amount(p) for p in parts]
+    vals = [v for v in vals if v is not None]
+    if vals:
+        return float(sum(vals) / len(vals))
+    found: list[float] = []
+    for token in PRICE_TOKEN_RE.findall(t):
+        v = parse_jpy_amount(token)
+        if v is not None:
+            found.append(v)
+    if not found:
+        return None
+    return float(max(found))
+
+
+def extract_area_sqm(area_text: str) -> float | None:
+    t = normalize_text(area_text).replace(",", "")
+    if not t:
+        return None
+    vals = [float(x) for x in SQM_RE.findall(t)]
+    if vals:
+        return float(sum(vals) / len(vals))
+    return None
+
+
+def extract_area_tsubo(area_text: str) -> float | None:
+    t = normalize_text(area_text).replace(",", "")
+    if not t:
+        return None
+    vals = [float(x) for x in TSUBO_RE.findall(t)]
+    if vals:
+        return float(sum(vals) / len(vals))
+    sqm = extract_area_sqm(t)
+    if sqm is None:
+        return None
+    return sqm / SQM_PER_TSUBO
+
+
+def extract_layout_text(text: str) -> str:
+    t = normalize_text(text)
+    if not t:
+        return ""
+    # Remove area and keep the layout token (e.g. "3LDK", "ワンルーム")
+    t = SQM_TOKEN_RE.sub("", t)
+    t = PAREN_RE.sub("", t)
+    t = WHITESPACE_RE.sub(" ", t).strip()
+    return t
+
+
+def extract_walk_minutes(text: str) -> float | None:
+    t = normalize_text(text)
+    if not t:
+        return None
+    vals = [int(x) for x in WALK_RE.findall(t)]
+    if not vals:
+        return None
+    return float(min(vals))
+
+
+def extract_detail_area_sqm(text: str) -> float | None:
+    return extract_area_sqm(AREA_BREAKDOWN_RE.sub("", normalize_text(text)))
+
+
+def extract_building_ratios(text: str) -> tuple[float | None, float | None]:
+    """(建ぺい率, 容積率) in percent from e.g. "建ぺい率:50%、容積率:100%" or "50%・100%"."""
+    vals = [float(x) for x in PERCENT_RE.findall(normalize_text(text))]
+    coverage = vals[0] if vals else None
+    floor_area = vals[1] if len(vals) > 1 else None
+    return coverage, floor_area
+
+
+def detail_fields(detail_text: str) -> dict[str, object]:
+    """Typed ``DETAIL_COLUMNS`` from a sale listing's JSON ``detail_text``."""
+    obj: dict = {}
+    if isinstance(detail_text, str) and detail_text.startswith("{"):
+        try:
+            obj = json.loads(detail_text)
+        except ValueError:
+            obj = {}
+    station = normalize_text(str(obj.get("沿線・駅", "")))
+    coverage, floor_area = extract_building_ratios(str(obj.get("建ぺい率・容積率", "")))
+    return {
+        "station_text": station,
+        "walk_minutes": extract_walk_minutes(station),
+        "land_area_sqm": extract_detail_area_sqm(str(obj.get("土地面積", ""))),
+        "building_area_sqm": extract_detail_area_sqm(str(obj.get("建物面積", "") or obj.get("専有面積", ""))),
+        "coverage_ratio": coverage,
+        "floor_area_ratio": floor_area,
+    }
+
+
+def _as_series(values: Iterable) -> pd.Series:
+    if isinstance(values, pd.Series):
+        return values
+    return pd.Series(list(values), dtype=object)
+
+
+def normalize_batch(values: Iterable) -> pd.Series:
+    """NFKC + whitespace normalization, computed once per distinct value."""
+    s = _as_series(values).astype(object)
+    s = s.where(s.notna(), "")
+    lookup = {u: normalize_text(str(u)) for u in pd.unique(s.to_numpy())}
+    return s.map(lookup).astype(object)
+
+
+def _on_uniques(values: Iterable, fn: Callable[[pd.Series], pd.Series]) -> pd.Series:
+    """Run the vectorized ``fn`` once per distinct raw string and broadcast back.
+
+    Listing columns repeat heavily across rows and days, so extracting over
+    the distinct values and reindexing is much cheaper than over every row.
+    """
+    s = _as_series(values).astype(object)
+    s = s.where(s.notna(), "")
+    uniques = pd.Series(pd.unique(s.to_numpy()), dtype=object)
+    out = fn(normalize_batch(uniques))
+    out.index = uniques
+    return pd.Series(out.reindex(s.to_numpy()).to_numpy(), index=s.index, dtype=out.dtype)
+
+
+def _mean_of_matches(matches: pd.DataFrame, index: pd.Index) -> pd.Series:
+    # Sum match columns left to right, exactly like ``sum(vals) / len(vals)``.
+    total = pd.Series(0.0, index=index)
+    count = pd.Series(0, index=index)
+    for col in matches.columns:
+        v = matches[col].reindex(index)
+        total = total + v.fillna(0.0)
+        count = count + v.notna()
+    return (total / count.where(count > 0)).astype(float)
+
+
+def _findall_mean(t: pd.Series, pattern: re.Pattern) -> pd.Series:
+    found = t.str.extractall(pattern)
+    if found.empty:
+        return pd.Series(np.nan, index=t.index)
+    wide = found[0].astype(float).unstack()
+    return _mean_of_matches(wide, t.index)
+
+
+def _parse_jpy_amount_batch(part: pd.Series) -> pd.Series:
+    oku = part.str.extract(OKU_RE, expand=False).astype(float)
+    oku_man = part.str.extract(OKU_MAN_RE, expand=False).astype(float).fillna(0.0)
+    man = part.str.extract(MAN_RE, expand=False).astype(float)
+    yen = part.str.extract(YEN_RE, expand=False).astype(float)
+    out = yen.where(man.isna(), man * 10_000)
+    return out.where(oku.isna(), oku * 100_000_000 + oku_man * 10_000)
+
+
+def _price_yen(t: pd.Series) -> pd.Series:
+    t = t.str.replace(",", "", regex=False)
+    parts = t.str.split(RANGE_SEP_RE, expand=True)
+    if parts.empty:
+        return pd.Series(np.nan, index=t.index)
+    amounts = pd.concat(
+        {col: _parse_jpy_amount_batch(normalize_batch(parts[col].fillna(""))) for col in parts.columns}, axis=1
+    )
+    # The scalar ``findall`` fallback never fires: any price token it could
+    # find lies inside one range part, which then parses on its own.
+    return _mean_of_matches(amounts, t.index)
+
+
+def _area_sqm(t: pd.Series) -> pd.Series:
+    return _findall_mean(t.str.replace(",", "", regex=False), SQM_RE)
+
+
+def _area_tsubo(t: pd.Series) -> pd.Series:
+    t = t.str.replace(",", "", regex=False)
+    return _findall_mean(t, TSUBO_RE).fillna(_findall_mean(t, SQM_RE) / SQM_PER_TSUBO)
+
+
+def _layout_text(t: pd.Series) -> pd.Series:
+    t = t.str.replace(SQM_TOKEN_RE, "", regex=True).str.replace(PAREN_RE, "", regex=True)
+    return t.str.replace(WHITESPACE_RE, " ", regex=True).str.strip()
+
+
+def extract_price_yen_batch(values: Iterable) -> pd.Series:
+    return _on_uniques(values, _price_yen)
+
+
+def extract_area_sqm_batch(values: Iterable) -> pd.Series:
+    return _on_uniques(values, _area_sqm)
+
+
+def extract_area_tsubo_batch(values: Iterable) -> pd.Series:
+    return _on_uniques(values, _area_tsubo)
+
+
+def extract_layout_text_batch(values: Iterable) -> pd.Series:
+    return _on_uniques(values, _layout_text)
+
+
+def detail_fields_batch(values: Iterable) -> pd.DataFrame:
+    """``detail_fields`` for a whole ``detail_text`` column, decoding each distinct value once."""
+    s = _as_series(values).astype(object)
+    s = s.where(s.notna(), "")
+    uniques = pd.unique(s.to_numpy())
+    table = pd.DataFrame([detail_fields(u) for u in uniques], index=uniques, columns=DETAIL_COLUMNS)
+    out = table.reindex(s.to_numpy())
+    out.index = s.index
+    for c in DETAIL_COLUMNS:
+        if c != "station_text":
+            out[c] = out[c].astype(float)
+    return out
@@ -0,0 +1,232 @@
+﻿"""Stable property IDs across re-posted listings.
+
+SUUMO gives a property a new listing ID when it is re-posted (a new agent,
+a relisting after a price cut, a rent room advertised again), so
+``listing_dim`` alone splits one property into several listings. This
+module links every listing to a ``properties`` row:
+
+* Blocking: candidates share sub_category, the chome-level address, the
+  layout (plus the floor for rent rooms) and an area bucket of +-1 m2.
+* Matching: within a block, a candidate must not be listed on the run the
+  listing first appeared in (listings that coexist are different units), its
+  area must agree within ``AREA_TOLERANCE`` and, where both have one, the
+  title must be similar. The closest candidate wins.
+
+``update_identity`` only looks at listings without a link yet, each one
+with one indexed block lookup, so a daily run costs time proportional to
+its new listings. Every decision depends only on runs up to the listing's
+first run, so a full rebuild links exactly like the daily updates did.
+"""
+
+from __future__ import annotations
+
+import math
+import re
+import sqlite3
+from difflib import SequenceMatcher
+
+from listing_extract import normalize_text
+
+AREA_TOLERANCE = 0.02  # relative; at least 0.5 m2
+MIN_TITLE_SIMILARITY = 0.6
+# A re-post can be cheaper (price cut) but rarely much dearer.
+PRICE_RANGE = (0.6, 1.1)
+
+CHOME_RE = re.compile(r"丁目.*$")
+BLOCK_NUMBER_RE = re.compile(r"^(.*?\d+)\s*[-−ー].*$")
+
+
+def ensure_identity_schema(con: sqlite3.Connection) -> None:
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS properties (
+            property_id INTEGER PRIMARY KEY,
+            sub_category TEXT NOT NULL,
+            block_key TEXT NOT NULL,
+            area_bucket INTEGER,
+            area_sqm REAL,
+            price_yen REAL,
+            title TEXT
+        )
+        """
+    )
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS property_links (
+            listing_key INTEGER PRIMARY KEY REFERENCES listing_dim(listing_key),
+            property_id INTEGER NOT NULL REFERENCES properties(property_id),
+            match_score REAL
+        )
+        """
+    )
+    con.execute("CREATE INDEX IF NOT EXISTS idx_properties_block ON properties(sub_category, block_key, area_bucket)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_property_links_property ON property_links(property_id)")
+    con.execute(
+        """
+        CREATE VIEW IF NOT EXISTS property_versions AS
+        SELECT k.property_id AS property_id,
+               d.listing_key AS listing_key,
+               d.sub_category AS sub_category,
+               d.listing_id AS listing_id,
+               v.valid_from AS valid_from,
+               v.valid_to AS valid_to,
+               v.price_yen AS price_yen,
+               v.price_text AS price_text
+        FROM property_links k
+        JOIN listing_dim d ON d.listing_key = k.listing_key
+        JOIN listing_versions v ON v.listing_key = k.listing_key
+        """
+    )
+    con.execute(
+        """
+        CREATE VIEW IF NOT EXISTS property_spans AS
+        SELECT k.property_id AS property_id,
+               MIN(d.first_seen) AS first_seen,
+               MAX(d.last_seen) AS last_seen,
+               COUNT(*) AS listings
+        FROM property_links k
+        JOIN listing_dim d ON d.listing_key = k.listing_key
+        GROUP BY k.property_id
+        """
+    )
+
+
+def clear_identity(con: sqlite3.Connection) -> None:
+    con.execute("DELETE FROM property_links")
+    con.execute("DELETE FROM properties")
+
+
+def address_key(address: str) -> str:
+    """Chome-level address: "東京都世田谷区奥沢3丁目5-1" -> "世田谷区奥沢3"."""
+    t = normalize_text(address)
+    if t.startswith("東京都"):
+        t = t[len("東京都") :]
+    t = CHOME_RE.sub("", t)
+    return BLOCK_NUMBER_RE.sub(r"\1", t)
+
+
+def block_key(sub_category: str, address: str, layout_text: str, detail_text: str) -> str:
+    parts = [address_key(address), normalize_text(layout_text)]
+    if sub_category == "賃貸":
+        # Rent detail_text is "floor | deposit/key | layout/area".
+        parts.append(normalize_text((detail_text or "").split(" | ", 1)[0]))
+    return "|".join(parts)
+
+
+def area_bucket(area_sqm: float | None) -> int | None:
+    if area_sqm is None or math.isnan(area_sqm):
+        return None
+    return int(round(area_sqm))
+
+
+def _area_gap(a: float | None, b: float | None) -> float | None:
+    """Relative area difference, 0 when both are unknown, None when too far apart."""
+    if a is None and b is None:
+        return 0.0
+    if a is None or b is None:
+        return None
+    gap = abs(a - b)
+    if gap > max(0.5, AREA_TOLERANCE * max(a, b)):
+        return None
+    return gap / max(a, b, 1.0)
+
+
+def _title_similarity(a: str, b: str) -> float | None:
+    if not a or not b:
+        return None
+    return SequenceMatcher(None, normalize_text(a), normalize_text(b)).ratio()
+
+
+def _pick(candidates: list[tuple], area: float | None, price: float | None, title: str) -> tuple[int, float] | None:
+    best: tuple[float, int] | None = None
+    for property_id, cand_area, cand_price, cand_title in candidates:
+        gap = _area_gap(area, cand_area)
+        if gap is None:
+            continue
+        similarity = _title_similarity(title, cand_title)
+        if similarity is not None and similarity < MIN_TITLE_SIMILARITY:
+            continue
+        if price is not None and cand_price:
+            ratio = price / cand_price
+            if not PRICE_RANGE[0] <= ratio <= PRICE_RANGE[1]:
+                continue
+            price_gap = abs(1.0 - ratio)
+        else:
+            price_gap = 0.5
+        # In [0, 1]; area counts double, unknown price/title count as half a match.
+        score = (2 * (1.0 - gap) + (1.0 - price_gap) + (similarity if similarity is not None else 0.5)) / 4
+        if best is None or score > best[0]:
+            best = (score, property_id)
+    if best is None:
+        return None
+    return best[1], round(best[0], 4)
+
+
+def _num(value: object) -> float | None:
+    if value is None:
+        return None
+    value = float(value)
+    return None if math.isnan(value) else value
+
+
+def update_identity(con: sqlite3.Connection) -> tuple[int, int]:
+    """Link every unlinked listing to a property; returns (linked, new properties)."""
+    # Listings removed by a re-run or replay leave their links behind.
+    con.execute("DELETE FROM property_links WHERE listing_key NOT IN (SELECT listing_key FROM listing_dim)")
+    con.execute("DELETE FROM properties WHERE property_id NOT IN (SELECT property_id FROM property_links)")
+
+    pending = con.execute(
+        """
+        SELECT d.listing_key, d.sub_category, d.first_seen,
+               v.address, v.layout_text, v.detail_text, v.area_sqm, v.price_yen, v.title
+        FROM listing_dim d
+        JOIN listing_versions v ON v.listing_key = d.listing_key AND v.valid_from = d.first_seen
+        LEFT JOIN property_links k ON k.listing_key = d.listing_key
+        WHERE k.listing_key IS NULL
+        ORDER BY d.first_seen, d.listing_key
+        """
+    ).fetchall()
+    linked = created = 0
+    for key, sub_category, first_seen, address, layout, detail, area, price, title in pending:
+        area, price, title = _num(area), _num(price), title or ""
+        block = block_key(sub_category, address or "", layout or "", detail or "")
+        bucket = area_bucket(area)
+        if bucket is None:
+            bucket_sql, params = "area_bucket IS NULL", ()
+        else:
+            bucket_sql, params = "area_bucket BETWEEN ? AND ?", (bucket - 1, bucket + 1)
+        candidates = con.execute(
+            f"""
+            SELECT p.property_id, p.area_sqm, p.price_yen, p.title
+            FROM properties p
+            WHERE p.sub_category = ? AND p.block_key = ? AND {bucket_sql}
+              AND NOT EXISTS (
+                  SELECT 1 FROM property_links k JOIN listing_versions v ON v.listing_key = k.listing_key
+                  WHERE k.property_id = p.property_id AND v.valid_from <= ? AND v.valid_to >= ?
+              )
+            """,
+            (sub_category, block, *params, first_seen, first_seen),
+        ).fetchall()
+        match = _pick(candidates, area, price, title)
+        if match is None:
+            property_id = con.execute(
+                "INSERT INTO properties(sub_category, block_key, area_bucket, area_sqm, price_yen, title) "
+                "VALUES(?,?,?,?,?,?)",
+                (sub_category, block, bucket, area, price, title),
+            ).lastrowid
+            score = None
+            created += 1
+        else:
+            property_id, score = match
+            # Later matches compare against the newest listing of the property.
+            con.execute(
+                "UPDATE properties SET area_bucket = ?, area_sqm = ?, price_yen = ?, title = COALESCE(?, title) "
+                "WHERE property_id = ?",
+                (bucket, area, price, title or None, property_id),
+            )
+            linked += 1
+        con.execute(
+            "INSERT INTO property_links(listing_key, property_id, match_score) VALUES(?,?,?)",
+            (key, property_id, score),
+        )
+    return linked, created
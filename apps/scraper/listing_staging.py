@@ -0,0 +1,311 @@
+﻿"""Per-run staging of parsed rows in SQLite.
+
+Crawl jobs hand each parsed page to ``StagingSink.add`` as soon as it is
+parsed and its rows go to ``staged_rows`` of a scratch database, so a run
+never holds all of its rows in memory and the rows crawled so far survive a
+crash. Every row keeps its position in the crawl (job, page URL, row on the
+page), which is the order the outputs use.
+
+The same file is the run's checkpoint: each page is recorded in
+``staged_pages`` (its out-links, whether it had cards and, when the run is
+archived, its HTML) in the transaction that stages its rows, committed
+before ``add`` returns, so even a killed process keeps every page parsed so
+far. Rows without a checkpoint record (replays, carried-forward rows) are
+buffered and written in batches. ``checkpoint`` identifies the run. Replaying the recorded links rebuilds
+the crawl frontier and visited set, so a resumed run (``resume=True``)
+fetches only the pages that were never committed.
+
+``publish`` filters and de-duplicates the staged rows with window
+functions into ``published``; ``published_chunks`` then streams that table
+to the CSV, Parquet and ``suumo.db`` writers a chunk at a time.
+"""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Iterator
+
+import pandas as pd
+
+from listing_store import REAL_COLUMNS
+
+STAGE_BATCH_ROWS = 500
+PUBLISH_CHUNK_ROWS = 5000
+# Written by ``prepare`` next to the listing columns; used only to filter and de-duplicate.
+DEDUPE_COLUMNS = ["dedupe_area", "dedupe_price", "dedupe_layout"]
+ORDER_COLUMNS = ["job_index", "page_url", "row_index"]
+
+
+@dataclass
+class StagedPage:
+    """Checkpoint record of one crawled page; ``html`` is kept only when the run archives pages."""
+
+    links: list[str]
+    has_cards: bool
+    html: str | None = None
+
+
+def _stored_meta(path: Path) -> dict[str, str] | None:
+    con = sqlite3.connect(path)
+    try:
+        return dict(con.execute("SELECT key, value FROM checkpoint"))
+    except sqlite3.DatabaseError:
+        return None
+    finally:
+        con.close()
+
+
+class StagingSink:
+    """Thread-safe row sink for one run; checkpointed pages are committed at once, other rows in batches.
+
+    ``columns`` are the listing columns to stage; ``prepare`` maps a batch of
+    raw rows to a frame with those columns plus ``noisy`` and
+    ``DEDUPE_COLUMNS``, row by row, so batching cannot change the result.
+
+    ``meta`` identifies the run (run date, config, ...). With ``resume`` an
+    existing file whose stored meta matches is reopened as is and
+    ``resumed`` is set; otherwise the file is recreated empty.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        columns: list[str],
+        prepare: Callable[[pd.DataFrame], pd.DataFrame],
+        batch_rows: int = STAGE_BATCH_ROWS,
+        meta: dict[str, str] | None = None,
+        resume: bool = False,
+    ) -> None:
+        self.path = path
+        self.columns = columns
+        self.prepare = prepare
+        self.batch_rows = batch_rows
+        self.meta = {**(meta or {}), "columns": json.dumps(columns)}
+        # Row counts of the last ``publish``: staged, noisy, cross_posted, duplicate_keys, published.
+        self.publish_stats: dict[str, int] = {}
+        self._buffer: list[tuple[int, str, list[dict], StagedPage | None]] = []
+        self._buffered_rows = 0
+        self._buffer_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.resumed = resume and path.exists() and _stored_meta(path) == self.meta
+        if not self.resumed:
+            path.unlink(missing_ok=True)
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        if not self.resumed:
+            self._create_tables()
+
+    def _create_tables(self) -> None:
+        cols = ",\n                ".join(f"{c} {'REAL' if c in REAL_COLUMNS else 'TEXT'}" for c in self.columns)
+        self._con.execute(
+            f"""
+            CREATE TABLE staged_rows (
+                job_index INTEGER NOT NULL,
+                page_url TEXT NOT NULL,
+                row_index INTEGER NOT NULL,
+                noisy INTEGER NOT NULL,
+                dedupe_area REAL,
+                dedupe_price REAL,
+                dedupe_layout TEXT,
+                {cols}
+            )
+            """
+        )
+        self._con.execute(
+            """
+            CREATE TABLE staged_pages (
+                job_index INTEGER NOT NULL,
+                page_url TEXT NOT NULL,
+                links TEXT NOT NULL,
+                has_cards INTEGER NOT NULL,
+                html BLOB,
+                PRIMARY KEY (job_index, page_url)
+            )
+            """
+        )
+        self._con.execute("CREATE TABLE checkpoint (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._con.executemany("INSERT INTO checkpoint(key, value) VALUES(?, ?)", self.meta.items())
+        self._con.commit()
+
+    def add(self, job_index: int, page_url: str, rows: list[dict], page: StagedPage | None = None) -> None:
+        """Stage the rows of one page; ``job_index`` and ``page_url`` order them in the outputs.
+
+        With ``page`` the page is also checkpointed, atomically with its rows,
+        and committed (with anything still buffered) before this returns.
+        """
+        batch = None
+        with self._buffer_lock:
+            self._buffer.append((job_index, page_url, rows, page))
+            self._buffered_rows += max(1, len(rows))
+            if page is not None or self._buffered_rows >= self.batch_rows:
+                batch, self._buffer, self._buffered_rows = self._buffer, [], 0
+        if batch:
+            self._write(batch)
+
+    def flush(self) -> None:
+        with self._buffer_lock:
+            batch, self._buffer, self._buffered_rows = self._buffer, [], 0
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: list[tuple[int, str, list[dict], StagedPage | None]]) -> None:
+        records = [
+            {**row, "job_index": job_index, "page_url": page_url, "row_index": i}
+            for job_index, page_url, rows, _ in batch
+            for i, row in enumerate(rows)
+        ]
+        names = [*ORDER_COLUMNS, "noisy", *DEDUPE_COLUMNS, *self.columns]
+        values: list[tuple] = []
+        if records:
+            frame = self.prepare(pd.DataFrame(records)).reindex(columns=names).astype(object)
+            values = list(frame.where(frame.notna(), None).itertuples(index=False, name=None))
+        pages = [
+            (
+                job_index,
+                page_url,
+                json.dumps(page.links),
+                int(page.has_cards),
+                None if page.html is None else zlib.compress(page.html.encode("utf-8")),
+            )
+            for job_index, page_url, _, page in batch
+            if page is not None
+        ]
+        marks = ", ".join("?" for _ in names)
+        with self._db_lock:
+            self._con.executemany(f"INSERT INTO staged_rows({', '.join(names)}) VALUES({marks})", values)
+            self._con.executemany(
+                "INSERT OR REPLACE INTO staged_pages(job_index, page_url, links, has_cards, html) VALUES(?, ?, ?, ?, ?)",
+                pages,
+            )
+            self._con.commit()
+
+    def staged_pages(self, job_index: int) -> dict[str, StagedPage]:
+        """Checkpointed pages of one job (without their HTML; see ``page_html``)."""
+        with self._db_lock:
+            found = self._con.execute(
+                "SELECT page_url, links, has_cards FROM staged_pages WHERE job_index = ?", (job_index,)
+            ).fetchall()
+        return {url: StagedPage(links=json.loads(links), has_cards=bool(cards)) for url, links, cards in found}
+
+    def page_html(self, job_index: int, page_url: str) -> str | None:
+        with self._db_lock:
+            found = self._con.execute(
+                "SELECT html FROM staged_pages WHERE job_index = ? AND page_url = ?", (job_index, page_url)
+            ).fetchone()
+        return None if found is None or found[0] is None else zlib.decompress(found[0]).decode("utf-8")
+
+    def page_listing_ids(self, job_index: int, page_url: str) -> list[str]:
+        """listing_id of every row staged for one page, in page order."""
+        with self._db_lock:
+            found = self._con.execute(
+                "SELECT listing_id FROM staged_rows WHERE job_index = ? AND page_url = ? ORDER BY row_index",
+                (job_index, page_url),
+            ).fetchall()
+        return [r[0] for r in found]
+
+    def staged_counts(self) -> tuple[int, int]:
+        """(checkpointed pages, staged rows) committed so far."""
+        with self._db_lock:
+            pages = self._con.execute("SELECT COUNT(*) FROM staged_pages").fetchone()[0]
+            rows = self._con.execute("SELECT COUNT(*) FROM staged_rows").fetchone()[0]
+        return pages, rows
+
+    def discard(self, job_index: int) -> None:
+        """Drop everything staged under ``job_index``, e.g. rows a resumed run is about to stage again."""
+        self.flush()
+        with self._db_lock:
+            self._con.execute("DELETE FROM staged_rows WHERE job_index = ?", (job_index,))
+            self._con.execute("DELETE FROM staged_pages WHERE job_index = ?", (job_index,))
+            self._con.commit()
+
+    def seen_keys(self) -> set[tuple[str, str]]:
+        """(sub_category, listing_id) of every staged row, noisy ones included."""
+        self.flush()
+        with self._db_lock:
+            return set(self._con.execute("SELECT DISTINCT sub_category, listing_id FROM staged_rows"))
+
+    def publish(self) -> int:
+        """Build ``published`` from the staged rows; returns its row count.
+
+        Noisy rows are dropped, then the first row in crawl order wins among
+        rows sharing sub_category, area, price and layout (cross-posted
+        listings), and again among rows sharing sub_category, listing_id and
+        detail_url. How many rows each step dropped ends up in ``publish_stats``.
+        """
+        self.flush()
+        order = ", ".join(ORDER_COLUMNS)
+        cols = ", ".join(self.columns)
+        with self._db_lock:
+            self._con.execute("DROP TABLE IF EXISTS published")
+            self._con.execute(
+                f"""
+                CREATE TABLE published AS
+                WITH ranked AS (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY sub_category, {', '.join(DEDUPE_COLUMNS)} ORDER BY {order}
+                    ) AS dupe_rank
+                    FROM staged_rows
+                    WHERE noisy = 0
+                ),
+                kept AS (
+                    SELECT *, ROW_NUMBER() OVER (
+                        PARTITION BY sub_category, listing_id, detail_url ORDER BY {order}
+                    ) AS key_rank
+                    FROM ranked
+                    WHERE dupe_rank = 1
+                )
+                SELECT {cols} FROM kept WHERE key_rank = 1 ORDER BY {order}
+                """
+            )
+            self._con.commit()
+            staged, noisy = self._con.execute("SELECT COUNT(*), COALESCE(SUM(noisy), 0) FROM staged_rows").fetchone()
+            # GROUP BY, like PARTITION BY, puts NULL keys together.
+            distinct = self._con.execute(
+                f"SELECT COUNT(*) FROM (SELECT 1 FROM staged_rows WHERE noisy = 0 "
+                f"GROUP BY sub_category, {', '.join(DEDUPE_COLUMNS)})"
+            ).fetchone()[0]
+            published = self._con.execute("SELECT COUNT(*) FROM published").fetchone()[0]
+        self.publish_stats = {
+            "staged": staged,
+            "noisy": noisy,
+            "cross_posted": staged - noisy - distinct,
+            "duplicate_keys": distinct - published,
+            "published": published,
+        }
+        return published
+
+    def published_chunks(
+        self, leading: dict[str, str] | None = None, chunk_rows: int = PUBLISH_CHUNK_ROWS
+    ) -> Iterator[pd.DataFrame]:
+        """Published rows in order, ``chunk_rows`` at a time, with ``leading`` constant columns first.
+
+        Called once the crawl is over, so it reads without taking the write
+        lock. Always yields at least one (possibly empty) frame, so writers
+        see the columns.
+        """
+        leading = leading or {}
+        select = ", ".join([*(f"? AS {c}" for c in leading), *self.columns])
+        chunks = pd.read_sql_query(
+            f"SELECT {select} FROM published ORDER BY rowid",
+            self._con,
+            params=list(leading.values()),
+            chunksize=chunk_rows,
+        )
+        empty = True
+        for chunk in chunks:
+            empty = False
+            yield chunk
+        if empty:
+            yield pd.DataFrame(columns=[*leading, *self.columns])
+
+    def close(self, remove: bool = True) -> None:
+        """Close the scratch database; ``remove=False`` keeps it, e.g. after a failed run."""
+        with self._db_lock:
+            self._con.close()
+        if remove:
+            self.path.unlink(missing_ok=True)
@@ -0,0 +1,863 @@
+﻿"""SQLite storage of listing snapshots as change intervals.
+
+A listing is stored once in ``listing_dim``; every distinct state of its
+attributes is stored once in ``listing_versions`` together with the first
+and last run_date (``valid_from``/``valid_to``) of an unbroken stretch of
+runs in which it was observed unchanged. ``listings`` is a view that
+expands these intervals over ``runs`` and returns exactly the rows of the
+former one-row-per-listing-per-run table, so readers keep querying
+``listings`` as before.
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import hashlib
+import json
+import math
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+from listing_extract import DETAIL_COLUMNS, detail_fields_batch
+from listing_aggregates import ensure_aggregate_schema, has_aggregates, refresh_aggregates, walk_bucket_sql
+from listing_enrichment import ensure_enrichment_schema
+from listing_events import ensure_event_schema, refresh_events
+from listing_identity import clear_identity, ensure_identity_schema, update_identity
+
+JST = ZoneInfo("Asia/Tokyo")
+
+KEY_COLUMNS = ["sub_category", "listing_id"]
+VERSION_COLUMNS = [
+    "title",
+    "address",
+    "price_text",
+    "price_yen",
+    "area_sqm",
+    "area_tsubo",
+    "unit_price_per_sqm",
+    "unit_price_per_tsubo",
+    "layout_text",
+    "detail_text",
+    "detail_url",
+    *DETAIL_COLUMNS,
+    "station",
+]
+# Filled in for rows stored before the column existed; see ``backfill_versions``.
+BACKFILLED_COLUMNS = [*DETAIL_COLUMNS, "station"]
+# Every run before stations became configurable crawled only this station.
+LEGACY_STATION = "奥沢"
+REAL_COLUMNS = {
+    "price_yen",
+    "area_sqm",
+    "area_tsubo",
+    "unit_price_per_sqm",
+    "unit_price_per_tsubo",
+    "walk_minutes",
+    "land_area_sqm",
+    "building_area_sqm",
+    "coverage_ratio",
+    "floor_area_ratio",
+}
+# In-memory schema of listing frames (``typed_frame``): text that repeats across
+# rows becomes categoricals and run_date a datetime. The integer-valued
+# measurements fit float32 exactly; prices, areas and unit prices stay float64
+# so sums and written values do not change.
+CATEGORY_COLUMNS = ["category", "sub_category", "station", "address", "layout_text", "station_text", "fetched_at"]
+FLOAT32_COLUMNS = ["walk_minutes", "coverage_ratio", "floor_area_ratio"]
+# Long per-listing text that only row-level tables show; loaders leave it out unless asked.
+HEAVY_COLUMNS = ["detail_text", "detail_url"]
+# Column order of the former ``listings`` table, which the view reproduces.
+SNAPSHOT_COLUMNS = ["run_date", "category", "sub_category", "listing_id", *VERSION_COLUMNS]
+# The rebuild writes a scratch file that is discarded on failure, so it needs no journal or fsync.
+REBUILD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA locking_mode = EXCLUSIVE",
+]
+# What a rebuild cannot derive from data/history and copies from the database it replaces.
+PRESERVED_RUN_COLUMNS = ["full_refresh", "partial_refresh"]
+PRESERVED_TABLES = ["run_metrics", "listing_enrichment"]
+# Columns of a history browser page (``browse_versions``), in display order.
+BROWSE_COLUMNS = [
+    "valid_from",
+    "valid_to",
+    "sub_category",
+    "listing_id",
+    "title",
+    "address",
+    "price_text",
+    "price_yen",
+    "area_sqm",
+    "layout_text",
+    "station",
+    "walk_minutes",
+    "detail_url",
+]
+# Sortable column -> the ``listing_versions`` index columns it orders by, so the index yields rows in order.
+BROWSE_SORTS = {
+    "valid_to": ["valid_to", "valid_from"],
+    "valid_from": ["valid_from", "valid_to"],
+    "price_yen": ["price_yen"],
+    "area_sqm": ["area_sqm"],
+}
+
+
+def _column_sql(col: str) -> str:
+    return f"{col} {'REAL' if col in REAL_COLUMNS else 'TEXT'}"
+
+
+def _view_sql() -> str:
+    cols = ",\n       ".join(f"v.{c} AS {c}" for c in VERSION_COLUMNS)
+    return f"""
+CREATE VIEW listings AS
+SELECT r.run_date AS run_date,
+       d.category AS category,
+       d.sub_category AS sub_category,
+       d.listing_id AS listing_id,
+       {cols}
+FROM listing_versions v
+JOIN listing_dim d ON d.listing_key = v.listing_key
+JOIN runs r ON r.run_date >= v.valid_from AND r.run_date <= v.valid_to
+"""
+
+
+def object_type(con: sqlite3.Connection, name: str) -> str | None:
+    row = con.execute("SELECT type FROM sqlite_master WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def create_indexes(con: sqlite3.Connection) -> None:
+    con.execute("CREATE INDEX IF NOT EXISTS idx_versions_range ON listing_versions(valid_from, valid_to)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_versions_key_to ON listing_versions(listing_key, valid_to)")
+    # Covers the dashboard's per-address tsubo price aggregates without touching version rows.
+    con.execute(
+        "CREATE INDEX IF NOT EXISTS idx_versions_tsubo "
+        "ON listing_versions(listing_key, valid_from, valid_to, address, unit_price_per_tsubo) "
+        "WHERE unit_price_per_tsubo IS NOT NULL"
+    )
+    # History browser: date-range overlap plus the sortable/range-filtered columns.
+    con.execute("CREATE INDEX IF NOT EXISTS idx_versions_to ON listing_versions(valid_to, valid_from)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_versions_price ON listing_versions(price_yen)")
+    con.execute("CREATE INDEX IF NOT EXISTS idx_versions_area ON listing_versions(area_sqm)")
+
+
+def ensure_schema(con: sqlite3.Connection, indexes: bool = True) -> None:
+    """Create the interval schema, migrating a legacy ``listings`` table in place.
+
+    ``indexes=False`` leaves out the ``listing_versions`` indexes, for a bulk
+    load that calls ``create_indexes`` once the rows are in.
+    """
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_date TEXT PRIMARY KEY,
+            total_records INTEGER NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    run_cols = {row[1] for row in con.execute("PRAGMA table_info(runs)").fetchall()}
+    if "full_refresh" not in run_cols:
+        con.execute("ALTER TABLE runs ADD COLUMN full_refresh TEXT")
+    if "partial_refresh" not in run_cols:
+        con.execute("ALTER TABLE runs ADD COLUMN partial_refresh TEXT")
+
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS listing_dim (
+            listing_key INTEGER PRIMARY KEY,
+            category TEXT NOT NULL,
+            sub_category TEXT NOT NULL,
+            listing_id TEXT,
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL,
+            UNIQUE (sub_category, listing_id)
+        )
+        """
+    )
+    version_cols = ",\n            ".join(_column_sql(c) for c in VERSION_COLUMNS)
+    con.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS listing_versions (
+            listing_key INTEGER NOT NULL REFERENCES listing_dim(listing_key),
+            valid_from TEXT NOT NULL,
+            valid_to TEXT NOT NULL,
+            content_hash TEXT NOT NULL,
+            {version_cols},
+            PRIMARY KEY (listing_key, valid_from)
+        )
+        """
+    )
+    existing = {row[1] for row in con.execute("PRAGMA table_info(listing_versions)").fetchall()}
+    added = [c for c in VERSION_COLUMNS if c not in existing]
+    for c in added:
+        con.execute(f"ALTER TABLE listing_versions ADD COLUMN {_column_sql(c)}")
+    if added:
+        backfill_versions(con)
+    if indexes:
+        create_indexes(con)
+
+    new_identity = object_type(con, "properties") is None
+    ensure_identity_schema(con)
+    # Backfilled columns change the walk minutes the aggregates are bucketed by.
+    stale_aggregates = ensure_aggregate_schema(con) or bool(added)
+    stale_events = ensure_event_schema(con) or bool(added)
+
+    kind = object_type(con, "listings")
+    if kind == "table":
+        migrate_legacy_table(con)
+        ensure_enrichment_schema(con)
+        refresh_aggregates(con)
+        refresh_events(con)
+        return
+    if kind == "view":
+        view_cols = [row[1] for row in con.execute("PRAGMA table_info(listings)").fetchall()]
+        if view_cols != SNAPSHOT_COLUMNS:
+            con.execute("DROP VIEW listings")
+            con.execute(_view_sql())
+    else:
+        con.execute(_view_sql())
+    ensure_enrichment_schema(con)
+    if new_identity:
+        update_identity(con)
+    if stale_aggregates:
+        refresh_aggregates(con)
+    if stale_events:
+        refresh_events(con)
+
+
+def backfill_versions(con: sqlite3.Connection) -> int:
+    """Fill ``BACKFILLED_COLUMNS`` and re-hash every version.
+
+    Detail columns are derived from ``detail_text``; a missing station is
+    ``LEGACY_STATION``.
+
+    The content hash covers all version columns, so it is recomputed too;
+    otherwise the next run would see every listing as changed.
+    """
+    cols = ", ".join(VERSION_COLUMNS)
+    rows = con.execute(f"SELECT listing_key, valid_from, {cols} FROM listing_versions").fetchall()
+    if not rows:
+        return 0
+    frame = pd.DataFrame([r[2:] for r in rows], columns=VERSION_COLUMNS)
+    fields = detail_fields_batch(frame["detail_text"])
+    frame[DETAIL_COLUMNS] = fields[DETAIL_COLUMNS]
+    frame["station"] = frame["station"].fillna(LEGACY_STATION)
+    updates = []
+    for (key, valid_from, *_), values in zip(rows, frame.astype(object).itertuples(index=False, name=None)):
+        values = [_clean(c, v) for c, v in zip(VERSION_COLUMNS, values)]
+        updates.append([content_hash(values), *values[-len(BACKFILLED_COLUMNS) :], key, valid_from])
+    assignments = ", ".join(f"{c} = ?" for c in BACKFILLED_COLUMNS)
+    con.executemany(
+        f"UPDATE listing_versions SET content_hash = ?, {assignments} WHERE listing_key = ? AND valid_from = ?",
+        updates,
+    )
+    return len(updates)
+
+
+def _clean(col: str, value: object) -> object:
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if col in REAL_COLUMNS:
+        return float(value)
+    if isinstance(value, float) and value.is_integer():
+        # Text columns read back from CSV as numbers (e.g. listing_id).
+        return str(int(value))
+    return str(value)
+
+
+def with_detail_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of ``df`` with any missing ``DETAIL_COLUMNS`` derived from ``detail_text``."""
+    frame = df.copy()
+    missing = [c for c in DETAIL_COLUMNS if c not in frame.columns]
+    if missing and "detail_text" in frame.columns:
+        fields = detail_fields_batch(frame["detail_text"])
+        for c in missing:
+            frame[c] = fields[c]
+    return frame
+
+
+def with_station(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of ``df`` with ``station`` set to ``LEGACY_STATION`` where it is missing."""
+    frame = df.copy()
+    if "station" not in frame.columns:
+        frame["station"] = LEGACY_STATION
+    else:
+        frame["station"] = frame["station"].where(frame["station"].notna() & (frame["station"] != ""), LEGACY_STATION)
+    return frame
+
+
+def typed_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Convert the columns of ``df`` that the shared listing schema covers, in place; returns ``df``.
+
+    Categories are kept sorted, so sorting and grouping order by value as
+    they did on plain strings. Group categorical frames with ``observed=True``.
+    """
+    for c in CATEGORY_COLUMNS:
+        if c in df.columns:
+            col = df[c] if isinstance(df[c].dtype, pd.CategoricalDtype) else df[c].astype("category")
+            df[c] = col.cat.reorder_categories(sorted(col.cat.categories))
+    for c in FLOAT32_COLUMNS:
+        if c in df.columns:
+            df[c] = pd.to_numeric(df[c], errors="coerce").astype("float32")
+    if "run_date" in df.columns:
+        df["run_date"] = pd.to_datetime(df["run_date"])
+    return df
+
+
+def _records(df: pd.DataFrame) -> list[tuple[str, str, object, list[object]]]:
+    """(category, sub_category, listing_id, version values) per snapshot row."""
+    frame = with_station(with_detail_columns(df))
+    for col in ["category", *KEY_COLUMNS, *VERSION_COLUMNS]:
+        if col not in frame.columns:
+            frame[col] = None
+    frame = frame[["category", *KEY_COLUMNS, *VERSION_COLUMNS]].astype(object)
+    out = []
+    for rec in frame.itertuples(index=False, name=None):
+        category, sub_category, listing_id, *values = rec
+        values = [_clean(c, v) for c, v in zip(VERSION_COLUMNS, values)]
+        out.append((str(category), str(sub_category), _clean("listing_id", listing_id), values))
+    return out
+
+
+def content_hash(values: list[object]) -> str:
+    payload = json.dumps(values, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def hashed_records(df: pd.DataFrame) -> list[tuple[str, str, object, list[object], str]]:
+    """``_records`` with each row's ``content_hash`` appended."""
+    return [(c, s, i, values, content_hash(values)) for c, s, i, values in _records(df)]
+
+
+def _neighbours(con: sqlite3.Connection, run_date: str) -> tuple[str | None, str | None]:
+    prev = con.execute("SELECT MAX(run_date) FROM runs WHERE run_date < ?", (run_date,)).fetchone()[0]
+    nxt = con.execute("SELECT MIN(run_date) FROM runs WHERE run_date > ?", (run_date,)).fetchone()[0]
+    return prev, nxt
+
+
+def _carve_out(con: sqlite3.Connection, run_date: str, prev: str | None, nxt: str | None) -> set[int]:
+    """Remove ``run_date`` from every interval covering it; returns touched keys."""
+    covering = con.execute(
+        "SELECT listing_key, valid_from, valid_to FROM listing_versions WHERE valid_from <= ? AND valid_to >= ?",
+        (run_date, run_date),
+    ).fetchall()
+    cols = ", ".join(["content_hash", *VERSION_COLUMNS])
+    for key, vf, vt in covering:
+        if vf == run_date and vt == run_date:
+            con.execute("DELETE FROM listing_versions WHERE listing_key = ? AND valid_from = ?", (key, vf))
+        elif vf == run_date:
+            con.execute(
+                "UPDATE listing_versions SET valid_from = ? WHERE listing_key = ? AND valid_from = ?", (nxt, key, vf)
+            )
+        elif vt == run_date:
+            con.execute(
+                "UPDATE listing_versions SET valid_to = ? WHERE listing_key = ? AND valid_from = ?", (prev, key, vf)
+            )
+        else:
+            con.execute(
+                f"INSERT INTO listing_versions(listing_key, valid_from, valid_to, {cols}) "
+                f"SELECT listing_key, ?, valid_to, {cols} FROM listing_versions WHERE listing_key = ? AND valid_from = ?",
+                (nxt, key, vf),
+            )
+            con.execute(
+                "UPDATE listing_versions SET valid_to = ? WHERE listing_key = ? AND valid_from = ?", (prev, key, vf)
+            )
+    return {key for key, _, _ in covering}
+
+
+def _refresh_dim(con: sqlite3.Connection, keys: Iterable[int]) -> None:
+    for key in keys:
+        first, last = con.execute(
+            "SELECT MIN(valid_from), MAX(valid_to) FROM listing_versions WHERE listing_key = ?", (key,)
+        ).fetchone()
+        if first is None:
+            con.execute("DELETE FROM listing_dim WHERE listing_key = ?", (key,))
+        else:
+            con.execute(
+                "UPDATE listing_dim SET first_seen = ?, last_seen = ? WHERE listing_key = ?", (first, last, key)
+            )
+
+
+def upsert_run(con: sqlite3.Connection, run_date: str, df: pd.DataFrame) -> None:
+    """Make the ``listings`` view return exactly ``df`` for ``run_date``.
+
+    Works for the next daily run as well as for re-runs and back-filled
+    dates between existing runs: the date is first cut out of every interval
+    covering it, then each row extends the version ending at the previous run
+    and/or starting at the next run when its content is unchanged. The
+    caller records ``run_date`` in ``runs``.
+    """
+    upsert_run_chunks(con, run_date, [df])
+
+
+def upsert_run_chunks(con: sqlite3.Connection, run_date: str, chunks: Iterable[pd.DataFrame]) -> int:
+    """``upsert_run`` for a run delivered in chunks; returns the number of rows."""
+    prev, nxt = _neighbours(con, run_date)
+    touched = _carve_out(con, run_date, prev, nxt)
+
+    dim = {(sub, lid): key for key, sub, lid in con.execute("SELECT listing_key, sub_category, listing_id FROM listing_dim")}
+    placeholders = ", ".join("?" for _ in range(4 + len(VERSION_COLUMNS)))
+    insert_sql = (
+        f"INSERT INTO listing_versions(listing_key, valid_from, valid_to, content_hash, {', '.join(VERSION_COLUMNS)}) "
+        f"VALUES({placeholders})"
+    )
+    rows = 0
+    for category, sub_category, listing_id, values in (rec for df in chunks for rec in _records(df)):
+        rows += 1
+        key = dim.get((sub_category, listing_id))
+        if key is None:
+            cur = con.execute(
+                "INSERT INTO listing_dim(category, sub_category, listing_id, first_seen, last_seen) VALUES(?,?,?,?,?)",
+                (category, sub_category, listing_id, run_date, run_date),
+            )
+            key = dim[(sub_category, listing_id)] = cur.lastrowid
+        touched.add(key)
+        h = content_hash(values)
+        before = None
+        if prev is not None:
+            before = con.execute(
+                "SELECT valid_from FROM listing_versions WHERE listing_key = ? AND valid_to = ? AND content_hash = ?",
+                (key, prev, h),
+            ).fetchone()
+        after = None
+        if nxt is not None:
+            after = con.execute(
+                "SELECT valid_to FROM listing_versions WHERE listing_key = ? AND valid_from = ? AND content_hash = ?",
+                (key, nxt, h),
+            ).fetchone()
+        if before and after:
+            con.execute("DELETE FROM listing_versions WHERE listing_key = ? AND valid_from = ?", (key, nxt))
+            con.execute(
+                "UPDATE listing_versions SET valid_to = ? WHERE listing_key = ? AND valid_from = ?",
+                (after[0], key, before[0]),
+            )
+        elif before:
+            con.execute(
+                "UPDATE listing_versions SET valid_to = ? WHERE listing_key = ? AND valid_from = ?",
+                (run_date, key, before[0]),
+            )
+        elif after:
+            con.execute(
+                "UPDATE listing_versions SET valid_from = ? WHERE listing_key = ? AND valid_from = ?",
+                (run_date, key, nxt),
+            )
+        else:
+            con.execute(insert_sql, (key, run_date, run_date, h, *values))
+    _refresh_dim(con, touched)
+    return rows
+
+
+def build_versions(
+    snapshots: Iterable[tuple[str, pd.DataFrame]],
+) -> tuple[list[tuple], list[list]]:
+    """Fold date-ordered snapshots into (dim rows, version rows) in one pass.
+
+    ``snapshots`` must include every run, empty ones too, in run_date order:
+    a listing missing from a run ends its interval there.
+    """
+    return fold_versions((run_date, hashed_records(df)) for run_date, df in snapshots)
+
+
+def fold_versions(
+    snapshots: Iterable[tuple[str, list[tuple[str, str, object, list[object], str]]]],
+) -> tuple[list[tuple], list[list]]:
+    """``build_versions`` over snapshots already turned into ``hashed_records``."""
+    dim: dict[tuple[str, object], list] = {}
+    versions: list[list] = []
+    open_versions: dict[int, int] = {}
+    for run_date, records in snapshots:
+        still_open: dict[int, int] = {}
+        for category, sub_category, listing_id, values, h in records:
+            entry = dim.get((sub_category, listing_id))
+            if entry is None:
+                entry = dim[(sub_category, listing_id)] = [len(dim) + 1, category, sub_category, listing_id, run_date, run_date]
+            key = entry[0]
+            entry[5] = run_date
+            i = open_versions.get(key)
+            if i is not None and versions[i][3] == h:
+                versions[i][2] = run_date
+            else:
+                versions.append([key, run_date, run_date, h, *values])
+                i = len(versions) - 1
+            still_open[key] = i
+        open_versions = still_open
+    return [tuple(v) for v in dim.values()], versions
+
+
+def bulk_load(con: sqlite3.Connection, snapshots: Iterable[tuple[str, pd.DataFrame]]) -> tuple[int, int]:
+    """Replace all listing data with ``snapshots``; returns (listings, versions)."""
+    dim_rows, version_rows = build_versions(snapshots)
+    clear_identity(con)
+    con.execute("DELETE FROM listing_versions")
+    con.execute("DELETE FROM listing_dim")
+    _insert_versions(con, dim_rows, version_rows)
+    update_identity(con)
+    return len(dim_rows), len(version_rows)
+
+
+def _insert_versions(con: sqlite3.Connection, dim_rows: list[tuple], version_rows: list[list]) -> None:
+    con.executemany(
+        "INSERT INTO listing_dim(listing_key, category, sub_category, listing_id, first_seen, last_seen) "
+        "VALUES(?,?,?,?,?,?)",
+        dim_rows,
+    )
+    placeholders = ", ".join("?" for _ in range(4 + len(VERSION_COLUMNS)))
+    con.executemany(
+        f"INSERT INTO listing_versions(listing_key, valid_from, valid_to, content_hash, {', '.join(VERSION_COLUMNS)}) "
+        f"VALUES({placeholders})",
+        version_rows,
+    )
+
+
+def migrate_legacy_table(con: sqlite3.Connection) -> tuple[int, int]:
+    """Convert a one-row-per-listing-per-run ``listings`` table to intervals."""
+    con.execute("ALTER TABLE listings RENAME TO listings_legacy")
+    legacy_cols = {row[1] for row in con.execute("PRAGMA table_info(listings_legacy)").fetchall()}
+    # Older databases predate the numeric columns; those read back as NULL.
+    # Backfilled columns are left out so ``_records`` fills them in.
+    select = ", ".join(
+        c if c in legacy_cols else f"NULL AS {c}"
+        for c in SNAPSHOT_COLUMNS
+        if c in legacy_cols or c not in BACKFILLED_COLUMNS
+    )
+    counts = dict(con.execute("SELECT run_date, COUNT(*) FROM listings_legacy GROUP BY run_date").fetchall())
+    now = dt.datetime.now(tz=JST).isoformat(timespec="seconds")
+    con.executemany(
+        "INSERT OR IGNORE INTO runs(run_date, total_records, updated_at) VALUES(?,?,?)",
+        [(d, n, now) for d, n in counts.items()],
+    )
+    dates = [row[0] for row in con.execute("SELECT run_date FROM runs ORDER BY run_date")]
+
+    def snapshots() -> Iterable[tuple[str, pd.DataFrame]]:
+        for d in dates:
+            yield d, pd.read_sql_query(
+                f"SELECT {select} FROM listings_legacy WHERE run_date = ? ORDER BY rowid", con, params=(d,)
+            )
+
+    result = bulk_load(con, snapshots())
+    con.execute("DROP TABLE listings_legacy")
+    con.execute(_view_sql())
+    return result
+
+
+def read_history_csv(path: Path) -> pd.DataFrame:
+    """Read a history snapshot with text columns kept as text."""
+    text_cols = ["run_date", "fetched_at", "category", *KEY_COLUMNS, *(c for c in VERSION_COLUMNS if c not in REAL_COLUMNS)]
+    df = pd.read_csv(
+        path,
+        encoding="utf-8-sig",
+        dtype={c: str for c in text_cols},
+        keep_default_na=False,
+        na_values={c: [""] for c in REAL_COLUMNS},
+        float_precision="round_trip",
+    )
+    for c in df.columns:
+        if c in REAL_COLUMNS:
+            df[c] = pd.to_numeric(df[c], errors="coerce")
+    return with_station(with_detail_columns(df))
+
+
+def migrate_from_history(
+    history_dir: Path, sqlite_path: Path, parquet_dir: Path | None = None
+) -> tuple[int, int]:
+    """Build the interval schema from the history snapshots; returns (listings, versions)."""
+    _, listings, versions = rebuild_from_history(history_dir, sqlite_path, parquet_dir=parquet_dir)
+    return listings, versions
+
+
+def _history_sources(history_dir: Path, parquet_dir: Path | None) -> list[Path | tuple[Path, str]]:
+    """One source per run in date order: its CSV, else ``(parquet_dir, run_date)``."""
+    sources: dict[str, Path | tuple[Path, str]] = {}
+    if parquet_dir is not None and parquet_dir.exists():
+        # history_store imports this module, so it can only be imported lazily.
+        from history_store import run_dates
+
+        sources = {run_date: (parquet_dir, run_date) for run_date in run_dates(parquet_dir)}
+    for path in history_dir.glob("listings_*.csv"):
+        stamp = path.stem.removeprefix("listings_")
+        sources[f"{stamp[:4]}-{stamp[4:6]}-{stamp[6:]}"] = path
+    return [sources[run_date] for run_date in sorted(sources)]
+
+
+def _load_snapshot(source: Path | tuple[Path, str]) -> tuple[str, str, int, list[tuple]] | None:
+    """(run_date, fetched_at, rows, hashed records) of one history run, ``None`` when it is empty."""
+    if isinstance(source, tuple):
+        from history_store import read_history
+
+        root, run_date = source
+        df = with_station(with_detail_columns(read_history(root, start=run_date, end=run_date)))
+    else:
+        df = read_history_csv(source)
+    if df.empty:
+        return None
+    return str(df["run_date"].iloc[0]), str(df["fetched_at"].iloc[0]), len(df), hashed_records(df)
+
+
+def _carry_over(con: sqlite3.Connection, old_path: Path) -> None:
+    """Copy ``PRESERVED_RUN_COLUMNS`` and ``PRESERVED_TABLES`` from the database being replaced."""
+    con.execute("ATTACH DATABASE ? AS old", (str(old_path),))
+    try:
+        old_run_cols = {row[1] for row in con.execute("PRAGMA old.table_info(runs)").fetchall()}
+        for col in PRESERVED_RUN_COLUMNS:
+            if col in old_run_cols:
+                con.execute(f"UPDATE runs SET {col} = (SELECT o.{col} FROM old.runs o WHERE o.run_date = runs.run_date)")
+        for table in PRESERVED_TABLES:
+            found = con.execute("SELECT sql FROM old.sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+            if found:
+                if object_type(con, table) is None:
+                    con.execute(found[0])
+                cols = ", ".join(row[1] for row in con.execute(f"PRAGMA old.table_info({table})").fetchall())
+                con.execute(f"INSERT INTO main.{table}({cols}) SELECT {cols} FROM old.{table}")
+        con.commit()
+    finally:
+        con.execute("DETACH DATABASE old")
+
+
+def rebuild_from_history(
+    history_dir: Path, sqlite_path: Path, workers: int | None = None, parquet_dir: Path | None = None
+) -> tuple[int, int, int]:
+    """Rebuild ``sqlite_path`` from every history run in one bulk load; returns (runs, listings, versions).
+
+    Runs come from the history CSVs plus, when ``parquet_dir`` is given,
+    the Parquet store (a run with both uses its CSV). CSVs of any column
+    layout ``read_history_csv`` accepts are parsed and hashed in ``workers`` processes (default: CPU count, ``1`` loads in this
+    process) while this process folds them into intervals in date order.
+    The new database is written to a scratch file with ``REBUILD_PRAGMAS``,
+    its indexes are created after the rows are in, and it replaces the old
+    one only once complete.
+    """
+    paths = _history_sources(history_dir, parquet_dir)
+    sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = sqlite_path.with_name(sqlite_path.name + ".rebuild")
+    tmp.unlink(missing_ok=True)
+    runs: list[tuple[str, int, str]] = []
+
+    def snapshots(loaded: Iterable[tuple[str, str, int, list[tuple]] | None]) -> Iterable[tuple[str, list[tuple]]]:
+        for snapshot in loaded:
+            if snapshot is None:
+                continue
+            run_date, fetched_at, rows, records = snapshot
+            runs.append((run_date, rows, fetched_at))
+            yield run_date, records
+
+    con = sqlite3.connect(tmp)
+    try:
+        for pragma in REBUILD_PRAGMAS:
+            con.execute(pragma)
+        ensure_schema(con, indexes=False)
+        if workers == 1:
+            dim_rows, version_rows = fold_versions(snapshots(map(_load_snapshot, paths)))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                dim_rows, version_rows = fold_versions(snapshots(pool.map(_load_snapshot, paths, chunksize=4)))
+        con.executemany("INSERT INTO runs(run_date, total_records, updated_at) VALUES(?,?,?)", runs)
+        _insert_versions(con, dim_rows, version_rows)
+        create_indexes(con)
+        update_identity(con)
+        refresh_aggregates(con)
+        refresh_events(con)
+        con.commit()
+        if sqlite_path.exists():
+            _carry_over(con, sqlite_path)
+    except BaseException:
+        con.close()
+        tmp.unlink(missing_ok=True)
+        raise
+    con.close()
+    tmp.replace(sqlite_path)
+    return len(runs), len(dim_rows), len(version_rows)
+
+
+def save_sqlite(
+    df: pd.DataFrame, sqlite_path: Path, run_date: str, refresh: dict[str, str] | None = None
+) -> None:
+    save_sqlite_chunks([df], sqlite_path, run_date, refresh)
+
+
+def save_sqlite_chunks(
+    chunks: Iterable[pd.DataFrame], sqlite_path: Path, run_date: str, refresh: dict[str, str] | None = None
+) -> None:
+    sqlite_path.parent.mkdir(parents=True, exist_ok=True)
+    con = sqlite3.connect(sqlite_path)
+    try:
+        ensure_schema(con)
+        total = upsert_run_chunks(con, run_date, chunks)
+        update_identity(con)
+
+        # Comma-separated category keys; NULL means every category was crawled in full.
+        full = partial = None
+        if refresh is not None:
+            full = ",".join(c for c, mode in refresh.items() if mode == "full")
+            partial = ",".join(c for c, mode in refresh.items() if mode == "partial")
+        con.execute(
+            "INSERT OR REPLACE INTO runs(run_date,total_records,updated_at,full_refresh,partial_refresh) "
+            "VALUES(?,?,?,?,?)",
+            (run_date, total, dt.datetime.now(tz=JST).isoformat(timespec="seconds"), full, partial),
+        )
+        # Other dates' rows are unchanged even when run_date lands between existing runs.
+        refresh_aggregates(con, [run_date])
+        # Events compare with the previous run, so a run_date landing before another run changes that run's too.
+        _, nxt = _neighbours(con, run_date)
+        refresh_events(con, [run_date] if nxt is None else [run_date, nxt])
+        con.commit()
+    finally:
+        con.close()
+
+
+def tsubo_price_by_address(con: sqlite3.Connection, sub_categories: Iterable[str]) -> pd.DataFrame:
+    """Sum and count of ``unit_price_per_tsubo`` per run_date, sub_category and address.
+
+    Sums and counts (not means) are returned so callers can merge addresses
+    that share a display label and still get exact means. They are read
+    from ``price_by_address``; a database that predates it (opened read-only
+    by the dashboard) is aggregated from ``listings`` instead.
+    """
+    subs = list(sub_categories)
+    if not subs:
+        return pd.DataFrame(columns=["run_date", "sub_category", "address", "price_sum", "price_count"])
+    marks = ",".join("?" for _ in subs)
+    if not has_aggregates(con, "price_by_address"):
+        sql = f"""
+            SELECT run_date, sub_category, address,
+                   SUM(unit_price_per_tsubo) AS price_sum, COUNT(*) AS price_count
+            FROM listings
+            WHERE sub_category IN ({marks}) AND unit_price_per_tsubo IS NOT NULL
+            GROUP BY run_date, sub_category, address
+            ORDER BY run_date
+            """
+    else:
+        sql = f"""
+            SELECT run_date, sub_category, address, total AS price_sum, n AS price_count
+            FROM price_by_address
+            WHERE sub_category IN ({marks}) AND measure = 'unit_price_per_tsubo'
+            ORDER BY run_date
+            """
+    return pd.read_sql_query(sql, con, params=subs)
+
+
+def tsubo_price_by_walk(con: sqlite3.Connection, sub_category: str, address_like: str = "%") -> pd.DataFrame:
+    """Like ``tsubo_price_by_address`` for one sub_category, also split by ``walk_bucket`` (see ``walk_bucket_sql``).
+
+    Grouped from ``listings`` on every call: the chart covers one
+    sub_category and area, which ``idx_versions_tsubo`` keeps cheap.
+    """
+    sql = f"""
+        SELECT run_date, address, {walk_bucket_sql()} AS walk_bucket,
+               SUM(unit_price_per_tsubo) AS price_sum, COUNT(*) AS price_count
+        FROM listings
+        WHERE sub_category = ? AND address LIKE ? AND unit_price_per_tsubo IS NOT NULL AND walk_minutes IS NOT NULL
+        GROUP BY run_date, address, walk_bucket
+        ORDER BY run_date
+        """
+    return pd.read_sql_query(sql, con, params=(sub_category, address_like))
+
+
+@dataclass(frozen=True)
+class BrowseFilter:
+    """Conditions of the history browser; an empty or ``None`` field does not restrict.
+
+    ``address`` matches as a substring. A version falls in the date range
+    when its ``valid_from``..``valid_to`` interval overlaps ``start``..``end``.
+    """
+
+    sub_categories: tuple[str, ...] = ()
+    address: str = ""
+    price_min: float | None = None
+    price_max: float | None = None
+    area_min: float | None = None
+    area_max: float | None = None
+    start: str | None = None
+    end: str | None = None
+
+
+def _browse_where(flt: BrowseFilter) -> tuple[str, list[object]]:
+    clauses: list[str] = []
+    params: list[object] = []
+    if flt.sub_categories:
+        clauses.append(f"d.sub_category IN ({','.join('?' for _ in flt.sub_categories)})")
+        params.extend(flt.sub_categories)
+    if flt.address:
+        escaped = flt.address.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        clauses.append("v.address LIKE ? ESCAPE '\\'")
+        params.append(f"%{escaped}%")
+    for col, low, high in (("price_yen", flt.price_min, flt.price_max), ("area_sqm", flt.area_min, flt.area_max)):
+        if low is not None:
+            clauses.append(f"v.{col} >= ?")
+            params.append(low)
+        if high is not None:
+            clauses.append(f"v.{col} <= ?")
+            params.append(high)
+    if flt.start is not None:
+        clauses.append("v.valid_to >= ?")
+        params.append(str(flt.start))
+    if flt.end is not None:
+        clauses.append("v.valid_from <= ?")
+        params.append(str(flt.end))
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def count_versions(con: sqlite3.Connection, flt: BrowseFilter) -> int:
+    """Number of ``listing_versions`` rows matching ``flt``."""
+    where, params = _browse_where(flt)
+    sql = f"SELECT COUNT(*) FROM listing_versions v JOIN listing_dim d ON d.listing_key = v.listing_key{where}"
+    return con.execute(sql, params).fetchone()[0]
+
+
+def browse_versions(
+    con: sqlite3.Connection,
+    flt: BrowseFilter,
+    sort: str = "valid_to",
+    descending: bool = True,
+    page: int = 1,
+    page_size: int = 100,
+) -> pd.DataFrame:
+    """One page (1-based) of the ``listing_versions`` rows matching ``flt``, ``BROWSE_COLUMNS`` only.
+
+    Rows are browsed as change intervals rather than through the ``listings``
+    view, so history grows with changes, not with runs. Ties on ``sort`` are
+    broken by the rest of the sort index and then rowid, which keeps
+    consecutive pages from repeating or skipping rows and lets the index
+    deliver rows already in order, so ``LIMIT`` stops after one page.
+    """
+    if sort not in BROWSE_SORTS:
+        raise ValueError(f"unsupported sort column: {sort}")
+    where, params = _browse_where(flt)
+    direction = "DESC" if descending else "ASC"
+    cols = ", ".join(f"d.{c}" if c in KEY_COLUMNS else f"v.{c}" for c in BROWSE_COLUMNS)
+    order = ", ".join(f"v.{c} {direction}" for c in [*BROWSE_SORTS[sort], "rowid"])
+    sql = f"""
+        SELECT {cols}
+        FROM listing_versions v
+        JOIN listing_dim d ON d.listing_key = v.listing_key{where}
+        ORDER BY {order}
+        LIMIT ? OFFSET ?
+        """
+    df = pd.read_sql_query(sql, con, params=[*params, page_size, (max(page, 1) - 1) * page_size])
+    # A page whose values are all NULL would otherwise come back as object.
+    for c in BROWSE_COLUMNS:
+        if c in REAL_COLUMNS:
+            df[c] = pd.to_numeric(df[c])
+    return df
+
+
+def mean_pivot(df: pd.DataFrame, column: str, all_dates: pd.DatetimeIndex) -> pd.DataFrame:
+    """Average tsubo price per run_date (rows, over ``all_dates``) and ``column`` value (columns).
+
+    ``df`` holds ``price_sum``/``price_count`` as returned by ``tsubo_price_by_*``.
+    """
+    # Merge the SQL sums/counts per (run_date, column) so the mean stays exact.
+    grouped = df.groupby(["run_date", column], as_index=False, observed=True)[["price_sum", "price_count"]].sum()
+    grouped["avg_tsubo_price_yen"] = grouped["price_sum"] / grouped["price_count"]
+    pivot = grouped.pivot(index="run_date", columns=column, values="avg_tsubo_price_yen")
+    return pivot.reindex(index=all_dates).sort_index()
@@ -0,0 +1,150 @@
+﻿"""Per-run instrumentation: fetch, parse and output-stage metrics.
+
+A ``RunMetrics`` collects what one scrape run measures: every HTTP fetch
+(latency, bytes, status), the wall time of each stage (crawl, dedupe,
+each output writer) and named counters. At the end of the run the
+collected values are flattened into (scope, metric, value) triples,
+``scope`` being ``run`` for run-wide values or a crawl job key such as
+``ek_06660/land`` for per-job values, and stored in ``run_metrics`` of
+``suumo.db`` as well as written as JSON. Durations are in milliseconds
+(``*_ms``) or seconds (``*_s``).
+"""
+
+from __future__ import annotations
+
+import datetime as dt
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator
+
+import pandas as pd
+
+RUN_SCOPE = "run"
+PERCENTILES = {"p50": 0.5, "p90": 0.9, "p99": 0.99}
+# A fetch that raised before any response arrived.
+ERROR_STATUS = "error"
+
+
+def ensure_metrics_schema(con: sqlite3.Connection) -> None:
+    con.execute(
+        """
+        CREATE TABLE IF NOT EXISTS run_metrics (
+            run_date TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            metric TEXT NOT NULL,
+            value REAL,
+            PRIMARY KEY (run_date, scope, metric)
+        )
+        """
+    )
+
+
+def latency_summary(prefix: str, seconds: Iterable[float]) -> dict[str, float]:
+    """``{prefix}_p50_ms`` ... ``{prefix}_max_ms`` of a set of durations; empty when there are none."""
+    values = pd.Series(list(seconds), dtype="float64") * 1000
+    if values.empty:
+        return {}
+    out = {f"{prefix}_{name}_ms": float(values.quantile(q)) for name, q in PERCENTILES.items()}
+    out[f"{prefix}_max_ms"] = float(values.max())
+    return out
+
+
+class RunMetrics:
+    """Thread-safe collector for one run; shared by the fetch threads, crawl jobs and output writers."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._fetches: list[tuple[float, int, str]] = []
+        self._values: dict[str, dict[str, float]] = {}
+
+    def record_fetch(self, seconds: float, nbytes: int, status: str) -> None:
+        with self._lock:
+            self._fetches.append((seconds, nbytes, status))
+
+    def set(self, scope: str, metric: str, value: float) -> None:
+        with self._lock:
+            self._values.setdefault(scope, {})[metric] = value
+
+    def update(self, scope: str, values: dict[str, float]) -> None:
+        with self._lock:
+            self._values.setdefault(scope, {}).update(values)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time a block as run-wide ``{name}_s``; repeated blocks add up."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                run = self._values.setdefault(RUN_SCOPE, {})
+                run[f"{name}_s"] = run.get(f"{name}_s", 0.0) + elapsed
+
+    def fetch_summary(self) -> dict[str, float]:
+        with self._lock:
+            fetches = list(self._fetches)
+        statuses = pd.Series([s for _, _, s in fetches], dtype="object")
+        out: dict[str, float] = {
+            "fetch_requests": len(fetches),
+            "fetch_bytes": sum(n for _, n, _ in fetches),
+            "fetch_errors": int((~statuses.str.startswith("2")).sum()),
+        }
+        # One counter per failure status (http_404, http_503, http_error, ...).
+        for status, count in statuses.value_counts().sort_index().items():
+            if not status.startswith("2"):
+                out[f"http_{status}"] = int(count)
+        out.update(latency_summary("fetch", (s for s, _, _ in fetches)))
+        return out
+
+    def snapshot(self) -> dict[str, dict[str, float]]:
+        """{scope: {metric: value}}, run-wide fetch figures included."""
+        with self._lock:
+            values = {scope: dict(metrics) for scope, metrics in self._values.items()}
+        values.setdefault(RUN_SCOPE, {}).update(self.fetch_summary())
+        return {scope: {k: round(v, 3) for k, v in metrics.items()} for scope, metrics in values.items()}
+
+    def records(self) -> list[tuple[str, str, float]]:
+        return [
+            (scope, metric, float(value))
+            for scope, metrics in sorted(self.snapshot().items())
+            for metric, value in sorted(metrics.items())
+        ]
+
+    def write_json(self, path: Path, run_date: str) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        doc = {"run_date": run_date, "metrics": self.snapshot()}
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps(doc, ensure_ascii=False, indent=1, sort_keys=True), encoding="utf-8")
+        tmp.replace(path)
+
+    def save(self, sqlite_path: Path, run_date: str) -> int:
+        """Replace ``run_date``'s rows of ``run_metrics``; returns the number stored."""
+        records = self.records()
+        con = sqlite3.connect(sqlite_path)
+        try:
+            ensure_metrics_schema(con)
+            con.execute("DELETE FROM run_metrics WHERE run_date = ?", (run_date,))
+            con.executemany(
+                "INSERT INTO run_metrics(run_date, scope, metric, value) VALUES(?, ?, ?, ?)",
+                [(run_date, scope, metric, value) for scope, metric, value in records],
+            )
+            con.commit()
+        finally:
+            con.close()
+        return len(records)
+
+
+def load_run_metrics(con: sqlite3.Connection, since: dt.date | str | None = None) -> pd.DataFrame:
+    """run_metrics rows (empty when the table does not exist yet), oldest run first."""
+    if con.execute("SELECT 1 FROM sqlite_master WHERE name = 'run_metrics'").fetchone() is None:
+        return pd.DataFrame(columns=["run_date", "scope", "metric", "value"])
+    return pd.read_sql_query(
+        "SELECT run_date, scope, metric, value FROM run_metrics WHERE run_date >= ? ORDER BY run_date, scope, metric",
+        con,
+        params=(str(since or ""),),
+    )
@@ -2,21 +2,69 @@
 
 import argparse
 import datetime as dt
+import hashlib
 import json
+import multiprocessing
+import os
 import re
 import sqlite3
-import unicodedata
-from dataclasses import dataclass
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass, field
+from functools import partial
 from pathlib import Path
-from typing import Callable
-from urllib.parse import urljoin, urlparse
+from typing import Callable, Iterator
+from urllib.parse import parse_qsl, urlencode, urljoin, urlparse, urlunparse
 from zoneinfo import ZoneInfo
 
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+
+from listing_extract import (
+    DETAIL_COLUMNS,
+    PRICE_TOKEN_RE,
+    detail_fields_batch,
+    extract_area_sqm,
+    extract_area_tsubo,
+    extract_layout_text,
+    extract_price_yen,
+    extract_price_yen_batch,
+    normalize_batch,
+    normalize_text,
+)
+from history_store import backfill_columns, compact, convert_csv_history, write_run_chunks
+from listing_enrichment import EnrichmentTarget, enrichment_targets, page_attributes, save_enrichment
+from listing_staging import StagedPage, StagingSink
+from listing_store import (
+    ensure_schema,
+    migrate_from_history,
+    object_type,
+    read_history_csv,
+    rebuild_from_history,
+    save_sqlite_chunks,
+    typed_frame,
+    with_station,
+)
+from run_metrics import ERROR_STATUS, RUN_SCOPE, RunMetrics, latency_summary
+
+try:
+    import lxml.html
+
+    LXML_AVAILABLE = True
+except ModuleNotFoundError:
+    LXML_AVAILABLE = False
 
 BASE = "https://suumo.jp"
+# Pagination of a list: ``?page=N`` on the seed URL unless a category sets ``page_param``,
+# and the result count above the page links.
+DEFAULT_PAGE_PARAM = "page"
+HIT_COUNT_SELECTOR = "div.pagination_set-hit"
 HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
     "(KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
@@ -25,6 +73,53 @@ HEADERS = {
 
 JST = ZoneInfo("Asia/Tokyo")
 
+DEFAULT_CONFIG_PATH = Path(__file__).resolve().parents[2] / "config" / "crawl.json"
+# Scratch database of the run in progress, under the output directory.
+STAGING_NAME = "staging.db"
+METRICS_JSON_NAME = "run_metrics.json"
+
+LISTING_COLUMNS = [
+    "run_date",
+    "fetched_at",
+    "category",
+    "sub_category",
+    "station",
+    "listing_id",
+    "title",
+    "address",
+    "price_text",
+    "price_yen",
+    "area_sqm",
+    "area_tsubo",
+    "unit_price_per_sqm",
+    "unit_price_per_tsubo",
+    "layout_text",
+    "detail_text",
+    "detail_url",
+    *DETAIL_COLUMNS,
+]
+
+PARSE_BACKENDS = ("html.parser", "lxml", "lxml-scoped")
+DEFAULT_PARSE_BACKEND = "html.parser"
+
+DEFAULT_CONCURRENCY = 2
+DEFAULT_MIN_INTERVAL = 0.5
+# Jobs crawled at once per fetch slot: enough to keep the shared pool busy
+# while other jobs parse, without a thread per (station x category) job.
+JOBS_PER_FETCH_SLOT = 4
+# Parse worker processes; 0 parses on the crawl threads, None uses all CPUs
+# but one. Inline parsing keeps up with the rate-limited fetches and is
+# faster than a pool in bench_stations, so it is the default.
+DEFAULT_PARSE_WORKERS: int | None = 0
+DEFAULT_FULL_REFRESH_DAYS = 7
+# Detail pages read per run for listings that are new or changed price (0 disables enrichment).
+DEFAULT_DETAIL_PAGES = 50
+# Detail pages fetched and cached together, so a failed run keeps the pages it already read.
+DETAIL_BATCH = 10
+
+HISTORY_FORMATS = ("csv", "parquet", "both")
+DEFAULT_HISTORY_FORMAT = "parquet"
+
 
 def now_jst() -> dt.datetime:
     return dt.datetime.now(tz=JST)
@@ -41,105 +136,111 @@ class CategoryConfig:
     card_selector: str
     parser: Callable[[BeautifulSoup], list[dict]]
     max_pages: int = 8
+    sub_category: str = ""
+    station: str = ""
+    station_code: str = ""
+    page_param: str = DEFAULT_PAGE_PARAM
+    # Cards per list page; with the hit count it gives the number of pages (see ``read_pagination``).
+    per_page: int | None = None
 
+    @property
+    def key(self) -> str:
+        """Job key used in refresh plans, ``runs`` and archive manifests."""
+        return f"{self.station_code}/{self.category}" if self.station_code else self.category
 
-def normalize_text(text: str) -> str:
-    text = unicodedata.normalize("NFKC", text or "")
-    return re.sub(r"\s+", " ", text).strip()
 
+@dataclass
+class StationConfig:
+    code: str
+    name: str
+    prefecture: str
+    line: str = ""
 
-def parse_jpy_amount(token: str) -> float | None:
-    t = normalize_text(token).replace(",", "")
-    if not t:
-        return None
-    m = re.search(r"(\d+(?:\.\d+)?)\s*億", t)
-    if m:
-        oku = float(m.group(1))
-        man = 0.0
-        m2 = re.search(r"億\s*(\d+(?:\.\d+)?)\s*万", t)
-        if m2:
-            man = float(m2.group(1))
-        return oku * 100_000_000 + man * 10_000
-    m = re.search(r"(\d+(?:\.\d+)?)\s*万", t)
-    if m:
-        return float(m.group(1)) * 10_000
-    m = re.search(r"(\d+(?:\.\d+)?)\s*円", t)
-    if m:
-        return float(m.group(1))
-    return None
-
-
-def extract_price_yen(price_text: str) -> float | None:
-    t = normalize_text(price_text).replace(",", "")
-    if not t:
-        return None
-    parts = re.split(r"[~〜～]", t)
-    vals = [parse_jpy_amount(p) for p in parts]
-    vals = [v for v in vals if v is not None]
-    if vals:
-        return float(sum(vals) / len(vals))
-    found: list[float] = []
-    for token in re.findall(r"\d+(?:\.\d+)?\s*(?:億\d+(?:\.\d+)?万|億|万|円)", t):
-        v = parse_jpy_amount(token)
-        if v is not None:
-            found.append(v)
-    if not found:
-        return None
-    return float(max(found))
 
+@dataclass
+class NoiseRules:
+    """Addresses dropped before de-duplication."""
 
-def extract_area_sqm(area_text: str) -> float | None:
-    t = normalize_text(area_text).replace(",", "")
-    if not t:
-        return None
-    # Supports m2 / m 2 / m² / ㎡
-    vals = [float(x) for x in re.findall(r"(\d+(?:\.\d+)?)\s*(?:m\s*2|m²|㎡)", t)]
-    if vals:
-        return float(sum(vals) / len(vals))
-    return None
+    contains: list[str] = field(default_factory=list)
+    lot_level_towns: list[str] = field(default_factory=list)
 
+    def __post_init__(self) -> None:
+        # Lot-level addresses like "...奥沢7-22-13" in the listed towns.
+        towns = "|".join(re.escape(t) for t in self.lot_level_towns)
+        self.lot_re = re.compile(rf"(?:{towns})\s*\d+\s*-\s*\d+") if towns else None
 
-def extract_area_tsubo(area_text: str) -> float | None:
-    t = normalize_text(area_text).replace(",", "")
-    if not t:
-        return None
-    vals = [float(x) for x in re.findall(r"(\d+(?:\.\d+)?)\s*坪", t)]
-    if vals:
-        return float(sum(vals) / len(vals))
-    sqm = extract_area_sqm(t)
-    if sqm is None:
-        return None
-    return sqm / 3.305785
 
+@dataclass
+class CrawlConfig:
+    stations: list[StationConfig]
+    jobs: list[CategoryConfig]
+    noise: NoiseRules
 
-def extract_layout_text(text: str) -> str:
-    t = normalize_text(text)
-    if not t:
-        return ""
-    # Remove area and keep the layout token (e.g. "3LDK", "ワンルーム")
-    t = re.sub(r"\d+(?:\.\d+)?\s*(?:m\s*2|m²|㎡)", "", t)
-    t = re.sub(r"\([^)]*\)", "", t)
-    t = re.sub(r"\s+", " ", t).strip()
-    return t
 
+@dataclass
+class CrawlStats:
+    category: str
+    pages_visited: int = 0
+    pages_fetched: int = 0
+    pages_parsed: int = 0
+    pages_resumed: int = 0
+    cards: int = 0
+    rows: int = 0
+    refresh: str = "full"
+    parse_seconds: list[float] = field(default_factory=list)
+    hits: int = 0
+
+    def summary(self) -> str:
+        resumed = f" resumed={self.pages_resumed}" if self.pages_resumed else ""
+        return (
+            f"[INFO] {self.category}: refresh={self.refresh} pages={self.pages_fetched}/{self.pages_visited} "
+            f"rows={self.rows} hits={self.hits}{resumed}"
+        )
 
-def is_noisy_address(address: str) -> bool:
+    def metrics(self) -> dict[str, float]:
+        """Per-job values for ``run_metrics``; ``cards`` far above ``rows`` means a parser lost its selectors."""
+        return {
+            "pages_visited": self.pages_visited,
+            "pages_fetched": self.pages_fetched,
+            "pages_parsed": self.pages_parsed,
+            "pages_resumed": self.pages_resumed,
+            "cards": self.cards,
+            "rows": self.rows,
+            "hits": self.hits,
+            "parse_total_s": sum(self.parse_seconds),
+            **latency_summary("parse", self.parse_seconds),
+        }
+
+
+def is_noisy_address(address: str, noise: NoiseRules) -> bool:
     a = normalize_text(address)
     if not a:
         return True
-    if "の一部" in a:
+    if any(s in a for s in noise.contains):
         return True
-    # Exclude lot-level addresses like "...奥沢7-22-13"
-    if re.search(r"(奥沢|東玉川|田園調布|等々力)\s*\d+\s*-\s*\d+", a):
+    if noise.lot_re is not None and noise.lot_re.search(a):
         return True
     return False
 
 
+def is_noisy_address_batch(addresses: pd.Series, noise: NoiseRules) -> pd.Series:
+    """Vectorized ``is_noisy_address`` over already-normalized addresses."""
+    a = addresses.fillna("")
+    noisy = a == ""
+    for s in noise.contains:
+        noisy |= a.str.contains(s, regex=False)
+    if noise.lot_re is not None:
+        noisy |= a.str.contains(noise.lot_re)
+    return noisy
+
+
 def absolute(url: str) -> str:
     return urljoin(BASE, url)
 
 
-def fetch_html(session: requests.Session, url: str) -> str | None:
+def fetch_html(session: requests.Session, url: str, metrics: RunMetrics | None = None) -> str | None:
+    started = time.perf_counter()
+    resp = None
     try:
         resp = session.get(url, headers=HEADERS, timeout=30)
         resp.raise_for_status()
@@ -147,42 +248,544 @@ def fetch_html(session: requests.Session, url: str) -> str | None:
     except requests.RequestException as e:
         print(f"[WARN] fetch failed ({e}): {url}")
         return None
+    finally:
+        if metrics is not None:
+            status = str(resp.status_code) if resp is not None else ERROR_STATUS
+            nbytes = len(resp.content) if resp is not None else 0
+            metrics.record_fetch(time.perf_counter() - started, nbytes, status)
+
+
+class HostLimiter:
+    """Caps in-flight requests to one host and spaces out their start times."""
+
+    def __init__(self, concurrency: int, min_interval: float) -> None:
+        self.slots = threading.BoundedSemaphore(max(1, concurrency))
+        self.min_interval = max(0.0, min_interval)
+        self._lock = threading.Lock()
+        self._next_start = 0.0
+
+    def wait_turn(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_start)
+            self._next_start = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+class Fetcher:
+    """Pooled, rate-limited HTTP fetcher shared by all category crawls.
+
+    With ``metrics`` each request's latency (excluding the wait for its
+    turn), size and status are recorded.
+    """
+
+    def __init__(
+        self,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        min_interval: float = DEFAULT_MIN_INTERVAL,
+        metrics: RunMetrics | None = None,
+    ) -> None:
+        self.concurrency = max(1, concurrency)
+        self.min_interval = min_interval
+        self.metrics = metrics
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="fetch")
+        self._limiters: dict[str, HostLimiter] = {}
+        self._limiters_lock = threading.Lock()
+
+    def _limiter(self, url: str) -> HostLimiter:
+        host = urlparse(url).netloc
+        with self._limiters_lock:
+            if host not in self._limiters:
+                self._limiters[host] = HostLimiter(self.concurrency, self.min_interval)
+            return self._limiters[host]
+
+    def fetch(self, url: str) -> str | None:
+        limiter = self._limiter(url)
+        with limiter.slots:
+            limiter.wait_turn()
+            return fetch_html(self.session, url, self.metrics)
+
+    def fetch_many(self, urls: list[str]) -> list[str | None]:
+        """Fetch ``urls`` concurrently; results keep the input order."""
+        return list(self._executor.map(self.fetch, urls))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+
+def _class_xpath(selector: str) -> str:
+    """Translate a ``tag.class`` card selector into an equivalent XPath test."""
+    tag, sep, cls = selector.partition(".")
+    if not sep or not tag or not cls or any(c in cls for c in " .#[>:"):
+        raise ValueError(f"scoped parsing supports 'tag.class' selectors only: {selector!r}")
+    return f"self::{tag}[contains(concat(' ', normalize-space(@class), ' '), ' {cls} ')]"
+
+
+def scoped_html(html: str, card_selector: str) -> str:
+    """Cut a page down to its listing cards, the hit count and the anchors outside them.
+
+    lxml (C) does the full-document parse; only the kept subtrees are
+    serialized again, in document order, so a BeautifulSoup built from the
+    result sees the same cards, hit count and ``a[href]`` sequence as one
+    built from the whole page.
+    """
+    if not html.strip():
+        return "<html><body></body></html>"
+    root = lxml.html.document_fromstring(html)
+    card_test = _class_xpath(card_selector)
+    hit_test = _class_xpath(HIT_COUNT_SELECTOR)
+    kept: list[str] = []
+    subtrees: set = set()
+    for el in root.xpath(f"//*[{card_test} or {hit_test} or self::a[@href]]"):
+        if any(anc in subtrees for anc in el.iterancestors()):
+            continue
+        if el.tag != "a":
+            subtrees.add(el)
+        kept.append(lxml.html.tostring(el, encoding="unicode", with_tail=False))
+    return "<html><body>" + "".join(kept) + "</body></html>"
+
+
+def make_soup(html: str, backend: str = DEFAULT_PARSE_BACKEND, card_selector: str | None = None) -> BeautifulSoup:
+    """Build the soup handed to link discovery and ``cfg.parser``.
+
+    ``html.parser`` and ``lxml`` build the full DOM; ``lxml-scoped`` keeps only
+    the subtrees matched by ``card_selector`` plus the hit count and anchors.
+    """
+    if backend == "html.parser":
+        return BeautifulSoup(html, "html.parser")
+    if backend not in PARSE_BACKENDS:
+        raise ValueError(f"unknown parse backend: {backend!r}")
+    if not LXML_AVAILABLE:
+        raise RuntimeError(f"parse backend {backend!r} requires lxml (`pip install lxml`)")
+    if backend == "lxml-scoped" and card_selector:
+        return BeautifulSoup(scoped_html(html, card_selector), "lxml")
+    return BeautifulSoup(html, "lxml")
+
+
+def canonical_url(url: str, page_param: str = DEFAULT_PAGE_PARAM) -> str:
+    """Absolute ``url`` with sorted query parameters, no fragment and no ``<page_param>=1``."""
+    pu = urlparse(absolute(url))
+    params = sorted(
+        (k, v) for k, v in parse_qsl(pu.query, keep_blank_values=True) if (k, v) != (page_param, "1")
+    )
+    return urlunparse((pu.scheme, pu.netloc, pu.path, "", urlencode(params), ""))
+
+
+def page_url(seed_url: str, page: int, page_param: str = DEFAULT_PAGE_PARAM) -> str:
+    """Canonical URL of page ``page`` of the list at ``seed_url``."""
+    pu = urlparse(absolute(seed_url))
+    params = [(k, v) for k, v in parse_qsl(pu.query, keep_blank_values=True) if k != page_param]
+    query = urlencode([*params, (page_param, str(page))])
+    return canonical_url(urlunparse(pu._replace(query=query)), page_param)
+
+
+def page_number(url: str, seed_url: str, page_param: str = DEFAULT_PAGE_PARAM) -> int | None:
+    """N when ``url`` is page N of ``seed_url`` (same path and filters), else ``None``."""
+    values = [v for k, v in parse_qsl(urlparse(absolute(url)).query, keep_blank_values=True) if k == page_param]
+    if len(values) > 1 or (values and not values[0].isdigit()):
+        return None
+    page = int(values[0]) if values else 1
+    return page if page >= 1 and page_url(seed_url, page, page_param) == canonical_url(url, page_param) else None
+
+
+def read_pagination(soup: BeautifulSoup, cfg: CategoryConfig) -> tuple[int | None, list[str], int]:
+    """(result count, URLs of pages 2..last, pages past the last link) announced by a list page.
+
+    The last linked page is the highest page number linked for the seed
+    URL's own path and filters; sort orders and other variants of the same
+    list (``?po=...``) are not pages of it. SUUMO always links the last
+    page, even when the numbers in between are elided. With
+    ``cfg.per_page`` the hit count is cross-checked: when it implies more
+    pages than are linked, the missing ones are added too and counted in
+    the third value, so a link the parser missed does not cut the crawl short.
+    """
+    hit = soup.select_one(HIT_COUNT_SELECTOR)
+    digits = re.sub(r"\D", "", hit.get_text()) if hit is not None else ""
+    hits = int(digits) if digits else None
+    last = 1
+    for a in soup.select("a[href]"):
+        page = page_number(a.get("href", ""), cfg.seed_url, cfg.page_param)
+        if page is not None:
+            last = max(last, page)
+    expected = -(-hits // cfg.per_page) if hits and cfg.per_page else 1
+    urls = [page_url(cfg.seed_url, page, cfg.page_param) for page in range(2, max(last, expected) + 1)]
+    return hits, urls, max(0, expected - last)
+
 
+@dataclass
+class ParsedPage:
+    """What the crawl needs from one downloaded list page.
+
+    ``links`` are the canonical URLs of the list's further pages,
+    ``hits`` its announced result count and ``unlinked_pages`` how many of
+    those pages only the hit count announced (see ``read_pagination``).
+    ``staged`` pages come from a resumed run's checkpoint: their rows are
+    already staged, so ``rows`` is empty.
+    """
+
+    links: list[str]
+    has_cards: bool
+    rows: list[dict]
+    staged: bool = False
+    cards: int = 0
+    parse_seconds: float = 0.0
+    hits: int | None = None
+    unlinked_pages: int = 0
+
+
+def parse_list_page(cfg: CategoryConfig, html: str, parse_backend: str = DEFAULT_PARSE_BACKEND) -> ParsedPage:
+    """Build the soup once for pagination and card parsing; runs in parse workers."""
+    started = time.perf_counter()
+    soup = make_soup(html, parse_backend, cfg.card_selector)
+    hits, links, unlinked = read_pagination(soup, cfg)
+    cards = len(soup.select(cfg.card_selector))
+    rows = parse_cards(cfg, soup) if cards else []
+    return ParsedPage(
+        links=links,
+        has_cards=bool(cards),
+        rows=rows,
+        cards=cards,
+        parse_seconds=time.perf_counter() - started,
+        hits=hits,
+        unlinked_pages=unlinked,
+    )
+
+
+def _worker_context() -> multiprocessing.context.BaseContext:
+    # The crawl threads are already running when workers start; forking them
+    # could copy a lock held by another thread, so never use plain fork.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+
+class ParsePool:
+    """CPU-bound parse stage shared by all crawl jobs.
+
+    Downloaded HTML is handed to worker processes, so parsing one page no
+    longer holds up the crawl threads that fetch the next ones; each
+    ``submit`` returns a future of the page's ``ParsedPage``. With
+    ``workers=0`` pages are parsed inline on the calling thread.
+    """
+
+    def __init__(self, workers: int | None = DEFAULT_PARSE_WORKERS, parse_backend: str = DEFAULT_PARSE_BACKEND) -> None:
+        self.parse_backend = parse_backend
+        if workers is None:
+            workers = (os.cpu_count() or 1) - 1
+        self.workers = max(0, workers)
+        self._executor = (
+            ProcessPoolExecutor(max_workers=self.workers, mp_context=_worker_context()) if self.workers else None
+        )
 
-def crawl_list_pages(session: requests.Session, seed_url: str, max_pages: int) -> list[str]:
+    def submit(self, cfg: CategoryConfig, html: str) -> Future:
+        if self._executor is not None:
+            return self._executor.submit(parse_list_page, cfg, html, self.parse_backend)
+        future: Future = Future()
+        future.set_result(parse_list_page(cfg, html, self.parse_backend))
+        return future
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+def iter_list_pages(
+    fetcher: Fetcher,
+    cfg: CategoryConfig,
+    parse_pool: ParsePool,
+    wave_size: int | None = None,
+    staged: dict[str, StagedPage] | None = None,
+) -> Iterator[tuple[str, str | None, ParsedPage | None]]:
+    """Walk a list's pages in page order, yielding each page once.
+
+    The seed page is fetched first; the page URLs its pagination announces
+    (``read_pagination``) then form the next wave, so the crawl requests
+    exactly the list's pages, up to ``cfg.max_pages``. A wave is downloaded
+    concurrently, handed to ``parse_pool`` as a whole and then processed in
+    page order, which visits the same pages in the same order as a
+    sequential crawl. Every visited URL is yielded with
+    its raw HTML and parsed page (both ``None`` when the fetch failed), so
+    callers can collect rows and archive the page from the same download.
+    ``wave_size`` caps how many pages are fetched ahead; a caller that may
+    stop early passes 1 so closing the generator never wastes a request.
+
+    Pages in ``staged`` (a resumed run's checkpoint) are not fetched again:
+    they are yielded with no HTML and a ``staged`` page built from their
+    recorded links, which rebuilds the frontier the interrupted run had.
+    """
+    staged = staged or {}
     visited: set[str] = set()
-    queue = [seed_url]
+    seed = canonical_url(cfg.seed_url, cfg.page_param)
+    queue = deque([seed])
+    queued = {seed}
+
+    while queue and len(visited) < cfg.max_pages:
+        wave: list[str] = []
+        while queue and len(visited) < cfg.max_pages and (wave_size is None or len(wave) < wave_size):
+            url = queue.popleft()
+            visited.add(url)
+            wave.append(url)
+
+        fetched = iter(fetcher.fetch_many([url for url in wave if url not in staged]))
+        htmls = [None if url in staged else next(fetched) for url in wave]
+        parsed = [None if html is None else parse_pool.submit(cfg, html) for html in htmls]
+        for url, html, future in zip(wave, htmls, parsed):
+            if url in staged:
+                page = ParsedPage(links=staged[url].links, has_cards=staged[url].has_cards, rows=[], staged=True)
+            elif future is None:
+                yield url, None, None
+                continue
+            else:
+                page = future.result()
+            for nxt in page.links:
+                if nxt not in queued:
+                    queued.add(nxt)
+                    queue.append(nxt)
+            yield url, html, page
+
+
+class PageArchive:
+    """LZMA-compressed zip of the raw list pages fetched by one run.
+
+    The archive for a run date holds one entry per fetched page plus a
+    ``manifest.json`` mapping each URL to its category and entry name, so the
+    parsers can be re-run over the exact HTML later (see ``replay``). Pages
+    are written to a temporary file that only replaces the final archive on
+    ``close``; an interrupted run never leaves a truncated archive behind.
+    """
+
+    def __init__(self, path: Path, run_date: str) -> None:
+        self.path = path
+        self.run_date = run_date
+        self._tmp_path = path.with_name(path.name + ".tmp")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._zip = zipfile.ZipFile(self._tmp_path, "w", compression=zipfile.ZIP_LZMA)
+        self._pages: list[dict] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(archive_dir: Path, run_dt: dt.date) -> Path:
+        return archive_dir / f"pages_{run_dt.strftime('%Y%m%d')}.zip"
+
+    def add(self, category: str, url: str, html: str) -> None:
+        name = f"pages/{hashlib.sha1(url.encode('utf-8')).hexdigest()}.html"
+        with self._lock:
+            self._zip.writestr(name, html)
+            self._pages.append({"category": category, "url": url, "name": name})
+
+    def close(self, fetched_at: str, refresh: dict[str, str] | None = None) -> None:
+        manifest = {
+            "run_date": self.run_date,
+            "fetched_at": fetched_at,
+            "refresh": refresh,
+            "pages": sorted(self._pages, key=lambda p: (p["category"], p["url"])),
+        }
+        with self._lock:
+            self._zip.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=1))
+            self._zip.close()
+        self._tmp_path.replace(self.path)
+
+    def abort(self) -> None:
+        with self._lock:
+            self._zip.close()
+        self._tmp_path.unlink(missing_ok=True)
+
+
+def read_archive(path: Path) -> tuple[dict, dict[str, dict[str, str]]]:
+    """Return (manifest, {category: {url: html}}) for one run archive."""
+    pages: dict[str, dict[str, str]] = {}
+    with zipfile.ZipFile(path) as zf:
+        manifest = json.loads(zf.read("manifest.json").decode("utf-8"))
+        for page in manifest["pages"]:
+            pages.setdefault(page["category"], {})[page["url"]] = zf.read(page["name"]).decode("utf-8")
+    return manifest, pages
+
+
+def parse_cards(cfg: CategoryConfig, soup: BeautifulSoup) -> list[dict]:
+    """Run ``cfg.parser`` and tag its rows with the job's station."""
+    rows = cfg.parser(soup)
+    for row in rows:
+        row["station"] = cfg.station
+    return rows
 
-    while queue and len(visited) < max_pages:
-        url = queue.pop(0)
-        if url in visited:
-            continue
-        visited.add(url)
 
-        html = fetch_html(session, url)
-        if html is None:
+def parse_page(cfg: CategoryConfig, soup: BeautifulSoup) -> list[dict]:
+    if not soup.select(cfg.card_selector):
+        return []
+    return parse_cards(cfg, soup)
+
+
+def crawl_category(
+    fetcher: Fetcher,
+    cfg: CategoryConfig,
+    job_index: int,
+    parse_pool: ParsePool,
+    sink: StagingSink,
+    archive: PageArchive | None = None,
+    known_ids: set[str] | None = None,
+) -> CrawlStats:
+    """Crawl one category, parsing cards from the same pages used for link discovery.
+
+    Each page's rows go to ``sink`` as soon as the page is parsed, together
+    with its checkpoint record; when ``sink`` was resumed, the pages it
+    already holds are skipped (their HTML is read back for ``archive``).
+
+    With ``known_ids`` (the listing IDs of the previous run) pages are
+    fetched one at a time and pagination stops at the first page whose
+    listings are all already known; the category is then only partially
+    refreshed.
+    """
+    stats = CrawlStats(category=cfg.key)
+    wave_size = 1 if known_ids is not None else None
+    staged = sink.staged_pages(job_index) if sink.resumed else None
+    pages = iter_list_pages(fetcher, cfg, parse_pool, wave_size, staged)
+    warned_unlinked = False
+    for url, html, page in pages:
+        stats.pages_visited += 1
+        if page is None:
             continue
-        soup = BeautifulSoup(html, "html.parser")
-        path_seed = urlparse(seed_url).path
+        if page.staged:
+            stats.pages_resumed += 1
+            listing_ids = sink.page_listing_ids(job_index, url)
+            html = sink.page_html(job_index, url) if archive is not None else None
+        else:
+            stats.pages_fetched += 1
+            if page.has_cards:
+                stats.pages_parsed += 1
+            stats.cards += page.cards
+            stats.hits = max(stats.hits, page.hits or 0)
+            if page.unlinked_pages and not warned_unlinked:
+                warned_unlinked = True
+                print(
+                    f"[WARN] {cfg.key}: hits={page.hits} implies {page.unlinked_pages} more page(s) "
+                    f"than {url} links; crawling them too"
+                )
+            stats.parse_seconds.append(page.parse_seconds)
+            listing_ids = [r["listing_id"] for r in page.rows]
+            checkpoint = StagedPage(page.links, page.has_cards, html if archive is not None else None)
+            sink.add(job_index, url, page.rows, checkpoint)
+        if archive is not None and html is not None:
+            archive.add(cfg.key, url, html)
+        stats.rows += len(listing_ids)
+        if known_ids is not None and listing_ids and all(i in known_ids for i in listing_ids):
+            pages.close()
+            stats.refresh = "partial"
+            break
+    return stats
 
-        for a in soup.select("a[href]"):
-            href = a.get("href", "")
-            if not href:
-                continue
-            nxt = absolute(href)
-            pu = urlparse(nxt)
-            if pu.netloc != urlparse(BASE).netloc:
-                continue
-            # keep only listing pagination pages around the same listing path
-            if not pu.path.startswith(path_seed):
-                continue
-            if nxt not in visited and nxt not in queue:
-                queue.append(nxt)
-
-    return sorted(visited)
 
+@dataclass
+class PreviousRun:
+    """The latest stored run before the current one, as seen by an incremental crawl.
+
+    ``rows`` holds only the keys (sub_category, station, listing_id), typed,
+    for the whole crawl; ``full_rows`` reads complete rows once a partial
+    refresh has rows to carry forward.
+    """
+
+    run_date: str
+    rows: pd.DataFrame
+    last_full_refresh: dict[str, str]
+    sqlite_path: Path
+
+    def known_ids(self, cfg: CategoryConfig) -> set[str]:
+        # Listings shown for several stations are stored under only one of them
+        # (``StagingSink.publish``), so every station of the sub_category counts.
+        rows = self.rows[self.rows["sub_category"] == cfg.sub_category]
+        return set(rows["listing_id"].dropna().astype(str))
+
+    def full_rows(self) -> pd.DataFrame:
+        con = sqlite3.connect(self.sqlite_path)
+        try:
+            rows = pd.read_sql_query("SELECT * FROM listings WHERE run_date = ?", con, params=(self.run_date,))
+        finally:
+            con.close()
+        return with_station(rows)
+
+
+def load_previous_run(sqlite_path: Path, run_date: str, configs: list[CategoryConfig]) -> PreviousRun | None:
+    if not sqlite_path.exists():
+        return None
+    con = sqlite3.connect(sqlite_path)
+    try:
+        tables = {row[0] for row in con.execute("SELECT name FROM sqlite_master WHERE type IN ('table','view')")}
+        if not {"runs", "listings"} <= tables:
+            return None
+        run_cols = {row[1] for row in con.execute("PRAGMA table_info(runs)").fetchall()}
+        full_col = "full_refresh" if "full_refresh" in run_cols else "NULL"
+        history = con.execute(
+            f"SELECT run_date, {full_col} FROM runs WHERE run_date < ? ORDER BY run_date", (run_date,)
+        ).fetchall()
+        if not history:
+            return None
+        prev_date = history[-1][0]
+        # A legacy listings table has no station column; with_station fills it in below.
+        listing_cols = {row[1] for row in con.execute("PRAGMA table_info(listings)").fetchall()}
+        keys = ", ".join(c for c in ("sub_category", "station", "listing_id") if c in listing_cols)
+        rows = pd.read_sql_query(f"SELECT {keys} FROM listings WHERE run_date = ?", con, params=(prev_date,))
+    finally:
+        con.close()
 
-def parse_rent_page(soup: BeautifulSoup) -> list[dict]:
+    # Keys recorded before stations were configurable (plain categories) match
+    # no job, so those jobs get a full crawl first.
+    last_full: dict[str, str] = {}
+    for d, full in history:
+        # Runs recorded before incremental crawling existed refreshed everything.
+        keys = [c.key for c in configs] if full is None else [k for k in full.split(",") if k]
+        for k in keys:
+            last_full[k] = d
+    return PreviousRun(
+        run_date=prev_date, rows=typed_frame(with_station(rows)), last_full_refresh=last_full, sqlite_path=sqlite_path
+    )
+
+
+def plan_refresh(
+    configs: list[CategoryConfig], previous: PreviousRun | None, run_dt: dt.date, full_refresh_days: int
+) -> dict[str, set[str] | None]:
+    """Pick the known-ID set per job, or ``None`` where a full crawl is due."""
+    plan: dict[str, set[str] | None] = {}
+    for cfg in configs:
+        last_full = previous.last_full_refresh.get(cfg.key) if previous else None
+        if previous is None or last_full is None:
+            plan[cfg.key] = None
+        elif (run_dt - dt.date.fromisoformat(last_full)).days >= full_refresh_days:
+            plan[cfg.key] = None
+        else:
+            plan[cfg.key] = previous.known_ids(cfg)
+    return plan
+
+
+def carry_forward_rows(
+    configs: list[CategoryConfig], previous: PreviousRun | None, refresh: dict[str, str], seen: set[tuple[str, str]]
+) -> list[dict]:
+    """Previous-run rows for the listings a partial refresh did not reach.
+
+    ``seen`` holds the (sub_category, listing_id) of every crawled row. A
+    listing is carried by sub_category rather than by the station it was
+    stored under, since a partially refreshed station may stop before pages
+    that show listings stored for a neighbouring one; only stations still
+    configured for that sub_category count.
+    """
+    if previous is None or previous.rows.empty:
+        return []
+    partial = {cfg.sub_category for cfg in configs if refresh.get(cfg.key) == "partial"}
+    if not partial:
+        return []
+    jobs = {(cfg.sub_category, cfg.station) for cfg in configs if cfg.sub_category in partial}
+    rows = previous.full_rows()
+    job = pd.Series(list(zip(rows["sub_category"], rows["station"])), index=rows.index)
+    prev = rows[job.isin(jobs)]
+    prev = prev.drop(columns=[c for c in ("run_date", "fetched_at") if c in prev.columns])
+    prev = prev.astype(object).where(prev.notna(), None)
+    return [r for r in prev.to_dict("records") if (r["sub_category"], r["listing_id"]) not in seen]
+
+
+def parse_rent_page(soup: BeautifulSoup, sub_category: str = "賃貸") -> list[dict]:
     rows: list[dict] = []
     for card in soup.select("div.cassetteitem"):
         title = normalize_text(card.select_one(".cassetteitem_content-title") and card.select_one(".cassetteitem_content-title").get_text(" ", strip=True) or "")
@@ -210,7 +813,7 @@ def parse_rent_page(soup: BeautifulSoup) -> list[dict]:
                 deposit_key = normalize_text(tds[2].get_text(" ", strip=True))
                 layout_area = normalize_text(tds[3].get_text(" ", strip=True))
 
-            m_price = re.search(r"\d+(?:\.\d+)?\s*(?:億\d+(?:\.\d+)?万|億|万|円)", price_fee_raw)
+            m_price = PRICE_TOKEN_RE.search(price_fee_raw)
             price_fee = normalize_text(m_price.group(0)) if m_price else price_fee_raw
             area_sqm = extract_area_sqm(layout_area)
             area_tsubo = extract_area_tsubo(layout_area)
@@ -226,7 +829,7 @@ def parse_rent_page(soup: BeautifulSoup) -> list[dict]:
             rows.append(
                 {
                     "category": "rent",
-                    "sub_category": "賃貸",
+                    "sub_category": sub_category,
                     "listing_id": listing_id,
                     "title": title,
                     "address": addr,
@@ -297,57 +900,56 @@ def parse_baibai_page(soup: BeautifulSoup, sub_category: str) -> list[dict]:
     return rows
 
 
-def parse_mansion_new(soup: BeautifulSoup) -> list[dict]:
-    return parse_baibai_page(soup, "マンション(新築)")
-
-
-def parse_mansion_used(soup: BeautifulSoup) -> list[dict]:
-    return parse_baibai_page(soup, "マンション(中古)")
-
-
-def parse_house_new(soup: BeautifulSoup) -> list[dict]:
-    return parse_baibai_page(soup, "戸建て(新築)")
-
-
-def parse_house_used(soup: BeautifulSoup) -> list[dict]:
-    return parse_baibai_page(soup, "戸建て(中古)")
-
-
-def parse_land(soup: BeautifulSoup) -> list[dict]:
-    return parse_baibai_page(soup, "土地")
-
-
-def build_configs() -> list[CategoryConfig]:
-    return [
-        CategoryConfig(
-            category="rent",
-            seed_url="https://suumo.jp/chintai/tokyo/ek_06660/",
-            card_selector="div.cassetteitem",
-            parser=parse_rent_page,
-            max_pages=10,
-        ),
-        CategoryConfig(
-            category="house_new",
-            seed_url="https://suumo.jp/ikkodate/tokyo/ek_06660/",
-            card_selector="div.property_unit",
-            parser=parse_house_new,
-            max_pages=10,
-        ),
-        CategoryConfig(
-            category="house_used",
-            seed_url="https://suumo.jp/chukoikkodate/tokyo/ek_06660/",
-            card_selector="div.property_unit",
-            parser=parse_house_used,
-            max_pages=10,
-        ),
-        CategoryConfig(
-            category="land",
-            seed_url="https://suumo.jp/tochi/tokyo/ek_06660/",
-            card_selector="div.property_unit",
-            parser=parse_land,
-            max_pages=10,
-        ),
+PARSERS: dict[str, Callable[..., list[dict]]] = {"rent": parse_rent_page, "sale": parse_baibai_page}
+
+
+def crawl_config_from_dict(data: dict) -> CrawlConfig:
+    """Build the crawl jobs: every station crossed with every category."""
+    default_prefecture = data.get("prefecture", "tokyo")
+    stations = [
+        StationConfig(
+            code=s["code"], name=s["name"], prefecture=s.get("prefecture", default_prefecture), line=s.get("line", "")
+        )
+        for s in data["stations"]
     ]
+    for attr in ("code", "name"):
+        values = [getattr(s, attr) for s in stations]
+        dupes = sorted({v for v in values if values.count(v) > 1})
+        if dupes:
+            raise ValueError(f"duplicate station {attr} in crawl config: {dupes}")
+    jobs: list[CategoryConfig] = []
+    for station in stations:
+        for c in data["categories"]:
+            if c["parser"] not in PARSERS:
+                raise ValueError(f"unknown parser {c['parser']!r} for category {c['category']!r}")
+            jobs.append(
+                CategoryConfig(
+                    category=c["category"],
+                    sub_category=c["sub_category"],
+                    seed_url=f"{BASE}/{c['path']}/{station.prefecture}/{station.code}/",
+                    card_selector=c["card_selector"],
+                    parser=partial(PARSERS[c["parser"]], sub_category=c["sub_category"]),
+                    max_pages=c.get("max_pages", 8),
+                    station=station.name,
+                    station_code=station.code,
+                    page_param=c.get("page_param", DEFAULT_PAGE_PARAM),
+                    per_page=c.get("per_page"),
+                )
+            )
+    noise = data.get("noise", {})
+    return CrawlConfig(
+        stations=stations,
+        jobs=jobs,
+        noise=NoiseRules(contains=noise.get("contains", []), lot_level_towns=noise.get("lot_level_towns", [])),
+    )
+
+
+def load_crawl_config(path: Path = DEFAULT_CONFIG_PATH) -> CrawlConfig:
+    return crawl_config_from_dict(json.loads(Path(path).read_text(encoding="utf-8-sig")))
+
+
+def build_configs(path: Path = DEFAULT_CONFIG_PATH) -> list[CategoryConfig]:
+    return load_crawl_config(path).jobs
 
 
 def parse_run_date(run_date: str | None) -> dt.date:
@@ -356,153 +958,583 @@ def parse_run_date(run_date: str | None) -> dt.date:
     return dt.date.fromisoformat(run_date)
 
 
-def save_sqlite(df: pd.DataFrame, sqlite_path: Path, run_date: str) -> None:
-    sqlite_path.parent.mkdir(parents=True, exist_ok=True)
-    con = sqlite3.connect(sqlite_path)
+def crawl_all(
+    fetcher: Fetcher,
+    configs: list[CategoryConfig],
+    parse_pool: ParsePool,
+    sink: StagingSink,
+    archive: PageArchive | None = None,
+    plan: dict[str, set[str] | None] | None = None,
+) -> list[CrawlStats]:
+    """Crawl every (station x category) job into ``sink``; stats come back in ``configs`` order.
+
+    All jobs share ``fetcher`` and ``parse_pool``, so the per-host limits
+    hold however many stations are configured; only ``JOBS_PER_FETCH_SLOT``
+    jobs per fetch slot run at once. A job's position in ``configs`` is its
+    position in the outputs.
+    """
+    plan = plan or {}
+
+    def crawl(job: tuple[int, CategoryConfig]) -> CrawlStats:
+        job_index, cfg = job
+        return crawl_category(fetcher, cfg, job_index, parse_pool, sink, archive, plan.get(cfg.key))
+
+    started = time.perf_counter()
+    workers = max(1, min(len(configs), fetcher.concurrency * JOBS_PER_FETCH_SLOT))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="crawl") as pool:
+        all_stats = list(pool.map(crawl, enumerate(configs)))
+    for stats in all_stats:
+        print(stats.summary())
+    print(crawl_summary(configs, all_stats, time.perf_counter() - started, parse_pool.workers))
+    return all_stats
+
+
+def crawl_summary(configs: list[CategoryConfig], stats: list[CrawlStats], elapsed: float, parse_workers: int) -> str:
+    pages = sum(s.pages_fetched for s in stats)
+    rows = sum(s.rows for s in stats)
+    stations = len({cfg.station_code for cfg in configs})
+    rate = pages / elapsed if elapsed > 0 else 0.0
+    return (
+        f"[INFO] crawl: stations={stations} jobs={len(configs)} pages={pages} rows={rows} "
+        f"parse_workers={parse_workers} elapsed={elapsed:.1f}s pages_per_sec={rate:.2f}"
+    )
+
+
+def prepare_rows(df: pd.DataFrame, noise: NoiseRules) -> pd.DataFrame:
+    """Row-wise half of building a run's listings: normalize, flag noise, derive columns.
+
+    Also adds the keys ``StagingSink.publish`` de-duplicates cross-posted
+    listings on (sub_category + area + price + layout).
+    """
+    df["address"] = normalize_batch(df["address"])
+    if "price_yen" not in df.columns:
+        df["price_yen"] = extract_price_yen_batch(df["price_text"])
+    df["noisy"] = is_noisy_address_batch(df["address"], noise)
+    df[DETAIL_COLUMNS] = detail_fields_batch(df["detail_text"])
+    df["dedupe_area"] = pd.to_numeric(df.get("area_sqm"), errors="coerce").round(2)
+    df["dedupe_price"] = pd.to_numeric(df.get("price_yen"), errors="coerce").round(0)
+    df["dedupe_layout"] = normalize_batch(df.get("layout_text", pd.Series("", index=df.index)))
+    return df
+
+
+@contextmanager
+def staging_sink(
+    output_dir: Path, noise: NoiseRules, meta: dict[str, str] | None = None, resume: bool = False
+) -> Iterator[StagingSink]:
+    """Sink for one run; on failure its scratch database is kept as the checkpoint for ``--resume``."""
+    sink = StagingSink(
+        output_dir / STAGING_NAME, LISTING_COLUMNS[2:], partial(prepare_rows, noise=noise), meta=meta, resume=resume
+    )
     try:
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS listings (
-                run_date TEXT NOT NULL,
-                category TEXT NOT NULL,
-                sub_category TEXT NOT NULL,
-                listing_id TEXT,
-                title TEXT,
-                address TEXT,
-                price_text TEXT,
-                price_yen REAL,
-                area_sqm REAL,
-                area_tsubo REAL,
-                unit_price_per_sqm REAL,
-                unit_price_per_tsubo REAL,
-                layout_text TEXT,
-                detail_text TEXT,
-                detail_url TEXT,
-                PRIMARY KEY (run_date, sub_category, listing_id)
-            )
-            """
-        )
-        cols = {row[1] for row in con.execute("PRAGMA table_info(listings)").fetchall()}
-        if "price_yen" not in cols:
-            con.execute("ALTER TABLE listings ADD COLUMN price_yen REAL")
-        if "area_sqm" not in cols:
-            con.execute("ALTER TABLE listings ADD COLUMN area_sqm REAL")
-        if "area_tsubo" not in cols:
-            con.execute("ALTER TABLE listings ADD COLUMN area_tsubo REAL")
-        if "unit_price_per_sqm" not in cols:
-            con.execute("ALTER TABLE listings ADD COLUMN unit_price_per_sqm REAL")
-        if "unit_price_per_tsubo" not in cols:
-            con.execute("ALTER TABLE listings ADD COLUMN unit_price_per_tsubo REAL")
-        if "layout_text" not in cols:
-            con.execute("ALTER TABLE listings ADD COLUMN layout_text TEXT")
-        con.execute(
-            """
-            CREATE TABLE IF NOT EXISTS runs (
-                run_date TEXT PRIMARY KEY,
-                total_records INTEGER NOT NULL,
-                updated_at TEXT NOT NULL
-            )
-            """
-        )
+        yield sink
+    except BaseException:
+        with suppress(Exception):
+            sink.flush()
+        sink.close(remove=False)
+        print(f"[WARN] run failed; staged rows kept in {sink.path} (rerun with --resume to continue)")
+        raise
+    sink.close()
+
+
+def checkpoint_meta(
+    run_date: str, config_path: Path, configs: list[CategoryConfig], plan: dict[str, set[str] | None] | None
+) -> dict[str, str]:
+    """What a checkpoint must match to be resumed: the run date, the config file and each job's refresh mode."""
+    modes = {cfg.key: "full" if plan is None or plan.get(cfg.key) is None else "incremental" for cfg in configs}
+    return {
+        "run_date": run_date,
+        "config_sha1": hashlib.sha1(config_path.read_bytes()).hexdigest(),
+        "jobs": json.dumps(modes, ensure_ascii=False),
+    }
+
+
+def write_csv_chunks(chunks: Iterator[pd.DataFrame], path: Path) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(f, index=False, header=i == 0)
+    tmp.replace(path)
+
+
+def write_outputs(
+    sink: StagingSink,
+    output_dir: Path,
+    run_dt: dt.date,
+    fetched_at: str,
+    write_latest: bool = True,
+    refresh: dict[str, str] | None = None,
+    history_format: str = DEFAULT_HISTORY_FORMAT,
+    metrics: RunMetrics | None = None,
+) -> int:
+    """Publish the staged rows and stream them to every output; returns the record count.
+
+    Each step is timed into ``metrics`` along with the rows dedupe dropped.
+    """
+    metrics = metrics or RunMetrics()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    history_dir = output_dir.parent / "history"
 
-        con.execute("DELETE FROM listings WHERE run_date = ?", (run_date,))
-        if not df.empty:
-            df.to_sql("listings", con, if_exists="append", index=False)
+    latest_csv = output_dir / "listings_latest.csv"
+    history_csv = history_dir / f"listings_{run_dt.strftime('%Y%m%d')}.csv"
+    sqlite_path = output_dir / "suumo.db"
 
-        con.execute(
-            "INSERT OR REPLACE INTO runs(run_date,total_records,updated_at) VALUES(?,?,?)",
-            (run_date, int(len(df)), now_jst().isoformat(timespec="seconds")),
+    with metrics.stage("dedupe"):
+        records = sink.publish()
+    metrics.update(RUN_SCOPE, {f"rows_{k}": v for k, v in sink.publish_stats.items()})
+    leading = {"run_date": run_dt.isoformat(), "fetched_at": fetched_at}
+    if write_latest:
+        with metrics.stage("write_latest_csv"):
+            write_csv_chunks(sink.published_chunks(leading), latest_csv)
+    if history_format in ("csv", "both"):
+        history_dir.mkdir(parents=True, exist_ok=True)
+        with metrics.stage("write_history_csv"):
+            write_csv_chunks(sink.published_chunks(leading), history_csv)
+    if history_format in ("parquet", "both"):
+        with metrics.stage("write_parquet"):
+            write_run_chunks(sink.published_chunks(leading), history_parquet_dir(output_dir), run_dt.isoformat())
+            # Closed months no longer get parts; keep one file per partition for them.
+            compact(history_parquet_dir(output_dir), before=run_dt.isoformat()[:7])
+    with metrics.stage("save_sqlite"):
+        save_sqlite_chunks(
+            sink.published_chunks({"run_date": run_dt.isoformat()}), sqlite_path, run_dt.isoformat(), refresh
         )
-        con.commit()
-    finally:
-        con.close()
+    return records
 
 
-def run(output_dir: Path, run_date: dt.date | None = None) -> pd.DataFrame:
-    session = requests.Session()
-    all_rows: list[dict] = []
+def history_parquet_dir(output_dir: Path) -> Path:
+    return output_dir.parent / "history_parquet"
 
-    for cfg in build_configs():
-        urls = crawl_list_pages(session, cfg.seed_url, cfg.max_pages)
-        for u in urls:
-            html = fetch_html(session, u)
-            if html is None:
-                continue
-            soup = BeautifulSoup(html, "html.parser")
-            if not soup.select(cfg.card_selector):
-                continue
-            rows = cfg.parser(soup)
-            all_rows.extend(rows)
-
-    columns = [
-        "run_date",
-        "fetched_at",
-        "category",
-        "sub_category",
-        "listing_id",
-        "title",
-        "address",
-        "price_text",
-        "price_yen",
-        "area_sqm",
-        "area_tsubo",
-        "unit_price_per_sqm",
-        "unit_price_per_tsubo",
-        "layout_text",
-        "detail_text",
-        "detail_url",
-    ]
-    run_dt = run_date or today_jst()
-    run_date_str = run_dt.isoformat()
-    fetched_at = now_jst().isoformat(timespec="seconds")
-
-    df = pd.DataFrame(all_rows)
-    if df.empty:
-        df = pd.DataFrame(columns=columns)
-    else:
-        df["address"] = df["address"].fillna("").map(normalize_text)
-        if "price_yen" not in df.columns:
-            df["price_yen"] = df["price_text"].fillna("").map(extract_price_yen)
-        df = df[~df["address"].map(is_noisy_address)].copy()
-        df["run_date"] = run_date_str
-        df["fetched_at"] = fetched_at
-        # De-duplicate cross-posted listings by requested key:
-        # sub_category + area + price + layout
-        df["dedupe_area"] = pd.to_numeric(df.get("area_sqm"), errors="coerce").round(2)
-        df["dedupe_price"] = pd.to_numeric(df.get("price_yen"), errors="coerce").round(0)
-        df["dedupe_layout"] = df.get("layout_text", "").fillna("").map(normalize_text)
-        df = df.drop_duplicates(subset=["sub_category", "dedupe_area", "dedupe_price", "dedupe_layout"])
-        df = df[columns].drop_duplicates(subset=["sub_category", "listing_id", "detail_url"])
 
-    output_dir.mkdir(parents=True, exist_ok=True)
-    history_dir = output_dir.parent / "history"
-    history_dir.mkdir(parents=True, exist_ok=True)
+def backfill_detail_csvs(paths: list[Path]) -> int:
+    """Rewrite listing CSVs that predate ``DETAIL_COLUMNS`` or ``station``; returns files rewritten."""
+    rewritten = 0
+    for path in paths:
+        header = pd.read_csv(path, encoding="utf-8-sig", nrows=0).columns
+        if all(c in header for c in [*DETAIL_COLUMNS, "station"]):
+            continue
+        df = read_history_csv(path)
+        order = [c for c in LISTING_COLUMNS if c in df.columns]
+        df[order + [c for c in df.columns if c not in order]].to_csv(path, index=False, encoding="utf-8-sig")
+        rewritten += 1
+    return rewritten
+
+
+def enrich_listings(
+    sqlite_path: Path,
+    run_date: str,
+    limit: int = DEFAULT_DETAIL_PAGES,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    min_interval: float = DEFAULT_MIN_INTERVAL,
+    parse_backend: str = DEFAULT_PARSE_BACKEND,
+    metrics: RunMetrics | None = None,
+) -> tuple[int, int]:
+    """Read the detail pages of up to ``limit`` listings of ``run_date`` that need it.
+
+    Targets come from ``enrichment_targets``, new listings first. Pages
+    that fail to download or hold no attributes are skipped and stay
+    targets for the next run. Returns (listings enriched, targets left).
+    """
+    con = sqlite3.connect(sqlite_path)
+    fetcher = Fetcher(concurrency=concurrency, min_interval=min_interval, metrics=metrics)
+    try:
+        ensure_schema(con)
+        targets = enrichment_targets(con, run_date)
+        enriched = 0
+        for start in range(0, min(limit, len(targets)), DETAIL_BATCH):
+            batch = targets[start : min(start + DETAIL_BATCH, limit)]
+            htmls = fetcher.fetch_many([t.detail_url for t in batch])
+            pages: list[tuple[EnrichmentTarget, dict[str, str]]] = []
+            for target, html in zip(batch, htmls):
+                attributes = page_attributes(make_soup(html, parse_backend)) if html is not None else {}
+                if attributes:
+                    pages.append((target, attributes))
+            enriched += save_enrichment(con, pages, now_jst().isoformat(timespec="seconds"))
+            con.commit()
+        return enriched, len(targets) - enriched
+    finally:
+        fetcher.close()
+        con.close()
 
-    latest_csv = output_dir / "listings_latest.csv"
-    history_csv = history_dir / f"listings_{run_dt.strftime('%Y%m%d')}.csv"
-    sqlite_path = output_dir / "suumo.db"
 
-    df.to_csv(latest_csv, index=False, encoding="utf-8-sig")
-    df.to_csv(history_csv, index=False, encoding="utf-8-sig")
-    to_db = df.drop(columns=["fetched_at"]) if "fetched_at" in df.columns else df
-    save_sqlite(to_db, sqlite_path, run_date_str)
+def run(
+    output_dir: Path,
+    run_date: dt.date | None = None,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    min_interval: float = DEFAULT_MIN_INTERVAL,
+    archive_dir: Path | None = None,
+    parse_backend: str = DEFAULT_PARSE_BACKEND,
+    incremental: bool = False,
+    full_refresh_days: int = DEFAULT_FULL_REFRESH_DAYS,
+    history_format: str = DEFAULT_HISTORY_FORMAT,
+    config_path: Path = DEFAULT_CONFIG_PATH,
+    parse_workers: int | None = DEFAULT_PARSE_WORKERS,
+    resume: bool = False,
+    detail_pages: int = DEFAULT_DETAIL_PAGES,
+) -> int:
+    """Crawl one run and write its outputs; returns the number of records.
+
+    The run's metrics go to ``run_metrics`` in ``suumo.db`` and to
+    ``run_metrics.json`` next to it. With ``resume`` a checkpoint left in ``staging.db`` by an interrupted run
+    of the same date and config is continued instead of starting over. Once the outputs are written, up to
+    ``detail_pages`` detail pages are read by ``enrich_listings``.
+    """
+    run_dt = run_date or today_jst()
+    run_date_str = run_dt.isoformat()
+    config = load_crawl_config(config_path)
+    configs = config.jobs
+
+    previous = load_previous_run(output_dir / "suumo.db", run_date_str, configs) if incremental else None
+    plan = plan_refresh(configs, previous, run_dt, full_refresh_days) if incremental else None
+
+    metrics = RunMetrics()
+    started = time.perf_counter()
+    meta = checkpoint_meta(run_date_str, config_path, configs, plan)
+    with staging_sink(output_dir, config.noise, meta, resume) as sink:
+        if sink.resumed:
+            pages, rows = sink.staged_counts()
+            print(f"[INFO] resuming run_date={run_date_str}: staged_pages={pages} staged_rows={rows}")
+        elif resume:
+            print(f"[INFO] no checkpoint matches run_date={run_date_str} and the config; starting over")
+        archive = PageArchive(PageArchive.path_for(archive_dir, run_dt), run_date_str) if archive_dir else None
+        parse_pool = ParsePool(parse_workers, parse_backend)
+        fetcher = Fetcher(concurrency=concurrency, min_interval=min_interval, metrics=metrics)
+        try:
+            with metrics.stage("crawl"):
+                stats = crawl_all(fetcher, configs, parse_pool, sink, archive, plan)
+        except BaseException:
+            if archive is not None:
+                archive.abort()
+            raise
+        finally:
+            fetcher.close()
+            parse_pool.close()
+
+        refresh = {s.category: s.refresh for s in stats}
+        # Carried-forward rows follow every crawled job, as if crawled by one more job.
+        # A resumed run may already hold them from the attempt that failed while writing outputs.
+        sink.discard(len(configs))
+        carried = carry_forward_rows(configs, previous, refresh, sink.seen_keys())
+        sink.add(len(configs), "", carried)
+
+        fetched_at = now_jst().isoformat(timespec="seconds")
+        if archive is not None:
+            with metrics.stage("archive"):
+                archive.close(fetched_at, refresh)
+
+        records = write_outputs(
+            sink, output_dir, run_dt, fetched_at, refresh=refresh, history_format=history_format, metrics=metrics
+        )
 
-    return df
+    enriched = pending = 0
+    if detail_pages > 0:
+        with metrics.stage("enrich"):
+            enriched, pending = enrich_listings(
+                output_dir / "suumo.db", run_date_str, detail_pages, concurrency, min_interval, parse_backend, metrics
+            )
+        print(f"[INFO] details: enriched={enriched} pending={pending}")
+
+    for s in stats:
+        metrics.update(s.category, s.metrics())
+    metrics.update(
+        RUN_SCOPE,
+        {
+            "records": records,
+            "details_enriched": enriched,
+            "details_pending": pending,
+            "rows_carried_forward": len(carried),
+            "cards": sum(s.cards for s in stats),
+            "parse_workers": parse_pool.workers,
+            "total_s": time.perf_counter() - started,
+            **latency_summary("parse", (t for s in stats for t in s.parse_seconds)),
+        },
+    )
+    metrics.save(output_dir / "suumo.db", run_date_str)
+    metrics.write_json(output_dir / METRICS_JSON_NAME, run_date_str)
+    return records
+
+
+def job_pages(cfg: CategoryConfig, pages: dict[str, dict[str, str]]) -> dict[str, str]:
+    """Archived pages of one job (URL -> HTML).
+
+    Archives written before stations were configurable key pages by plain
+    category; the seed path tells their station apart.
+    """
+    seed_path = urlparse(cfg.seed_url).path
+    found: dict[str, str] = {}
+    for key in (cfg.key, cfg.category):
+        for url, html in pages.get(key, {}).items():
+            if urlparse(url).path.startswith(seed_path):
+                found[url] = html
+    return found
+
+
+def replay_archive(
+    path: Path, parse_backend: str = DEFAULT_PARSE_BACKEND, config_path: Path = DEFAULT_CONFIG_PATH
+) -> tuple[dict, list[tuple[int, str, list[dict]]]]:
+    """Re-parse one run archive offline; returns its manifest and (job_index, url, rows) per page."""
+    manifest, pages = read_archive(path)
+    parsed: list[tuple[int, str, list[dict]]] = []
+    for job_index, cfg in enumerate(build_configs(config_path)):
+        for url, html in sorted(job_pages(cfg, pages).items()):
+            parsed.append((job_index, url, parse_page(cfg, make_soup(html, parse_backend, cfg.card_selector))))
+    return manifest, parsed
+
+
+def archive_dates(archive_dir: Path, start: dt.date | None = None, end: dt.date | None = None) -> list[dt.date]:
+    dates: list[dt.date] = []
+    for p in sorted(archive_dir.glob("pages_*.zip")):
+        m = re.fullmatch(r"pages_(\d{8})\.zip", p.name)
+        if not m:
+            continue
+        d = dt.datetime.strptime(m.group(1), "%Y%m%d").date()
+        if (start is None or d >= start) and (end is None or d <= end):
+            dates.append(d)
+    return dates
+
+
+def replay(
+    output_dir: Path,
+    archive_dir: Path,
+    start: dt.date | None = None,
+    end: dt.date | None = None,
+    workers: int | None = None,
+    parse_backend: str = DEFAULT_PARSE_BACKEND,
+    history_format: str = DEFAULT_HISTORY_FORMAT,
+    config_path: Path = DEFAULT_CONFIG_PATH,
+) -> list[tuple[dt.date, int]]:
+    """Rebuild the daily history (``history_format``) and SQLite rows from archived pages, without network.
+
+    Archives are parsed in worker processes; results are written in date
+    order from this process so SQLite only ever sees a single writer, and
+    each date can carry forward from the date replayed just before it.
+    """
+    config = load_crawl_config(config_path)
+    configs = config.jobs
+    dates = archive_dates(archive_dir, start, end)
+    paths = [PageArchive.path_for(archive_dir, d) for d in dates]
+    done: list[tuple[dt.date, int]] = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(replay_archive, paths, [parse_backend] * len(paths), [config_path] * len(paths))
+        for d, (manifest, pages) in zip(dates, results):
+            with staging_sink(output_dir, config.noise) as sink:
+                for job_index, url, rows in pages:
+                    sink.add(job_index, url, rows)
+                # Partially refreshed runs carried unchanged listings forward from
+                # the run before; redo that against the (already replayed) DB.
+                refresh = manifest.get("refresh")
+                if refresh and "partial" in refresh.values():
+                    previous = load_previous_run(output_dir / "suumo.db", manifest["run_date"], configs)
+                    sink.add(len(configs), "", carry_forward_rows(configs, previous, refresh, sink.seen_keys()))
+                records = write_outputs(
+                    sink,
+                    output_dir,
+                    d,
+                    manifest["fetched_at"],
+                    write_latest=False,
+                    refresh=refresh,
+                    history_format=history_format,
+                )
+            done.append((d, records))
+            print(f"[INFO] replayed {d.isoformat()}: records={records}")
+    return done
 
 
 def main() -> None:
-    parser = argparse.ArgumentParser(description="SUUMO scraper for Okusawa station pages")
+    parser = argparse.ArgumentParser(description="SUUMO scraper for station listing pages")
     parser.add_argument("--output-dir", default="data/processed", help="Output directory")
+    parser.add_argument(
+        "--config",
+        default=str(DEFAULT_CONFIG_PATH),
+        help="Crawl config with stations, categories and noise rules (default: config/crawl.json)",
+    )
     parser.add_argument("--run-date", default=None, help="Run date in YYYY-MM-DD (default: today)")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_CONCURRENCY,
+        help=f"Max in-flight requests per host (default: {DEFAULT_CONCURRENCY})",
+    )
+    parser.add_argument(
+        "--min-interval",
+        type=float,
+        default=DEFAULT_MIN_INTERVAL,
+        help=f"Min seconds between request starts per host (default: {DEFAULT_MIN_INTERVAL})",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Stop paginating a category at the first page whose listings all appeared in the previous run",
+    )
+    parser.add_argument(
+        "--full-refresh-days",
+        type=int,
+        default=DEFAULT_FULL_REFRESH_DAYS,
+        help=f"With --incremental, crawl a category in full once its last full crawl is this many days old "
+        f"(default: {DEFAULT_FULL_REFRESH_DAYS})",
+    )
+    parser.add_argument(
+        "--archive-dir",
+        default=None,
+        help="Directory for compressed raw-page archives (default: <output-dir>/../archive)",
+    )
+    parser.add_argument("--no-archive", action="store_true", help="Do not archive fetched pages")
+    parser.add_argument(
+        "--history-format",
+        choices=HISTORY_FORMATS,
+        default=DEFAULT_HISTORY_FORMAT,
+        help=f"Daily history output: the Parquet store, CSV snapshots, or both (default: {DEFAULT_HISTORY_FORMAT})",
+    )
+    parser.add_argument(
+        "--convert-history",
+        action="store_true",
+        help="Convert data/history CSV snapshots into the Parquet history store",
+    )
+    parser.add_argument(
+        "--compact-history",
+        action="store_true",
+        help="Merge the daily Parquet part files of each month/sub_category partition",
+    )
+    parser.add_argument(
+        "--backfill-details",
+        action="store_true",
+        help="Add the typed detail columns (station text, walk minutes, areas, ratios) and the station column "
+        "to existing CSVs, Parquet and DB",
+    )
+    parser.add_argument(
+        "--migrate-db",
+        action="store_true",
+        help="Convert suumo.db to the change-interval schema (built from data/history when the DB does not exist)",
+    )
+    parser.add_argument(
+        "--rebuild-db",
+        action="store_true",
+        help="Rebuild suumo.db from all data/history CSVs in one bulk load (keeps run modes, run metrics and detail enrichment)",
+    )
+    parser.add_argument(
+        "--replay",
+        action="store_true",
+        help="Re-parse archived pages offline and rebuild the daily history (--history-format) and DB rows instead of crawling",
+    )
+    parser.add_argument("--replay-from", default=None, help="First run date to replay in YYYY-MM-DD")
+    parser.add_argument("--replay-to", default=None, help="Last run date to replay in YYYY-MM-DD")
+    parser.add_argument(
+        "--parse-backend",
+        choices=PARSE_BACKENDS,
+        default=DEFAULT_PARSE_BACKEND,
+        help=f"HTML parse backend (default: {DEFAULT_PARSE_BACKEND}); lxml backends need the lxml package",
+    )
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes for --replay and --rebuild-db (default: CPU count)")
+    parser.add_argument(
+        "--parse-workers",
+        type=int,
+        default=DEFAULT_PARSE_WORKERS,
+        help="Processes parsing downloaded pages during a crawl (default: 0, parse on the crawl threads)",
+    )
+    parser.add_argument(
+        "--detail-pages",
+        type=int,
+        default=DEFAULT_DETAIL_PAGES,
+        help=f"Detail pages to read per run for new or repriced listings (default: {DEFAULT_DETAIL_PAGES}; 0 disables)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue an interrupted run of the same date from its checkpoint (staging.db) instead of starting over",
+    )
     args = parser.parse_args()
 
     output_dir = Path(args.output_dir)
-    target_date = parse_run_date(args.run_date)
-    df = run(output_dir, run_date=target_date)
+    archive_dir = Path(args.archive_dir) if args.archive_dir else output_dir.parent / "archive"
+
+    if args.convert_history:
+        runs = convert_csv_history(output_dir.parent / "history", history_parquet_dir(output_dir))
+        print(f"converted_runs={runs} store={history_parquet_dir(output_dir)}")
+        return
+
+    if args.compact_history:
+        partitions = compact(history_parquet_dir(output_dir))
+        print(f"compacted_partitions={partitions}")
+        return
+
+    if args.backfill_details:
+        csvs = [p for p in [output_dir / "listings_latest.csv"] if p.exists()]
+        csvs += sorted((output_dir.parent / "history").glob("listings_*.csv"))
+        csv_files = backfill_detail_csvs(csvs)
+        parquet_files = backfill_columns(history_parquet_dir(output_dir))
+        sqlite_path = output_dir / "suumo.db"
+        if sqlite_path.exists():
+            con = sqlite3.connect(sqlite_path)
+            try:
+                ensure_schema(con)
+                con.commit()
+            finally:
+                con.close()
+        print(f"backfilled csv_files={csv_files} parquet_files={parquet_files} db={sqlite_path.exists()}")
+        return
+
+    if args.migrate_db:
+        sqlite_path = output_dir / "suumo.db"
+        if sqlite_path.exists():
+            con = sqlite3.connect(sqlite_path)
+            try:
+                kind = object_type(con, "listings")
+                ensure_schema(con)
+                con.commit()
+            finally:
+                con.close()
+            print(f"migrated={kind == 'table'} db={sqlite_path}")
+        else:
+            listings, versions = migrate_from_history(output_dir.parent / "history", sqlite_path, history_parquet_dir(output_dir))
+            print(f"built db={sqlite_path} listings={listings} versions={versions}")
+        return
+
+    if args.rebuild_db:
+        sqlite_path = output_dir / "suumo.db"
+        started = time.perf_counter()
+        runs, listings, versions = rebuild_from_history(
+            output_dir.parent / "history", sqlite_path, workers=args.workers, parquet_dir=history_parquet_dir(output_dir)
+        )
+        elapsed = time.perf_counter() - started
+        print(f"rebuilt db={sqlite_path} runs={runs} listings={listings} versions={versions} seconds={elapsed:.1f}")
+        return
+
+    if args.replay:
+        start = dt.date.fromisoformat(args.replay_from) if args.replay_from else None
+        end = dt.date.fromisoformat(args.replay_to) if args.replay_to else None
+        done = replay(
+            output_dir,
+            archive_dir,
+            start,
+            end,
+            workers=args.workers,
+            parse_backend=args.parse_backend,
+            history_format=args.history_format,
+            config_path=Path(args.config),
+        )
+        print(f"replayed_runs={len(done)} records={sum(n for _, n in done)}")
+        return
 
-    print(f"records={len(df)}")
-    if not df.empty:
-        print(df[["sub_category", "title", "price_text", "address"]].head(10).to_string(index=False))
+    target_date = parse_run_date(args.run_date)
+    records = run(
+        output_dir,
+        run_date=target_date,
+        concurrency=args.concurrency,
+        min_interval=args.min_interval,
+        archive_dir=None if args.no_archive else archive_dir,
+        parse_backend=args.parse_backend,
+        incremental=args.incremental,
+        full_refresh_days=args.full_refresh_days,
+        history_format=args.history_format,
+        config_path=Path(args.config),
+        parse_workers=args.parse_workers,
+        resume=args.resume,
+        detail_pages=args.detail_pages,
+    )
+
+    print(f"records={records}")
+    if records:
+        preview = pd.read_csv(Path(args.output_dir) / "listings_latest.csv", encoding="utf-8-sig", nrows=10)
+        print(preview[["sub_category", "title", "price_text", "address"]].to_string(index=False))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+﻿"""Compare the dashboard's history charts loaded in full, grouped in SQLite and materialized.
+
+A fresh ``suumo.db`` is built from ``data/history``, the CSV snapshots frozen
+since daily runs moved to the Parquet store, so every machine measures the
+same input. The full-load path reads
+every ``listings`` row and averages ``unit_price_per_tsubo`` per run_date and
+address in pandas; the sql-group path sums and counts per address with a
+``GROUP BY`` over the ``listings`` view on every load; the current path runs
+``listing_store.tsubo_price_by_address``, which reads the ``price_by_address``
+table kept by ``save_sqlite``, and merges the sums/counts. The script checks
+that all give the same chart values and that the stored quartiles match
+pandas on the raw rows, then reports latency and the size of the frame held
+in memory. It also times the walk-minute chart, which
+``listing_store.tsubo_price_by_walk`` groups from ``listings`` on every load.
+
+    python bench/bench_dashboard_queries.py --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import listing_aggregates  # noqa: E402
+import listing_store  # noqa: E402
+from listing_extract import normalize_text  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+TARGET_SUB_CATEGORIES = ["土地", "戸建て(中古)", "戸建て(新築)"]
+# The dashboard's walk-minute chart.
+WALK_SUB_CATEGORY = "土地"
+WALK_ADDRESS = "%奥沢%"
+
+
+def address_label(address: str) -> str:
+    a = normalize_text(address)
+    return a[len("東京都") :] if a.startswith("東京都") else a
+
+
+def full_load(con: sqlite3.Connection) -> tuple[pd.DataFrame, int]:
+    hist = pd.read_sql_query(
+        """
+        SELECT run_date, sub_category, address, price_text, price_yen, area_sqm, area_tsubo,
+               detail_text, unit_price_per_sqm, unit_price_per_tsubo
+        FROM listings
+        ORDER BY run_date
+        """,
+        con,
+    )
+    held = int(hist.memory_usage(deep=True).sum())
+    hist = hist[hist["sub_category"].isin(TARGET_SUB_CATEGORIES)].dropna(subset=["unit_price_per_tsubo"]).copy()
+    hist["address_label"] = hist["address"].map(address_label)
+    means = hist.groupby(["run_date", "sub_category", "address_label"])["unit_price_per_tsubo"].mean()
+    return means.sort_index().to_frame("avg"), held
+
+
+def label_means(agg: pd.DataFrame) -> pd.DataFrame:
+    agg["address_label"] = agg["address"].fillna("").map(address_label)
+    sums = agg.groupby(["run_date", "sub_category", "address_label"])[["price_sum", "price_count"]].sum()
+    return (sums["price_sum"] / sums["price_count"]).sort_index().to_frame("avg")
+
+
+def sql_grouped(con: sqlite3.Connection) -> tuple[pd.DataFrame, int]:
+    agg = pd.read_sql_query(
+        f"""
+        SELECT run_date, sub_category, address,
+               SUM(unit_price_per_tsubo) AS price_sum, COUNT(*) AS price_count
+        FROM listings
+        WHERE sub_category IN ({",".join("?" for _ in TARGET_SUB_CATEGORIES)}) AND unit_price_per_tsubo IS NOT NULL
+        GROUP BY run_date, sub_category, address
+        ORDER BY run_date
+        """,
+        con,
+        params=TARGET_SUB_CATEGORIES,
+    )
+    return label_means(agg), int(agg.memory_usage(deep=True).sum())
+
+
+def aggregated(con: sqlite3.Connection) -> tuple[pd.DataFrame, int]:
+    agg = listing_store.tsubo_price_by_address(con, TARGET_SUB_CATEGORIES)
+    return label_means(agg), int(agg.memory_usage(deep=True).sum())
+
+
+def quartiles_match(con: sqlite3.Connection) -> bool:
+    """Stored medians and quartiles equal pandas on the raw ``listings`` rows."""
+    raw = pd.read_sql_query("SELECT * FROM listings", con)
+    raw["address"] = raw["address"].fillna("")
+    for table, keys in listing_aggregates.AGGREGATE_GRAINS.items():
+        stored = pd.read_sql_query(f"SELECT * FROM {table}", con).set_index(["run_date", *keys, "measure"])
+        for measure in listing_aggregates.AGGREGATE_MEASURES:
+            grouped = raw.dropna(subset=[measure, *keys]).groupby(["run_date", *keys])[measure]
+            got = stored.xs(measure, level="measure").sort_index()
+            for name, q in listing_aggregates.QUANTILES.items():
+                expected = grouped.quantile(q).sort_index()
+                if not expected.index.equals(got.index) or not np.allclose(expected, got[name], rtol=1e-12):
+                    return False
+    return True
+
+
+def median_ms(fn, con: sqlite3.Connection, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(con)
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency of full-load vs SQL-aggregated history charts")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "suumo.db"
+        listing_store.migrate_from_history(HISTORY_DIR, db)
+        con = sqlite3.connect(db)
+        try:
+            expected, full_bytes = full_load(con)
+            paths = [("full-load", full_load), ("sql-group", sql_grouped), ("materialized", aggregated)]
+            held = {"full-load": full_bytes}
+            for name, fn in paths[1:]:
+                got, held[name] = fn(con)
+                if not expected.index.equals(got.index) or not np.allclose(expected["avg"], got["avg"], rtol=1e-12):
+                    print(f"[FAIL] {name} chart values differ from the full-load path")
+                    sys.exit(1)
+            if not quartiles_match(con):
+                print("[FAIL] stored quartiles differ from pandas on the raw rows")
+                sys.exit(1)
+            print(f"chart points={len(expected)}; all paths match the full-load path, stored quartiles match")
+            print(f"{'path':<14} {'rows_kb':>10} {'ms':>10}")
+            for name, fn in paths:
+                print(f"{name:<14} {held[name] / 1024:>10.0f} {median_ms(fn, con, args.repeat):>10.1f}")
+            walk = listing_store.tsubo_price_by_walk(con, WALK_SUB_CATEGORY, WALK_ADDRESS)
+            walk_ms = median_ms(
+                lambda c: listing_store.tsubo_price_by_walk(c, WALK_SUB_CATEGORY, WALK_ADDRESS), con, args.repeat
+            )
+            print(f"{'walk chart':<14} {walk.memory_usage(deep=True).sum() / 1024:>10.0f} {walk_ms:>10.1f}")
+        finally:
+            con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+﻿"""Compare the snapshot and change-interval layouts of suumo.db.
+
+Both databases are built from ``data/history``: the former layout with one
+``listings`` row per listing per run, the current one through
+``listing_store.migrate_from_history``. ``data/history`` no longer grows
+(new runs go to ``data/history_parquet``); it is a fixed input here. The
+script checks that ``listings`` returns the same rows for every run_date,
+then reports file size and query latency for both. File sizes cover the
+whole database, including the derived tables ``save_sqlite`` maintains
+(aggregates, events, identity), and the interval database is also broken
+down per table with its indexes, so a derived table that outgrows the
+listing history shows up here.
+
+    python bench/bench_db_layout.py --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import listing_store  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+
+SNAPSHOT_DDL = """
+CREATE TABLE listings (
+    run_date TEXT NOT NULL,
+    category TEXT NOT NULL,
+    sub_category TEXT NOT NULL,
+    listing_id TEXT,
+    title TEXT,
+    address TEXT,
+    price_text TEXT,
+    price_yen REAL,
+    area_sqm REAL,
+    area_tsubo REAL,
+    unit_price_per_sqm REAL,
+    unit_price_per_tsubo REAL,
+    layout_text TEXT,
+    detail_text TEXT,
+    detail_url TEXT,
+    station_text TEXT,
+    walk_minutes REAL,
+    land_area_sqm REAL,
+    building_area_sqm REAL,
+    coverage_ratio REAL,
+    floor_area_ratio REAL,
+    station TEXT,
+    PRIMARY KEY (run_date, sub_category, listing_id)
+)
+"""
+
+
+def build_snapshot_db(path: Path) -> None:
+    con = sqlite3.connect(path)
+    try:
+        con.execute(SNAPSHOT_DDL)
+        con.execute("CREATE TABLE runs (run_date TEXT PRIMARY KEY, total_records INTEGER NOT NULL, updated_at TEXT NOT NULL)")
+        for p in sorted(HISTORY_DIR.glob("listings_*.csv")):
+            df = listing_store.read_history_csv(p)
+            if df.empty:
+                continue
+            df[listing_store.SNAPSHOT_COLUMNS].to_sql("listings", con, if_exists="append", index=False)
+            con.execute("INSERT INTO runs VALUES(?,?,?)", (df["run_date"].iloc[0], len(df), df["fetched_at"].iloc[0]))
+        con.commit()
+        con.execute("VACUUM")
+    finally:
+        con.close()
+
+
+def rows_by_date(path: Path) -> dict[str, list[tuple]]:
+    con = sqlite3.connect(path)
+    try:
+        out: dict[str, list[tuple]] = {}
+        cols = ", ".join(listing_store.SNAPSHOT_COLUMNS)
+        for row in con.execute(f"SELECT {cols} FROM listings"):
+            out.setdefault(row[0], []).append(row)
+        return {d: sorted(rows, key=repr) for d, rows in out.items()}
+    finally:
+        con.close()
+
+
+def table_sizes(path: Path) -> dict[str, tuple[int, int]]:
+    """Bytes of each table's own pages and of its indexes (``dbstat``), largest first."""
+    con = sqlite3.connect(path)
+    try:
+        rows = con.execute(
+            """
+            SELECT m.tbl_name,
+                   SUM(CASE WHEN m.type = 'table' THEN s.pgsize ELSE 0 END),
+                   SUM(CASE WHEN m.type = 'index' THEN s.pgsize ELSE 0 END)
+            FROM dbstat s JOIN sqlite_master m ON m.name = s.name
+            GROUP BY m.tbl_name
+            ORDER BY SUM(s.pgsize) DESC
+            """
+        ).fetchall()
+    finally:
+        con.close()
+    return {name: (table, index) for name, table, index in rows}
+
+
+def time_query(path: Path, sql: str, params: tuple, repeat: int) -> float:
+    con = sqlite3.connect(path)
+    try:
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            con.execute(sql, params).fetchall()
+            samples.append(time.perf_counter() - t0)
+        return statistics.median(samples) * 1000
+    finally:
+        con.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Size and latency of snapshot vs interval suumo.db layouts")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        snapshot_db = Path(tmp) / "snapshot.db"
+        interval_db = Path(tmp) / "interval.db"
+        t0 = time.perf_counter()
+        build_snapshot_db(snapshot_db)
+        t_snapshot = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        listings, versions = listing_store.migrate_from_history(HISTORY_DIR, interval_db)
+        t_interval = time.perf_counter() - t0
+        con = sqlite3.connect(interval_db)
+        con.execute("VACUUM")
+        con.close()
+
+        expected = rows_by_date(snapshot_db)
+        got = rows_by_date(interval_db)
+        bad = [d for d in expected if expected[d] != got.get(d)]
+        if bad or set(got) != set(expected):
+            print(f"[FAIL] listings view differs on {len(bad)} run dates, e.g. {bad[:3]}")
+            sys.exit(1)
+        total_rows = sum(len(v) for v in expected.values())
+        print(f"runs={len(expected)} snapshot_rows={total_rows} listings={listings} versions={versions}")
+        print("listings view returns identical rows for every run_date")
+
+        con = sqlite3.connect(snapshot_db)
+        last_date = con.execute("SELECT MAX(run_date) FROM runs").fetchone()[0]
+        sub, lid = con.execute(
+            "SELECT sub_category, listing_id FROM listings GROUP BY 1, 2 ORDER BY COUNT(*) DESC LIMIT 1"
+        ).fetchone()
+        con.close()
+        queries = [
+            ("point-in-time (latest run)", "SELECT * FROM listings WHERE run_date = ?", (last_date,)),
+            (
+                "dashboard history scan",
+                "SELECT run_date, sub_category, address, price_yen, unit_price_per_tsubo FROM listings ORDER BY run_date",
+                (),
+            ),
+            (
+                "one listing's price history",
+                "SELECT run_date, price_yen FROM listings WHERE sub_category = ? AND listing_id = ? ORDER BY run_date",
+                (sub, lid),
+            ),
+        ]
+
+        print(f"{'':<30}{'snapshot':>12}{'interval':>12}")
+        print(f"{'file size (KB)':<30}{snapshot_db.stat().st_size // 1024:>12}{interval_db.stat().st_size // 1024:>12}")
+        print(f"{'build time (s)':<30}{t_snapshot:>12.2f}{t_interval:>12.2f}")
+        for label, sql, params in queries:
+            a = time_query(snapshot_db, sql, params, args.repeat)
+            b = time_query(interval_db, sql, params, args.repeat)
+            print(f"{label + ' (ms)':<30}{a:>12.1f}{b:>12.1f}")
+
+        try:
+            sizes = table_sizes(interval_db)
+        except sqlite3.OperationalError:
+            print("(this SQLite build has no dbstat; per-table sizes skipped)")
+            return
+        print(f"\n{'interval table (KB)':<30}{'table':>12}{'indexes':>12}")
+        for name, (table, index) in sizes.items():
+            print(f"{name:<30}{table // 1024:>12}{index // 1024:>12}")
+
+
+if __name__ == "__main__":
+    main()
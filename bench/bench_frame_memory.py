@@ -0,0 +1,156 @@
+﻿"""Peak memory of loading listing history as plain frames vs the shared typed schema.
+
+A synthetic multi-year Parquet history store is built from ``data/history``
+by copying its partitions onto earlier years; the frozen CSV snapshots keep
+the base the same however far the live Parquet store has grown. Each load
+then runs in a
+fresh process, which reports its peak: Python/numpy allocations
+(tracemalloc) plus the Arrow memory pool, and the peak RSS on Linux. Loads:
+
+- history: every column as ``read_history`` returns it, against the
+  typed frame (``typed=True``) without ``HEAVY_COLUMNS``
+- charts: the columns of the dashboard's Parquet chart path, both ways
+
+Before measuring, the script checks that the typed frames hold the same
+values in the same order as the plain ones.
+
+    python bench/bench_frame_memory.py --years 10
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import history_store  # noqa: E402
+from listing_store import HEAVY_COLUMNS, SNAPSHOT_COLUMNS  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+CHART_COLUMNS = ["run_date", "sub_category", "address", "walk_minutes", "unit_price_per_tsubo"]
+LIGHT_COLUMNS = [c for c in ["run_date", "fetched_at", *SNAPSHOT_COLUMNS[1:]] if c not in HEAVY_COLUMNS]
+LOADS = {
+    "history plain": (None, False),
+    "history typed": (LIGHT_COLUMNS, True),
+    "charts plain": (CHART_COLUMNS, False),
+    "charts typed": (CHART_COLUMNS, True),
+}
+
+
+def shift_years(column: pa.ChunkedArray, years: int) -> pa.ChunkedArray:
+    """ISO date/time strings moved ``years`` years back (the history has no Feb 29)."""
+    year = pc.cast(pc.subtract(pc.cast(pc.utf8_slice_codeunits(column, 0, 4), pa.int32()), years), pa.string())
+    return pc.binary_join_element_wise(year, pc.utf8_slice_codeunits(column, 4), "")
+
+
+def build_store(history_dir: Path, years: int, tmp: Path) -> Path:
+    """Convert ``history_dir`` into a store and add a copy of every partition for each earlier year."""
+    root = tmp / "history_parquet"
+    history_store.convert_csv_history(history_dir, root)
+    sources = sorted(root.glob("month=*/sub_category=*/*.parquet"))
+    for k in range(1, years):
+        for path in sources:
+            table = pq.read_table(path)
+            for c in ("run_date", "fetched_at"):
+                table = table.set_column(table.column_names.index(c), c, shift_years(table[c], k))
+            month = path.parent.parent.name.split("=", 1)[1]
+            target = root / f"month={int(month[:4]) - k}{month[4:]}" / path.parent.name / path.name
+            target.parent.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table, target, compression="zstd")
+    return root
+
+
+def proc_status_mb(field: str) -> float | None:
+    """A ``/proc/self/status`` memory field in MB; ``None`` off Linux."""
+    status = Path("/proc/self/status")
+    if not status.exists():
+        return None
+    for line in status.read_text().splitlines():
+        if line.startswith(f"{field}:"):
+            return int(line.split()[1]) * 1024 / 1e6
+    return None
+
+
+def measure(root: Path, load: str) -> dict[str, float | None]:
+    columns, typed = LOADS[load]
+    base_rss = proc_status_mb("VmRSS")
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    df = history_store.read_history(root, columns=columns, typed=typed)
+    elapsed = time.perf_counter() - t0
+    _, py_peak = tracemalloc.get_traced_memory()
+    return {
+        "rows": len(df),
+        "frame_mb": df.memory_usage(deep=True).sum() / 1e6,
+        "peak_mb": (py_peak + pa.default_memory_pool().max_memory()) / 1e6,
+        "seconds": elapsed,
+        "base_rss_mb": base_rss,
+        # VmHWM starts over at exec, unlike ru_maxrss, which a child inherits from the process it was forked from.
+        "rss_mb": proc_status_mb("VmHWM"),
+    }
+
+
+def same_values(plain: pd.DataFrame, typed: pd.DataFrame) -> bool:
+    if list(plain.columns) != list(typed.columns) or len(plain) != len(typed):
+        return False
+    for c in plain.columns:
+        expected = plain[c]
+        got = typed[c].dt.strftime("%Y-%m-%d") if c == "run_date" else typed[c].astype(expected.dtype)
+        if not ((expected == got) | (expected.isna() & got.isna())).all():
+            return False
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Peak memory of plain vs typed listing history frames")
+    parser.add_argument("--years", type=int, default=10, help="years of history to synthesize (default: 10)")
+    parser.add_argument("--measure", choices=list(LOADS), help=argparse.SUPPRESS)
+    parser.add_argument("--root", type=Path, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.root, args.measure)))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = build_store(HISTORY_DIR, args.years, Path(tmp))
+        for columns in (LIGHT_COLUMNS, CHART_COLUMNS):
+            plain = history_store.read_history(root, columns=columns)
+            if not same_values(plain, history_store.read_history(root, columns=columns, typed=True)):
+                print(f"[FAIL] typed frame differs from the plain one for columns {columns}")
+                sys.exit(1)
+            del plain
+        print(f"years={args.years}; typed frames hold the same values as plain ones")
+        print(f"{'load':<14} {'rows':>9} {'frame_mb':>9} {'peak_mb':>9} {'rss_mb':>8} {'seconds':>8}")
+        base_rss = None
+        for load in LOADS:
+            out = subprocess.run(
+                [sys.executable, __file__, "--measure", load, "--root", str(root)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            r = json.loads(out)
+            base_rss = r["base_rss_mb"]
+            rss = f"{r['rss_mb']:>8.0f}" if r["rss_mb"] is not None else f"{'-':>8}"
+            print(f"{load:<14} {r['rows']:>9} {r['frame_mb']:>9.1f} {r['peak_mb']:>9.1f} {rss} {r['seconds']:>8.2f}")
+        if base_rss is not None:
+            print(f"rss_mb includes {base_rss:.0f} MB held after imports, before loading")
+
+
+if __name__ == "__main__":
+    main()
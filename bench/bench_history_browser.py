@@ -0,0 +1,159 @@
+﻿"""Compare the history browser's paged SQLite queries with filtering the whole history in pandas.
+
+A fresh ``suumo.db`` is built from ``data/history``; ``--years`` copies its
+listings onto earlier years (new listing keys, dates shifted) so the
+database holds several years of history. Only the frozen CSV snapshots are
+used, not runs added to ``data/history_parquet`` since it became the default
+output. For a set of filters and sort
+orders, the client-side path reads every ``listing_versions`` row, then
+filters, sorts and slices one page in pandas, the way the dashboard table
+handles ``listings_latest.csv``. The server-side path runs
+``listing_store.count_versions`` and ``browse_versions``, which fetch only
+the page; the dashboard caches the count per filter, so paging and
+sorting only repeat the page query. The script checks that both paths give
+the same page, then reports latency and the page payload against the whole
+filtered frame.
+
+    python bench/bench_history_browser.py --years 10 --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import listing_store  # noqa: E402
+from listing_store import BROWSE_COLUMNS, BROWSE_SORTS, BrowseFilter  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+PAGE_SIZE = 100
+CASES = [
+    ("all, newest", BrowseFilter(), "valid_to", True, 1),
+    ("all, deep page", BrowseFilter(), "valid_to", True, 50),
+    ("土地 by price", BrowseFilter(sub_categories=("土地",)), "price_yen", False, 1),
+    ("address substring", BrowseFilter(address="奥沢3"), "valid_from", True, 2),
+    ("price range", BrowseFilter(price_min=50_000_000, price_max=100_000_000), "price_yen", True, 1),
+    ("area + month", BrowseFilter(area_min=20, start="2026-03-01", end="2026-03-31"), "area_sqm", False, 1),
+]
+
+
+def add_years(con: sqlite3.Connection, years: int) -> None:
+    """Copy every listing onto each of the ``years - 1`` previous years."""
+    span = con.execute("SELECT MAX(listing_key) FROM listing_dim").fetchone()[0]
+    version_cols = ", ".join(listing_store.VERSION_COLUMNS)
+    for k in range(1, years):
+        shift = f"-{k} years"
+        con.execute(
+            "INSERT INTO runs(run_date, total_records, updated_at) "
+            "SELECT date(run_date, ?), total_records, updated_at FROM runs WHERE run_date LIKE '2026-%'",
+            (shift,),
+        )
+        con.execute(
+            "INSERT INTO listing_dim SELECT listing_key + ?, category, sub_category, listing_id || ?, "
+            "date(first_seen, ?), date(last_seen, ?) FROM listing_dim WHERE listing_key <= ?",
+            (k * span, f"-{k}", shift, shift, span),
+        )
+        con.execute(
+            f"INSERT INTO listing_versions(listing_key, valid_from, valid_to, content_hash, {version_cols}) "
+            f"SELECT listing_key + ?, date(valid_from, ?), date(valid_to, ?), content_hash, {version_cols} "
+            "FROM listing_versions WHERE listing_key <= ?",
+            (k * span, shift, shift, span),
+        )
+    con.commit()
+
+
+def load_all(con: sqlite3.Connection) -> pd.DataFrame:
+    cols = ", ".join(f"d.{c}" if c in listing_store.KEY_COLUMNS else f"v.{c}" for c in BROWSE_COLUMNS)
+    sql = f"SELECT {cols}, v.rowid AS rid FROM listing_versions v JOIN listing_dim d ON d.listing_key = v.listing_key"
+    return pd.read_sql_query(sql, con)
+
+
+def client_page(con: sqlite3.Connection, flt: BrowseFilter, sort: str, descending: bool, page: int) -> tuple[pd.DataFrame, int]:
+    df = load_all(con)
+    mask = pd.Series(True, index=df.index)
+    if flt.sub_categories:
+        mask &= df["sub_category"].isin(flt.sub_categories)
+    if flt.address:
+        mask &= df["address"].fillna("").str.contains(flt.address, regex=False)
+    for col, low, high in (("price_yen", flt.price_min, flt.price_max), ("area_sqm", flt.area_min, flt.area_max)):
+        if low is not None:
+            mask &= df[col] >= low
+        if high is not None:
+            mask &= df[col] <= high
+    if flt.start is not None:
+        mask &= df["valid_to"] >= flt.start
+    if flt.end is not None:
+        mask &= df["valid_from"] <= flt.end
+    filtered = df[mask]
+    # SQLite orders NULL as the smallest value.
+    ordered = filtered.sort_values(
+        [*BROWSE_SORTS[sort], "rid"], ascending=not descending, na_position="last" if descending else "first", kind="stable"
+    )
+    start = (page - 1) * PAGE_SIZE
+    return ordered.iloc[start : start + PAGE_SIZE][BROWSE_COLUMNS].reset_index(drop=True), int(
+        filtered[BROWSE_COLUMNS].memory_usage(deep=True).sum()
+    )
+
+
+def server_page(con: sqlite3.Connection, flt: BrowseFilter, sort: str, descending: bool, page: int) -> tuple[pd.DataFrame, int]:
+    df = listing_store.browse_versions(con, flt, sort, descending, page, PAGE_SIZE)
+    return df, int(df.memory_usage(deep=True).sum())
+
+
+def median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Latency and payload of paged SQL vs client-side history browsing")
+    parser.add_argument("--years", type=int, default=10, help="years of history to simulate (default: 10)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "suumo.db"
+        listing_store.migrate_from_history(HISTORY_DIR, db)
+        con = sqlite3.connect(db)
+        try:
+            add_years(con, args.years)
+            versions = con.execute("SELECT COUNT(*) FROM listing_versions").fetchone()[0]
+            print(f"versions={versions} years={args.years} page_size={PAGE_SIZE}")
+            print(
+                f"{'case':<20} {'matched':>8} {'client_ms':>10} {'count_ms':>9} {'page_ms':>8} {'client_kb':>10} {'page_kb':>8}"
+            )
+            for name, flt, sort, descending, page in CASES:
+                expected, client_bytes = client_page(con, flt, sort, descending, page)
+                got, server_bytes = server_page(con, flt, sort, descending, page)
+                if not expected.equals(got):
+                    print(f"[FAIL] {name}: server page differs from the client-side page")
+                    sys.exit(1)
+                client_ms = median_ms(lambda: client_page(con, flt, sort, descending, page), args.repeat)
+                count_ms = median_ms(lambda: listing_store.count_versions(con, flt), args.repeat)
+                page_ms = median_ms(lambda: server_page(con, flt, sort, descending, page), args.repeat)
+                matched = listing_store.count_versions(con, flt)
+                print(
+                    f"{name:<20} {matched:>8} {client_ms:>10.1f} {count_ms:>9.1f} {page_ms:>8.1f} "
+                    f"{client_bytes / 1024:>10.0f} {server_bytes / 1024:>8.1f}"
+                )
+        finally:
+            con.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+﻿"""Compare the per-day CSV history with the partitioned Parquet store.
+
+The store is built from ``data/history`` with
+``history_store.convert_csv_history``. The script checks that it holds the
+same rows as the CSV snapshots, then reports on-disk size and the time to
+load the dashboard's time-series columns (land/house sub_categories) from
+each layout. Both sides are the frozen CSV snapshots: runs written to
+``data/history_parquet`` after it became the default have no CSV copy.
+
+    python bench/bench_history_store.py --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import history_store  # noqa: E402
+import listing_store  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+DASHBOARD_COLUMNS = [
+    "run_date",
+    "sub_category",
+    "address",
+    "price_text",
+    "price_yen",
+    "area_sqm",
+    "area_tsubo",
+    "detail_text",
+    "unit_price_per_sqm",
+    "unit_price_per_tsubo",
+]
+TARGET_SUB_CATEGORIES = ["土地", "戸建て(中古)", "戸建て(新築)"]
+
+
+def dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def load_csv() -> pd.DataFrame:
+    frames = [listing_store.read_history_csv(p) for p in sorted(HISTORY_DIR.glob("listings_*.csv"))]
+    df = pd.concat(frames, ignore_index=True)
+    return df[df["sub_category"].isin(TARGET_SUB_CATEGORIES)][DASHBOARD_COLUMNS]
+
+
+def median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def canonical(df: pd.DataFrame) -> pd.DataFrame:
+    return df.astype(str).sort_values(list(df.columns)).reset_index(drop=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Size and load time of CSV vs Parquet history")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp) / "history_parquet"
+        t0 = time.perf_counter()
+        runs = history_store.convert_csv_history(HISTORY_DIR, root)
+        t_convert = time.perf_counter() - t0
+
+        def load_parquet() -> pd.DataFrame:
+            return history_store.read_history(root, columns=DASHBOARD_COLUMNS, sub_categories=TARGET_SUB_CATEGORIES)
+
+        expected = canonical(load_csv())
+        got = canonical(load_parquet())
+        if not expected.equals(got):
+            print(f"[FAIL] Parquet store differs from CSV history ({len(got)} vs {len(expected)} rows)")
+            sys.exit(1)
+        print(f"runs={runs} rows={len(expected)} convert={t_convert:.2f}s")
+        print("Parquet store returns identical rows for the dashboard query")
+
+        csv_size = dir_size(HISTORY_DIR)
+        parquet_size = dir_size(root)
+        print(f"{'layout':<10} {'size_kb':>10} {'load_ms':>10}")
+        print(f"{'csv':<10} {csv_size / 1024:>10.0f} {median_ms(load_csv, args.repeat):>10.1f}")
+        print(f"{'parquet':<10} {parquet_size / 1024:>10.0f} {median_ms(load_parquet, args.repeat):>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+﻿"""Time the incremental property-identity update run by run.
+
+Replays ``data/history`` into a fresh ``suumo.db`` one run at a time, the
+way daily scrapes write it, and times ``listing_identity.update_identity``
+after each run against the number of listings it had to link. A full
+rebuild of the same index is timed for comparison.
+
+    python bench/bench_identity.py
+"""
+
+from __future__ import annotations
+
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import listing_identity  # noqa: E402
+import listing_store  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        con = sqlite3.connect(Path(tmp) / "suumo.db")
+        listing_store.ensure_schema(con)
+        samples: list[tuple[int, float]] = []
+        for path in sorted(HISTORY_DIR.glob("listings_*.csv")):
+            df = listing_store.read_history_csv(path)
+            if df.empty:
+                continue
+            run_date = df["run_date"].iloc[0]
+            listing_store.upsert_run(con, run_date, df)
+            con.execute(
+                "INSERT OR REPLACE INTO runs(run_date, total_records, updated_at) VALUES(?,?,?)",
+                (run_date, len(df), df["fetched_at"].iloc[0]),
+            )
+            pending = con.execute(
+                "SELECT COUNT(*) FROM listing_dim WHERE listing_key NOT IN (SELECT listing_key FROM property_links)"
+            ).fetchone()[0]
+            t0 = time.perf_counter()
+            listing_identity.update_identity(con)
+            samples.append((pending, time.perf_counter() - t0))
+        con.commit()
+
+        first = samples[0]
+        daily = samples[1:]
+        per_listing = [t / n for n, t in daily if n]
+        print(f"runs={len(samples)} first run: {first[0]} listings in {first[1] * 1000:.1f} ms")
+        print(
+            f"daily runs: median {statistics.median(n for n, _ in daily)} new listings, "
+            f"median {statistics.median(t for _, t in daily) * 1000:.1f} ms, "
+            f"{statistics.median(per_listing) * 1000:.3f} ms per new listing"
+        )
+
+        links_sql = "SELECT listing_key, property_id FROM property_links ORDER BY listing_key"
+        incremental = con.execute(links_sql).fetchall()
+        listing_identity.clear_identity(con)
+        t0 = time.perf_counter()
+        linked, created = listing_identity.update_identity(con)
+        elapsed = time.perf_counter() - t0
+        print(f"full rebuild: {linked + created} listings -> {created} properties in {elapsed * 1000:.1f} ms")
+        # Rebuilt property IDs are numbered the same way, so the links must match exactly.
+        if con.execute(links_sql).fetchall() != incremental:
+            print("[FAIL] full rebuild links listings differently from the daily updates")
+            sys.exit(1)
+        print("full rebuild matches the daily updates")
+        con.close()
+
+
+if __name__ == "__main__":
+    main()
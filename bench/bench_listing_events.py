@@ -0,0 +1,134 @@
+﻿"""Compare the listing_events feed with diffing two full snapshots in pandas.
+
+A fresh ``suumo.db`` is built from ``data/history``. For every pair of
+consecutive runs, the snapshot path reads both runs from the ``listings``
+view and diffs them by (sub_category, listing_id) in pandas: keys only in
+the later run are new, keys only in the earlier one removed, and shared
+keys whose price_text/price_yen differ repriced. The script checks that
+``listing_events`` holds exactly those events, then reports the latency of
+one day's feed both ways and of ``refresh_events`` for one run.
+
+The cost ``save_sqlite`` pays for the table is measured on the workload of
+``bench_suite.py``'s ``save_sqlite`` case (``--runs`` snapshots, every
+listing copied ``--scale`` times) by timing the ``refresh_events`` calls
+inside those saves.
+
+    python bench/bench_listing_events.py --repeat 5
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import listing_store  # noqa: E402
+from bench_suite import scaled_history  # noqa: E402
+from listing_events import refresh_events, run_events  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+KEYS = ["sub_category", "listing_id"]
+
+
+def snapshot(con: sqlite3.Connection, run_date: str) -> pd.DataFrame:
+    sql = "SELECT sub_category, listing_id, price_text, price_yen FROM listings WHERE run_date = ?"
+    return pd.read_sql_query(sql, con, params=(run_date,)).set_index(KEYS)
+
+
+def snapshot_diff(con: sqlite3.Connection, prev: str, run_date: str) -> set[tuple[str, str, str]]:
+    before, after = snapshot(con, prev), snapshot(con, run_date)
+    events = {("new", *k) for k in after.index.difference(before.index)}
+    events |= {("removed", *k) for k in before.index.difference(after.index)}
+    shared = after.index.intersection(before.index)
+    old, new = before.loc[shared], after.loc[shared]
+    changed = (old["price_text"].fillna("\0") != new["price_text"].fillna("\0")) | (
+        old["price_yen"].fillna(-1) != new["price_yen"].fillna(-1)
+    )
+    events |= {("price_changed", *k) for k in shared[changed.to_numpy()]}
+    return events
+
+
+def stored(con: sqlite3.Connection, run_date: str) -> set[tuple[str, str, str]]:
+    return set(run_events(con, run_date)[["event", *KEYS]].itertuples(index=False, name=None))
+
+
+def median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples) * 1000
+
+
+def ingest_seconds(path: Path, history: list[tuple[str, pd.DataFrame]]) -> tuple[float, float]:
+    """Seconds to ``save_sqlite`` every run of ``history`` into a fresh ``path``, and the part spent in events."""
+    path.unlink(missing_ok=True)
+    saved = listing_store.refresh_events
+    spent = 0.0
+
+    def timed(con: sqlite3.Connection, run_dates=None) -> int:
+        nonlocal spent
+        t0 = time.perf_counter()
+        try:
+            return saved(con, run_dates)
+        finally:
+            spent += time.perf_counter() - t0
+
+    listing_store.refresh_events = timed
+    try:
+        t0 = time.perf_counter()
+        for run_date, df in history:
+            listing_store.save_sqlite(df, path, run_date)
+        return time.perf_counter() - t0, spent
+    finally:
+        listing_store.refresh_events = saved
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="listing_events vs pandas snapshot diffs")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=20, help="Snapshots saved when measuring the ingest cost")
+    parser.add_argument("--scale", type=int, default=4, help="Copies of every listing when measuring the ingest cost")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db = Path(tmp) / "suumo.db"
+        listing_store.migrate_from_history(HISTORY_DIR, db)
+        con = sqlite3.connect(db)
+        try:
+            dates = [row[0] for row in con.execute("SELECT run_date FROM runs ORDER BY run_date")]
+            total = 0
+            for prev, run_date in zip(dates, dates[1:]):
+                expected = snapshot_diff(con, prev, run_date)
+                if stored(con, run_date) != expected:
+                    print(f"[FAIL] {run_date}: listing_events differs from the snapshot diff")
+                    sys.exit(1)
+                total += len(expected)
+            print(f"runs={len(dates)} events={total}; every run matches the snapshot diff")
+            prev, last = dates[-2], dates[-1]
+            print(f"{'path':<22} {'ms':>10}")
+            print(f"{'snapshot diff':<22} {median_ms(lambda: snapshot_diff(con, prev, last), args.repeat):>10.1f}")
+            print(f"{'events feed':<22} {median_ms(lambda: run_events(con, last), args.repeat):>10.1f}")
+            print(f"{'refresh_events (1 run)':<22} {median_ms(lambda: refresh_events(con, [last]), args.repeat):>10.1f}")
+        finally:
+            con.close()
+
+        history = scaled_history(args.runs, args.scale)
+        samples = [ingest_seconds(Path(tmp) / "ingest.db", history) for _ in range(args.repeat)]
+        total, events = (statistics.median(s[i] for s in samples) * 1000 for i in (0, 1))
+        print(f"save_sqlite x{len(history)} (scale {args.scale}): {total:.0f} ms, of which refresh_events "
+              f"{events:.0f} ms ({events / len(history):.1f} ms per run, {events / total:.1%})")
+
+if __name__ == "__main__":
+    main()
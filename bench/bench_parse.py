@@ -0,0 +1,80 @@
+﻿"""Parse-backend benchmark over the saved SUUMO fixture pages.
+
+Every backend must return exactly the rows and pagination of the
+``html.parser`` reference before its timing is reported.
+
+    python bench/bench_parse.py --repeat 20
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "apps" / "scraper"))
+
+import suumo_scraper as scraper  # noqa: E402
+
+FIXTURES_DIR = BENCH_DIR / "fixtures"
+
+
+def load_fixtures() -> list[dict]:
+    index = json.loads((FIXTURES_DIR / "index.json").read_text(encoding="utf-8"))
+    for item in index:
+        item["html"] = (FIXTURES_DIR / item["file"]).read_text(encoding="utf-8")
+    return index
+
+
+def parse_fixture(
+    item: dict, cfg: scraper.CategoryConfig, backend: str
+) -> tuple[list[dict], tuple[int | None, list[str], int]]:
+    soup = scraper.make_soup(item["html"], backend, cfg.card_selector)
+    return cfg.parser(soup), scraper.read_pagination(soup, cfg)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare HTML parse backends on fixture pages")
+    parser.add_argument("--repeat", type=int, default=10, help="Timed parses per page and backend")
+    args = parser.parse_args()
+
+    configs = {cfg.category: cfg for cfg in scraper.build_configs()}
+    backends = [b for b in scraper.PARSE_BACKENDS if b == "html.parser" or scraper.LXML_AVAILABLE]
+    fixtures = load_fixtures()
+
+    failures = 0
+    for item in fixtures:
+        cfg = configs[item["category"]]
+        expected = parse_fixture(item, cfg, "html.parser")
+        for backend in backends[1:]:
+            if parse_fixture(item, cfg, backend) != expected:
+                failures += 1
+                print(f"[FAIL] {backend}: output differs from html.parser on {item['file']}")
+    if failures:
+        sys.exit(1)
+
+    print(f"{'page':<34}{'KB':>6}" + "".join(f"{b:>14}" for b in backends))
+    totals = {b: 0.0 for b in backends}
+    for item in fixtures:
+        cfg = configs[item["category"]]
+        cells = []
+        for backend in backends:
+            samples = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                parse_fixture(item, cfg, backend)
+                samples.append(time.perf_counter() - t0)
+            ms = statistics.median(samples) * 1000
+            totals[backend] += ms
+            cells.append(f"{ms:>11.1f} ms")
+        print(f"{item['file']:<34}{len(item['html'].encode('utf-8')) // 1024:>6}" + "".join(cells))
+    print(f"{'total (median per page)':<40}" + "".join(f"{totals[b]:>11.1f} ms" for b in backends))
+    print(f"outputs identical across backends on {len(fixtures)} fixture pages")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+﻿"""Crawl throughput and runtime as the number of configured stations grows.
+
+Every station gets the categories of ``config/crawl.json``; requests are
+answered from ``bench/fixtures`` after a simulated network latency, so the
+numbers show how the shared, rate-limited fetch pool schedules the
+(station x category) jobs rather than how fast suumo.jp is. Each station
+count is crawled once per ``--parse-workers`` value (0 parses on the crawl
+threads), and every run must publish the same de-duplicated rows.
+
+Before measuring, two stations whose pages show the same listings are
+crawled in full and then with ``incremental=True``: every job of the second
+run must stop after its first page (the listings are known, though stored
+under only one station) and publish the same rows as the first.
+
+    python bench/bench_stations.py --stations 1,4,16 --parse-workers 0,4
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import sqlite3
+import sys
+import tempfile
+import time
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+import requests
+from requests.adapters import BaseAdapter
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "apps" / "scraper"))
+
+import suumo_scraper as scraper  # noqa: E402
+
+FIXTURES_DIR = BENCH_DIR / "fixtures"
+FIXTURE_STATION = "ek_06660"
+
+
+class FixtureAdapter(BaseAdapter):
+    """Serve fixture pages for any station; unknown pages repeat the category's first page."""
+
+    def __init__(self, latency: float) -> None:
+        super().__init__()
+        self.latency = latency
+        self.pages: dict[tuple[str, str], str] = {}
+        for item in json.loads((FIXTURES_DIR / "index.json").read_text(encoding="utf-8")):
+            url = urlparse(item["url"])
+            page = parse_qs(url.query).get("page", ["1"])[0]
+            html = (FIXTURES_DIR / item["file"]).read_text(encoding="utf-8")
+            self.pages[(url.path.split("/")[1], page)] = html
+
+    def page_for(self, url: str) -> str:
+        parts = urlparse(url)
+        path = parts.path.split("/")
+        page = parse_qs(parts.query).get("page", ["1"])[0]
+        html = self.pages.get((path[1], page)) or self.pages[(path[1], "1")]
+        # Pagination links must point at the requested station to be followed.
+        return html.replace(FIXTURE_STATION, path[3])
+
+    def send(self, request, **kwargs) -> requests.Response:
+        time.sleep(self.latency)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = request.url
+        resp.request = request
+        resp.encoding = "utf-8"
+        resp._content = self.page_for(request.url).encode("utf-8")
+        return resp
+
+    def close(self) -> None:
+        pass
+
+
+def station_config(base: dict, count: int) -> scraper.CrawlConfig:
+    data = dict(base)
+    data["stations"] = [{"code": f"ek_{90000 + i}", "name": f"station{i}"} for i in range(count)]
+    return scraper.crawl_config_from_dict(data)
+
+
+def check_overlapping_stations(base: dict, latency: float) -> None:
+    """Crawl two fully overlapping stations in full, then incrementally; exit on a mismatch."""
+    fetched: list[str] = []
+
+    class CountingAdapter(FixtureAdapter):
+        def send(self, request, **kwargs) -> requests.Response:
+            fetched.append(request.url)
+            return super().send(request, **kwargs)
+
+    class FixtureFetcher(scraper.Fetcher):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.session.mount("https://", CountingAdapter(latency))
+
+    data = dict(base)
+    data["stations"] = [{"code": "ek_90000", "name": "station0"}, {"code": "ek_90001", "name": "station1"}]
+    jobs = scraper.crawl_config_from_dict(data).jobs
+    first, second = dt.date(2026, 7, 1), dt.date(2026, 7, 2)
+    fetcher_class = scraper.Fetcher
+    scraper.Fetcher = FixtureFetcher
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            config_path = Path(tmp) / "crawl.json"
+            config_path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+            output_dir = Path(tmp) / "processed"
+            rows = {}
+            for run_date in (first, second):
+                fetched.clear()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    scraper.run(
+                        output_dir, run_date, min_interval=0.0, incremental=True, config_path=config_path,
+                        parse_workers=0, detail_pages=0,
+                    )
+                latest = pd.read_csv(output_dir / "listings_latest.csv", dtype=str)
+                # Carried-forward rows are published after the crawled ones.
+                latest = latest.drop(columns=["run_date", "fetched_at"]).sort_values(["sub_category", "listing_id"])
+                rows[run_date] = latest.reset_index(drop=True)
+            con = sqlite3.connect(output_dir / "suumo.db")
+            try:
+                (partial,) = con.execute("SELECT partial_refresh FROM runs WHERE run_date = ?", (second.isoformat(),)).fetchone()
+            finally:
+                con.close()
+    finally:
+        scraper.Fetcher = fetcher_class
+    stopped = set((partial or "").split(","))
+    failures = [f"{cfg.key} was not stopped early" for cfg in jobs if cfg.key not in stopped]
+    if len(fetched) != len(jobs):
+        failures.append(f"incremental run fetched {len(fetched)} pages for {len(jobs)} jobs")
+    if not rows[second].equals(rows[first]):
+        failures.append("incremental run published different rows")
+    for failure in failures:
+        print(f"[BAD] {failure}")
+    if failures:
+        sys.exit("[FAIL] overlapping stations")
+    print(f"[OK ] overlapping stations: incremental run fetched {len(fetched)} pages for {len(jobs)} jobs")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Crawl throughput versus number of stations")
+    parser.add_argument("--stations", default="1,2,4,8", help="Comma-separated station counts")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per request")
+    parser.add_argument("--concurrency", type=int, default=scraper.DEFAULT_CONCURRENCY)
+    parser.add_argument("--min-interval", type=float, default=0.1, help="Min seconds between request starts")
+    parser.add_argument("--parse-workers", default="0,4", help="Comma-separated parse worker counts")
+    args = parser.parse_args()
+
+    base = json.loads(scraper.DEFAULT_CONFIG_PATH.read_text(encoding="utf-8-sig"))
+    check_overlapping_stations(base, args.latency)
+    ceiling = 1 / args.min_interval if args.min_interval > 0 else float("inf")
+    print(
+        f"latency={args.latency}s concurrency={args.concurrency} min_interval={args.min_interval}s "
+        f"(rate limit {ceiling:.1f} pages/s)"
+    )
+    print(
+        f"{'stations':>8}{'jobs':>6}{'workers':>8}{'pages':>7}{'rows':>7}{'elapsed (s)':>13}"
+        f"{'pages/s':>9}{'s/station':>11}"
+    )
+    for count in [int(n) for n in args.stations.split(",")]:
+        config = station_config(base, count)
+        expected = None
+        for workers in [int(n) for n in args.parse_workers.split(",")]:
+            fetcher = scraper.Fetcher(concurrency=args.concurrency, min_interval=args.min_interval)
+            fetcher.session.mount("https://", FixtureAdapter(args.latency))
+            # Worker start-up is part of the cost a crawl pays, so it is timed.
+            t0 = time.perf_counter()
+            parse_pool = scraper.ParsePool(workers)
+            try:
+                with tempfile.TemporaryDirectory() as tmp:
+                    with scraper.staging_sink(Path(tmp), config.noise) as sink:
+                        with contextlib.redirect_stdout(io.StringIO()):
+                            stats = scraper.crawl_all(fetcher, config.jobs, parse_pool, sink)
+                        sink.publish()
+                        rows = pd.concat(list(sink.published_chunks({})), ignore_index=True)
+            finally:
+                fetcher.close()
+                parse_pool.close()
+            elapsed = time.perf_counter() - t0
+            if expected is None:
+                expected = rows
+            elif not rows.equals(expected):
+                sys.exit(f"[FAIL] parse_workers={workers} returned different rows for {count} stations")
+            pages = sum(s.pages_fetched for s in stats)
+            print(
+                f"{count:>8}{len(config.jobs):>6}{workers:>8}{pages:>7}{len(rows):>7}{elapsed:>13.2f}"
+                f"{pages / elapsed:>9.2f}{elapsed / count:>11.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
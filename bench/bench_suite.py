@@ -0,0 +1,424 @@
+﻿"""Offline benchmark suite with a stored baseline.
+
+Times the scraper and dashboard hot paths without touching suumo.jp:
+
+- ``crawl_stub_server``: ``crawl_all`` over every configured job, fetching
+  ``bench/fixtures`` pages over HTTP from a local stub server
+- ``make_soup``, ``parse_rent_page``, ``parse_baibai_page``: the fixture pages
+- ``extract_*`` (scalar and ``_batch``): the text columns of the history
+- ``dedupe``: staging and publishing rows the way ``run()`` does
+- ``save_sqlite``: writing consecutive runs into a fresh ``suumo.db``
+- ``history_pivot``: the dashboard's per-address tsubo price pivot
+
+Histories are the latest ``--runs`` snapshots of ``data/history`` with every
+listing copied ``--scale`` times (suffixed IDs, shifted prices), so the
+same command measures the same work on every machine. Each case reports
+the median of ``--repeat`` timings, the number of items it processed and
+an output count; results go to ``--output`` as JSON and are compared with
+``bench/baseline.json``. A case slower than ``--tolerance`` times its
+baseline, or whose output count changed, is flagged.
+
+    python bench/bench_suite.py                   # run and compare
+    python bench/bench_suite.py --check           # exit 1 when a case is flagged
+    python bench/bench_suite.py --update-baseline # store this run as the baseline
+    python bench/bench_suite.py --cases save_sqlite --update-baseline  # re-record one case
+
+Re-record a case whenever a change alters the work it measures (fixtures,
+what a write maintains, ...), so its baseline keeps timing the same work.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime as dt
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable
+from urllib.parse import urlsplit, urlunsplit
+
+import pandas as pd
+from requests.adapters import HTTPAdapter
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import listing_extract as lx  # noqa: E402
+import listing_store  # noqa: E402
+import suumo_scraper as scraper  # noqa: E402
+from bench_parse import load_fixtures  # noqa: E402
+from bench_stations import FixtureAdapter  # noqa: E402
+from check_extract import area_text  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+BASELINE_PATH = BENCH_DIR / "baseline.json"
+RESULTS_PATH = BENCH_DIR / "results.json"
+TARGET_SUB_CATEGORIES = ("土地", "戸建て(中古)", "戸建て(新築)")
+EXTRACT_CASES = [
+    # (scalar, batch, input column)
+    (lx.extract_price_yen, lx.extract_price_yen_batch, "price_text"),
+    (lx.extract_area_sqm, lx.extract_area_sqm_batch, "area_text"),
+    (lx.extract_area_tsubo, lx.extract_area_tsubo_batch, "area_text"),
+    (lx.extract_layout_text, lx.extract_layout_text_batch, "area_text"),
+]
+PRICE_COLUMNS = ["price_yen", "unit_price_per_sqm", "unit_price_per_tsubo"]
+
+
+@dataclass
+class Bench:
+    """One case: ``run`` is timed and returns an output count; ``setup`` runs untimed before each timing."""
+
+    run: Callable[[], int]
+    items: int
+    unit: str
+    setup: Callable[[], None] | None = None
+
+
+class StubServer:
+    """Local HTTP server answering every path with the matching fixture page."""
+
+    def __init__(self) -> None:
+        fixtures = FixtureAdapter(latency=0.0)
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self) -> None:
+                body = fixtures.page_for(f"{scraper.BASE}{self.path}").encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.origin = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class LoopbackAdapter(HTTPAdapter):
+    """Send suumo.jp requests to the stub server instead."""
+
+    def __init__(self, origin: str, **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.origin = urlsplit(origin)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = urlunsplit((self.origin.scheme, self.origin.netloc, parts.path, parts.query, ""))
+        return super().send(request, **kwargs)
+
+
+def scaled_history(runs: int, scale: int) -> list[tuple[str, pd.DataFrame]]:
+    """The latest ``runs`` snapshots, each listing repeated ``scale`` times as distinct listings."""
+    snapshots = []
+    for path in sorted(HISTORY_DIR.glob("listings_*.csv"))[-runs:]:
+        df = listing_store.read_history_csv(path)
+        if df.empty:
+            continue
+        copies = []
+        for k in range(scale):
+            copy = df.copy()
+            if k:
+                copy["listing_id"] = copy["listing_id"].astype(str) + f"-{k}"
+                copy["detail_url"] = copy["detail_url"].astype(str) + f"#{k}"
+                for c in PRICE_COLUMNS:
+                    copy[c] = pd.to_numeric(copy[c], errors="coerce") * (1 + k / 100)
+            copies.append(copy)
+        snapshots.append((str(df["run_date"].iloc[0]), pd.concat(copies, ignore_index=True)))
+    return snapshots
+
+
+def median_seconds(bench: Bench, repeat: int) -> tuple[float, int]:
+    samples = []
+    output = 0
+    for _ in range(repeat):
+        if bench.setup is not None:
+            bench.setup()
+        t0 = time.perf_counter()
+        output = bench.run()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples), output
+
+
+class Suite:
+    """Builds every case's inputs once; cases share the scaled history and a scratch directory."""
+
+    def __init__(self, tmp: Path, runs: int, scale: int) -> None:
+        self.tmp = tmp
+        self.fixtures = load_fixtures()
+        self.config = scraper.load_crawl_config()
+        self.jobs = {cfg.category: cfg for cfg in self.config.jobs}
+        self.history = scaled_history(runs, scale)
+        texts = pd.concat([df for _, df in self.history], ignore_index=True)
+        self.texts = {
+            "price_text": texts["price_text"].fillna("").astype(str).tolist(),
+            "area_text": texts["detail_text"].map(area_text).tolist(),
+        }
+        self._history_db: Path | None = None
+        self._servers: list[StubServer] = []
+
+    def close(self) -> None:
+        for server in self._servers:
+            server.close()
+
+    def cases(self) -> dict[str, Callable[[], Bench]]:
+        cases: dict[str, Callable[[], Bench]] = {
+            "crawl_stub_server": self.crawl,
+            "make_soup": self.make_soup,
+            "parse_rent_page": lambda: self.parse_pages("rent"),
+            "parse_baibai_page": lambda: self.parse_pages("sale"),
+        }
+        for scalar, batch, column in EXTRACT_CASES:
+            cases[scalar.__name__] = lambda f=scalar, c=column: self.extract_scalar(f, c)
+            cases[batch.__name__] = lambda f=batch, c=column: self.extract_batch(f, c)
+        cases["dedupe"] = self.dedupe
+        cases["save_sqlite"] = self.save_sqlite
+        cases["history_pivot"] = self.history_pivot
+        return cases
+
+    def crawl(self) -> Bench:
+        server = StubServer()
+        self._servers.append(server)
+        jobs = self.config.jobs
+
+        def crawl() -> tuple[int, int]:
+            fetcher = scraper.Fetcher(concurrency=scraper.DEFAULT_CONCURRENCY, min_interval=0.0)
+            fetcher.session.mount("https://", LoopbackAdapter(server.origin))
+            parse_pool = scraper.ParsePool(0)
+            try:
+                with scraper.staging_sink(self.tmp, self.config.noise) as sink:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        stats = scraper.crawl_all(fetcher, jobs, parse_pool, sink)
+                    return sum(s.pages_fetched for s in stats), sink.publish()
+            finally:
+                fetcher.close()
+                parse_pool.close()
+
+        # An untimed warm-up crawl also counts the pages every crawl fetches.
+        pages, _ = crawl()
+        return Bench(run=lambda: crawl()[1], items=pages, unit="pages")
+
+    def make_soup(self) -> Bench:
+        def run() -> int:
+            return sum(len(scraper.make_soup(item["html"]).select("a")) for item in self.fixtures)
+
+        return Bench(run=run, items=len(self.fixtures), unit="pages")
+
+    def parse_pages(self, parser: str) -> Bench:
+        pages = []
+        for item in self.fixtures:
+            cfg = self.jobs[item["category"]]
+            if cfg.parser.func is scraper.PARSERS[parser]:
+                pages.append((cfg, scraper.make_soup(item["html"], card_selector=cfg.card_selector)))
+
+        def run() -> int:
+            return sum(len(cfg.parser(soup)) for cfg, soup in pages)
+
+        return Bench(run=run, items=len(pages), unit="pages")
+
+    def extract_scalar(self, fn: Callable[[str], object], column: str) -> Bench:
+        texts = self.texts[column]
+
+        def run() -> int:
+            return sum(fn(t) is not None for t in texts)
+
+        return Bench(run=run, items=len(texts), unit="strings")
+
+    def extract_batch(self, fn: Callable[[pd.Series], pd.Series], column: str) -> Bench:
+        texts = pd.Series(self.texts[column], dtype="object")
+
+        def run() -> int:
+            return int(fn(texts).notna().sum())
+
+        return Bench(run=run, items=len(texts), unit="strings")
+
+    def dedupe(self) -> Bench:
+        # Consecutive runs mostly list the same properties, so their union is full of duplicates.
+        frame = pd.concat([df for _, df in self.history[-5:]], ignore_index=True)
+        frame = frame.drop(columns=["run_date", "fetched_at", *lx.DETAIL_COLUMNS])
+        rows = frame.astype(object).where(frame.notna(), None).to_dict("records")
+        random.Random(0).shuffle(rows)
+        pages = [rows[i : i + 30] for i in range(0, len(rows), 30)]
+
+        def run() -> int:
+            with scraper.staging_sink(self.tmp, self.config.noise) as sink:
+                for i, page in enumerate(pages):
+                    sink.add(0, f"page-{i:05d}", page)
+                return sink.publish()
+
+        return Bench(run=run, items=len(rows), unit="rows")
+
+    def save_sqlite(self) -> Bench:
+        path = self.tmp / "save_sqlite.db"
+
+        def setup() -> None:
+            path.unlink(missing_ok=True)
+
+        def run() -> int:
+            for run_date, df in self.history:
+                listing_store.save_sqlite(df, path, run_date)
+            con = sqlite3.connect(path)
+            try:
+                return con.execute("SELECT SUM(total_records) FROM runs").fetchone()[0]
+            finally:
+                con.close()
+
+        return Bench(run=run, items=len(self.history), unit="runs", setup=setup)
+
+    def history_db(self) -> Path:
+        if self._history_db is None:
+            self._history_db = self.tmp / "history.db"
+            for run_date, df in self.history:
+                listing_store.save_sqlite(df, self._history_db, run_date)
+        return self._history_db
+
+    def history_pivot(self) -> Bench:
+        path = self.history_db()
+
+        def run() -> int:
+            con = sqlite3.connect(path)
+            try:
+                dates = pd.DatetimeIndex(sorted(pd.to_datetime([r[0] for r in con.execute("SELECT run_date FROM runs")])))
+                agg = listing_store.tsubo_price_by_address(con, TARGET_SUB_CATEGORIES)
+            finally:
+                con.close()
+            agg["run_date"] = pd.to_datetime(agg["run_date"])
+            agg["address_label"] = agg["address"].map(lx.normalize_text)
+            cells = 0
+            for sub_category in TARGET_SUB_CATEGORIES:
+                pivot = listing_store.mean_pivot(agg[agg["sub_category"] == sub_category], "address_label", dates)
+                cells += int(pivot.notna().sum().sum())
+            return cells
+
+        return Bench(run=run, items=len(self.history), unit="runs")
+
+
+def environment() -> dict[str, object]:
+    return {
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def comparable(results: dict, baseline: dict) -> bool:
+    return all(results[k] == baseline.get(k) for k in ("runs", "scale"))
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print each case against the baseline; returns the names of flagged cases."""
+    flagged = []
+    same_setup = comparable(results, baseline)
+    if baseline and not same_setup:
+        print(f"[WARN] baseline was recorded with runs={baseline.get('runs')} scale={baseline.get('scale')}; "
+              "timings are not comparable")
+    print(f"{'case':<28}{'items':>8}{'ms':>12}{'baseline ms':>13}{'ratio':>8}  status")
+    for name, case in results["cases"].items():
+        base = baseline.get("cases", {}).get(name)
+        ms = case["seconds"] * 1000
+        if base is None:
+            print(f"{name:<28}{case['items']:>8}{ms:>12.1f}{'-':>13}{'-':>8}  new")
+            continue
+        ratio = case["seconds"] / base["seconds"] if base["seconds"] else float("inf")
+        status = "ok"
+        if same_setup and case["output"] != base["output"]:
+            status = f"output changed ({base['output']} -> {case['output']})"
+        elif same_setup and ratio > tolerance:
+            status = "slower"
+        elif same_setup and ratio < 1 / tolerance:
+            status = "faster"
+        if status not in ("ok", "faster"):
+            flagged.append(name)
+        print(f"{name:<28}{case['items']:>8}{ms:>12.1f}{base['seconds'] * 1000:>13.1f}{ratio:>8.2f}  {status}")
+    return flagged
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Offline benchmark suite compared with a stored baseline")
+    parser.add_argument("--runs", type=int, default=20, help="Latest history snapshots to use")
+    parser.add_argument("--scale", type=int, default=4, help="Copies of every listing in the synthetic history")
+    parser.add_argument("--repeat", type=int, default=3, help="Timings per case (median is reported)")
+    parser.add_argument("--cases", default=None, help="Comma-separated case names (default: all)")
+    parser.add_argument("--output", default=str(RESULTS_PATH), help="Where to write this run's results")
+    parser.add_argument("--baseline", default=str(BASELINE_PATH), help="Baseline results to compare with")
+    parser.add_argument("--tolerance", type=float, default=1.5, help="Flag cases slower than this times the baseline")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 when a case is flagged")
+    parser.add_argument("--update-baseline", action="store_true", help="Write the results to --baseline as well")
+    args = parser.parse_args()
+
+    results: dict = {
+        "recorded_at": dt.datetime.now(tz=scraper.JST).isoformat(timespec="seconds"),
+        "runs": args.runs,
+        "scale": args.scale,
+        "repeat": args.repeat,
+        "environment": environment(),
+        "cases": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        suite = Suite(Path(tmp), args.runs, args.scale)
+        cases = suite.cases()
+        names = args.cases.split(",") if args.cases else list(cases)
+        unknown = [n for n in names if n not in cases]
+        if unknown:
+            sys.exit(f"unknown cases: {', '.join(unknown)} (available: {', '.join(cases)})")
+        try:
+            for name in names:
+                bench = cases[name]()
+                seconds, output = median_seconds(bench, args.repeat)
+                results["cases"][name] = {
+                    "seconds": round(seconds, 6),
+                    "items": bench.items,
+                    "unit": bench.unit,
+                    "us_per_item": round(seconds / bench.items * 1e6, 3) if bench.items else None,
+                    "output": int(output),
+                }
+        finally:
+            suite.close()
+
+    Path(args.output).write_text(json.dumps(results, ensure_ascii=False, indent=1), encoding="utf-8")
+    print(f"results written to {args.output}")
+    baseline_path = Path(args.baseline)
+    baseline = {}
+    if baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    elif not args.update_baseline:
+        print(f"[WARN] no baseline at {baseline_path}; run with --update-baseline to record one")
+    flagged = compare(results, baseline, args.tolerance)
+    if args.update_baseline:
+        updated = results
+        if args.cases and comparable(results, baseline):
+            # Only the named cases were measured; keep the others' baselines.
+            updated = {**results, "cases": {**baseline["cases"], **results["cases"]}}
+        baseline_path.write_text(json.dumps(updated, ensure_ascii=False, indent=1), encoding="utf-8")
+        print(f"baseline updated: {baseline_path}")
+    if flagged and args.check:
+        sys.exit(f"[FAIL] flagged: {', '.join(flagged)}")
+
+
+if __name__ == "__main__":
+    main()
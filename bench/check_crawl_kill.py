@@ -0,0 +1,140 @@
+﻿"""Check that a crawl killed with SIGKILL leaves a checkpoint ``--resume`` can continue.
+
+Runs ``run()`` in a child process against ``bench/fixtures`` (served after a
+simulated latency, no suumo.jp), kills it with ``kill -9`` once it has
+fetched ``--kill-after`` pages, and then:
+
+- ``staging.db`` must hold the pages parsed before the kill
+- a ``resume=True`` run must not fetch those pages again
+- its outputs must equal those of an uninterrupted run (``fetched_at`` aside)
+
+    python bench/check_crawl_kill.py
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import os
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "apps" / "scraper"))
+
+import suumo_scraper as scraper  # noqa: E402
+from bench_stations import FixtureAdapter  # noqa: E402
+
+RUN_DATE = dt.date(2026, 7, 1)
+FETCH_MARK = "fetched "
+
+
+def child(output_dir: Path, latency: float, resume: bool) -> None:
+    """Crawl into ``output_dir``, reporting every fetch on stderr."""
+
+    class ReportingAdapter(FixtureAdapter):
+        def send(self, request, **kwargs):
+            resp = super().send(request, **kwargs)
+            # One write per line: fetch threads must not interleave their reports.
+            sys.stderr.write(f"{FETCH_MARK}{request.url}\n")
+            sys.stderr.flush()
+            return resp
+
+    class FixtureFetcher(scraper.Fetcher):
+        def __init__(self, *args, **kwargs) -> None:
+            super().__init__(*args, **kwargs)
+            self.session.mount("https://", ReportingAdapter(latency=latency))
+
+    scraper.Fetcher = FixtureFetcher
+    scraper.run(output_dir, RUN_DATE, min_interval=0.0, parse_workers=0, resume=resume, detail_pages=0)
+
+
+def spawn(output_dir: Path, latency: float, resume: bool = False) -> subprocess.Popen:
+    args = [sys.executable, __file__, "--child", str(output_dir), "--latency", str(latency)]
+    if resume:
+        args.append("--resume")
+    return subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+
+def fetches(proc: subprocess.Popen, kill_after: int | None = None) -> int:
+    """Count the child's fetches until it exits, or SIGKILL it after ``kill_after`` of them."""
+    count = 0
+    for line in proc.stderr:
+        if line.startswith(FETCH_MARK):
+            count += 1
+            if count == kill_after:
+                os.kill(proc.pid, signal.SIGKILL)
+                break
+        else:
+            sys.stderr.write(line)
+    proc.wait()
+    return count
+
+
+def outputs(output_dir: Path) -> pd.DataFrame:
+    return pd.read_csv(output_dir / "listings_latest.csv", dtype=str).drop(columns=["fetched_at"])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Kill a crawl with SIGKILL and resume it")
+    parser.add_argument("--kill-after", type=int, default=6, help="Fetches before the kill")
+    parser.add_argument("--latency", type=float, default=0.1, help="Simulated seconds per request")
+    parser.add_argument("--child", type=Path, help=argparse.SUPPRESS)
+    parser.add_argument("--resume", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child, args.latency, args.resume)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reference_dir = Path(tmp) / "reference" / "processed"
+        proc = spawn(reference_dir, args.latency)
+        total = fetches(proc)
+        if proc.returncode != 0:
+            sys.exit(f"uninterrupted run failed with exit code {proc.returncode}")
+
+        output_dir = Path(tmp) / "killed" / "processed"
+        started = time.perf_counter()
+        proc = spawn(output_dir, args.latency)
+        fetched = fetches(proc, args.kill_after)
+        if proc.returncode != -signal.SIGKILL:
+            sys.exit(f"crawl ended (exit code {proc.returncode}) before {args.kill_after} fetches; lower --kill-after")
+        con = sqlite3.connect(output_dir / scraper.STAGING_NAME)
+        try:
+            pages, rows = con.execute(
+                "SELECT (SELECT COUNT(*) FROM staged_pages), (SELECT COUNT(*) FROM staged_rows)"
+            ).fetchone()
+        finally:
+            con.close()
+        print(f"killed after {fetched} of {total} fetches ({time.perf_counter() - started:.1f}s): "
+              f"staged_pages={pages} staged_rows={rows}")
+
+        proc = spawn(output_dir, args.latency, resume=True)
+        refetched = fetches(proc)
+        print(f"resume fetched {refetched} of {total} pages")
+
+        failures = []
+        if proc.returncode != 0:
+            failures.append(f"resumed run failed with exit code {proc.returncode}")
+        if pages == 0:
+            failures.append("no page was checkpointed before the kill")
+        if refetched > total - pages:
+            failures.append(f"resume fetched {refetched} pages; at most {total - pages} were not checkpointed")
+        if proc.returncode == 0 and not outputs(output_dir).equals(outputs(reference_dir)):
+            failures.append("resumed outputs differ from the uninterrupted run")
+    for failure in failures:
+        print(f"[BAD] {failure}")
+    if failures:
+        sys.exit(1)
+    print("[OK ] killed crawl resumed from its checkpoint")
+
+
+if __name__ == "__main__":
+    main()
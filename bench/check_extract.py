@@ -0,0 +1,110 @@
+﻿"""Check the batch extractors against the scalar ones on the full history.
+
+Every ``*_batch`` function in ``listing_extract`` must match its scalar
+counterpart element-wise (NaN for ``None``) on the text columns of all
+``data/history`` snapshots plus the runs only in the Parquet store
+(``data/history_parquet``, the default history output). Timings of both
+paths are printed.
+
+    python bench/check_extract.py
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+BENCH_DIR = Path(__file__).resolve().parent
+BASE_DIR = BENCH_DIR.parent
+sys.path.insert(0, str(BASE_DIR / "apps" / "scraper"))
+
+import history_store  # noqa: E402
+import listing_extract as lx  # noqa: E402
+
+HISTORY_DIR = BASE_DIR / "data" / "history"
+PARQUET_DIR = BASE_DIR / "data" / "history_parquet"
+TEXT_COLUMNS = ["run_date", "address", "price_text", "detail_text"]
+
+CASES = [
+    # (scalar, batch, input column)
+    (lx.normalize_text, lx.normalize_batch, "address"),
+    (lx.extract_price_yen, lx.extract_price_yen_batch, "price_text"),
+    (lx.extract_area_sqm, lx.extract_area_sqm_batch, "area_text"),
+    (lx.extract_area_tsubo, lx.extract_area_tsubo_batch, "area_text"),
+    (lx.extract_layout_text, lx.extract_layout_text_batch, "area_text"),
+    (lx.extract_area_sqm, lx.extract_area_sqm_batch, "detail_text"),
+    (lx.extract_price_yen, lx.extract_price_yen_batch, "detail_text"),
+]
+
+
+def area_text(detail_text: str) -> str:
+    """The raw text the parsers read area/layout from."""
+    if not isinstance(detail_text, str):
+        return ""
+    if detail_text.startswith("{"):
+        d = json.loads(detail_text)
+        return " ".join(d.get(k, "") for k in ("土地面積", "建物面積", "専有面積"))
+    return detail_text.split(" | ")[-1]
+
+
+def load_history() -> pd.DataFrame:
+    frames = [
+        pd.read_csv(p, encoding="utf-8-sig", dtype=str, usecols=lambda c: c in TEXT_COLUMNS)
+        for p in sorted(HISTORY_DIR.glob("listings_*.csv"))
+    ]
+    if PARQUET_DIR.exists():
+        parquet = history_store.read_history(PARQUET_DIR, columns=TEXT_COLUMNS)
+        csv_dates = set().union(*(f["run_date"].unique() for f in frames)) if frames else set()
+        frames.append(parquet[~parquet["run_date"].isin(csv_dates)])
+    df = pd.concat(frames, ignore_index=True)
+    df["area_text"] = df["detail_text"].map(area_text)
+    return df
+
+
+def same(a: pd.Series, b: pd.Series) -> pd.Series:
+    if a.dtype == object and b.dtype == object and a.map(lambda x: isinstance(x, str)).all():
+        return a == b
+    a = pd.to_numeric(a, errors="coerce")
+    b = pd.to_numeric(b, errors="coerce")
+    return (a == b) | (a.isna() & b.isna())
+
+
+def main() -> None:
+    df = load_history()
+    print(f"rows={len(df)} runs={df['run_date'].nunique()}")
+    failures = 0
+    for scalar, batch, col in CASES:
+        values = df[col].fillna("")
+        lx._normalize.cache_clear()
+        t0 = time.perf_counter()
+        expected = pd.Series([scalar(v) for v in values], index=values.index, dtype=object)
+        t_scalar = time.perf_counter() - t0
+        lx._normalize.cache_clear()
+        t0 = time.perf_counter()
+        got = batch(values)
+        t_batch = time.perf_counter() - t0
+        if expected.map(lambda x: isinstance(x, float) or x is None).all():
+            expected = expected.astype(float)
+        ok = same(expected, got)
+        bad = int((~ok).sum())
+        failures += bad
+        status = "OK " if bad == 0 else "BAD"
+        print(
+            f"[{status}] {batch.__name__:<28} on {col:<12} scalar={t_scalar * 1000:8.1f} ms "
+            f"batch={t_batch * 1000:8.1f} ms mismatches={bad}"
+        )
+        if bad:
+            idx = np.flatnonzero(~ok.to_numpy())[:5]
+            for i in idx:
+                print(f"    {values.iloc[i]!r}: scalar={expected.iloc[i]!r} batch={got.iloc[i]!r}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()